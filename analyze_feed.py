@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Size a feed before onboarding it: what it contains and what syncing it would cost.
+
+The raw ICS text is scanned once with a regular expression (no icalendar parsing), and the
+DTSTART, DTEND, RRULE (FREQ, INTERVAL, UNTIL, COUNT), RECURRENCE-ID and STATUS of every
+VEVENT land in NumPy arrays. Histograms, window counts and the API-cost model are then
+vectorized, so a feed with a million events is analysed in seconds.
+
+    python analyze_feed.py feed.ics
+    python analyze_feed.py "https://example.com/team.ics" --window 7 30 365 --runs-per-day 96
+
+Times with a TZID are read as UTC wall time, which is close enough for day-sized buckets.
+Series ends for COUNT rules are estimated from FREQ and INTERVAL (BYxxx parts are ignored).
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from sync import BATCH_LIMIT, fetch_ics
+
+# Only the lines the analysis needs; BEGIN/END of any component track nesting (VALARMs, VTIMEZONEs).
+# Anchored on the newline rather than ^ with MULTILINE, which lets re skip ahead much faster.
+PROPERTY_RE = re.compile(rb"\n((?:BEGIN|END|DTSTART|DTEND|RRULE|RECURRENCE-ID|STATUS)[;:][^\r\n]*)")
+RULE_PART_RE = re.compile(rb"(FREQ|INTERVAL|UNTIL|COUNT)=([^;]*)")
+# Line prefix -> kind (1 and 2 are the VEVENT boundaries themselves)
+KINDS = {b"BEGIN": 3, b"END": 4, b"DTSTART": 5, b"DTEND": 6, b"RRULE": 7, b"RECURRENCE-ID": 8, b"STATUS": 9}
+FREQS = [b"", b"SECONDLY", b"MINUTELY", b"HOURLY", b"DAILY", b"WEEKLY", b"MONTHLY", b"YEARLY"]
+FREQ_SECONDS = np.array([0, 1, 60, 3600, 86400, 7 * 86400, 30.44 * 86400, 365.25 * 86400])
+LIST_PAGE_SIZE = 2500  # maxResults of the synced-events listing
+DAY = 86400
+# Edges of the age histograms, in days relative to now
+AGE_EDGES = [-np.inf, -5 * 365, -365, -90, -30, 0, 30, 90, 365, np.inf]
+AGE_LABELS = ["over 5y ago", "1-5y ago", "90d-1y ago", "30-90d ago", "last 30d",
+              "next 30d", "30-90d ahead", "90d-1y ahead", "over 1y ahead"]
+
+def read_source(source):
+    data = fetch_ics(source)
+    # The scan needs bytes methods (replace, concatenation), not a mapping of a local file
+    return data if isinstance(data, bytes) else bytes(data)
+
+def unfold(data):
+    """Join folded lines; plain bytes.replace is several times faster than a regex on big feeds."""
+    for fold in (b"\r\n ", b"\r\n\t", b"\n ", b"\n\t"):
+        if fold in data:
+            data = data.replace(fold, b"")
+    return data
+
+def parse_stamps(values):
+    """
+    Seconds since the epoch (float, NaN if unparseable) and whether a time of day was given,
+    for raw property values such as ":20250101", ";TZID=Europe/Berlin:20250101T100000" or "20250101T100000Z".
+    """
+    n = len(values)
+    if not n:
+        return np.empty(0), np.empty(0, bool)
+    text = b"".join(v.rpartition(b":")[2][:15].ljust(15, b"0") for v in values)
+    chars = np.frombuffer(text, dtype=np.uint8).reshape(n, 15)
+    digits = chars.astype(np.int64) - ord("0")
+    timed = chars[:, 8] == ord("T")
+    numeric = np.delete(digits, 8, axis=1)
+    valid = ((numeric >= 0) & (numeric <= 9)).all(axis=1)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+    months = ((np.where(valid, year, 1970) - 1970) * 12 + month - 1).astype("datetime64[M]")
+    days = (months.astype("datetime64[D]") + (day - 1)).astype(np.int64)
+    clock = np.where(timed, (digits[:, 9] * 10 + digits[:, 10]) * 3600
+                     + (digits[:, 11] * 10 + digits[:, 12]) * 60 + digits[:, 13] * 10 + digits[:, 14], 0)
+    return np.where(valid, days * DAY + clock, np.nan).astype(np.float64), timed
+
+def scan_feed(data):
+    """
+    One entry per VEVENT: start, end, until and count_end (epoch seconds, NaN if absent),
+    all_day, recurring, override and cancelled flags, freq (index into FREQS), interval and count.
+    """
+    raw = PROPERTY_RE.findall(b"\n" + unfold(data))
+    heads = np.array(raw, dtype="S13")  # truncated copies, enough to tell the kinds apart
+    kinds = np.zeros(len(raw), np.int8)
+    for prefix, kind in KINDS.items():
+        kinds[np.char.startswith(heads, prefix)] = kind
+    kinds[heads == b"BEGIN:VEVENT"] = 1
+    kinds[heads == b"END:VEVENT"] = 2
+    opens = (kinds == 1) | (kinds == 3)
+    depth = np.cumsum(opens.astype(np.int32) - ((kinds == 2) | (kinds == 4)))
+    event = np.cumsum(kinds == 1) - 1
+    inside = np.cumsum(kinds == 1) - np.cumsum(kinds == 2) == 1
+    begins = np.flatnonzero(kinds == 1)
+    n = len(begins)
+    # A property belongs to the event if it sits directly in the VEVENT, not in a VALARM below it
+    # (lines before the first VEVENT index the -1 sentinel)
+    own = inside & (depth == np.append(depth[begins], -1)[event])
+
+    def lines(kind):
+        index = np.flatnonzero(own & (kinds == kind))
+        return event[index], [raw[i] for i in index.tolist()]
+
+    events = {"start": np.full(n, np.nan), "end": np.full(n, np.nan), "until": np.full(n, np.nan),
+              "count_end": np.full(n, np.nan), "all_day": np.zeros(n, bool), "recurring": np.zeros(n, bool),
+              "override": np.zeros(n, bool), "cancelled": np.zeros(n, bool),
+              "freq": np.zeros(n, np.int8), "interval": np.ones(n, np.int32), "count": np.zeros(n, np.int32)}
+    owner, values = lines(5)
+    events["start"][owner], timed = parse_stamps(values)
+    events["all_day"][owner] = ~timed & ~np.isnan(events["start"][owner])
+    owner, values = lines(6)
+    events["end"][owner] = parse_stamps(values)[0]
+    owner, _ = lines(8)
+    events["override"][owner] = True
+    owner, values = lines(9)
+    events["cancelled"][owner] = [v.rpartition(b":")[2].strip().upper() == b"CANCELLED" for v in values]
+
+    owner, values = lines(7)
+    events["recurring"][owner] = True
+    parts = [dict(RULE_PART_RE.findall(v.rpartition(b":")[2].upper())) for v in values]
+    freq_index = {f: i for i, f in enumerate(FREQS)}
+    events["freq"][owner] = [freq_index.get(p.get(b"FREQ", b""), 0) for p in parts]
+    events["interval"][owner] = [int(p[b"INTERVAL"]) if p.get(b"INTERVAL", b"").isdigit() else 1 for p in parts]
+    events["count"][owner] = [int(p[b"COUNT"]) if p.get(b"COUNT", b"").isdigit() else 0 for p in parts]
+    with_until = [i for i, p in enumerate(parts) if b"UNTIL" in p]
+    events["until"][owner[with_until]] = parse_stamps([parts[i][b"UNTIL"] for i in with_until])[0]
+
+    counted = events["count"] > 0
+    events["count_end"][counted] = events["start"][counted] + (
+        (events["count"][counted] - 1) * events["interval"][counted] * FREQ_SECONDS[events["freq"][counted]])
+    events["end"] = np.where(np.isnan(events["end"]), events["start"], events["end"])
+    return events
+
+def last_occurrence(events):
+    """When each event is over: its end, the series UNTIL or estimated COUNT end, or +inf if open-ended."""
+    series_end = np.where(np.isnan(events["until"]), events["count_end"], events["until"])
+    series_end = np.where(np.isnan(series_end), np.inf, series_end)
+    return np.where(events["recurring"], series_end, events["end"])
+
+def future_mask(events, now):
+    """What --future-only keeps, mirroring future_cutoff(): open-ended and COUNT series always count
+    as future, series with UNTIL until it passes, single events until they start; unparseable ones are kept."""
+    start, until = events["start"], events["until"]
+    cutoff = np.where(events["recurring"], np.where(np.isnan(until), np.inf, until), start)
+    return np.isnan(cutoff) | (cutoff > now)
+
+def window_mask(events, now, days):
+    """Events with an occurrence between now and now + days."""
+    return (events["start"] <= now + days * DAY) & (last_occurrence(events) >= now)
+
+def age_histogram(seconds, now):
+    known = seconds[~np.isnan(seconds)]
+    counts, _ = np.histogram((known - now) / DAY, bins=AGE_EDGES)
+    return counts, len(seconds) - len(known)
+
+def print_histogram(title, counts, unknown, extra=()):
+    print(title)
+    rows = list(zip(AGE_LABELS, counts)) + list(extra) + ([("unparseable", unknown)] if unknown else [])
+    peak = max([c for _, c in rows] + [1])
+    for label, count in rows:
+        print(f"  {label:<15} {count:>10,}  {'#' * int(round(40 * count / peak))}")
+
+def estimate_costs(n_events, n_cancelled, args):
+    """
+    API calls for syncing n_events into one calendar, first run and steady state, per mode.
+    Mirrors the write loop: a lookup per event (events.list by icsUid, or events.get by id
+    with --deterministic-ids when the event is already known) plus a write when something
+    changed, and one listing of the synced events per run.
+    """
+    live = n_events - n_cancelled
+    listing = -(-max(live, 1) // LIST_PAGE_SIZE)
+    changed = live * args.change_rate
+    lookup_then_write = {
+        "first": 1 + n_events + live,
+        "steady": listing + n_events + changed,
+    }
+    deterministic = {
+        # Cancelled events were never inserted, so only live ones are fetched by id
+        "first": 1 + live,
+        "steady": listing + live + changed,
+    }
+    batches = -(-live // BATCH_LIMIT)
+    bulk = {
+        # Inserts in a batch still count one each against the quota
+        "first": 1 + live,
+        "steady": 1 + lookup_then_write["steady"],
+        "first_seconds": args.call_latency + -(-batches // args.bulk_workers) * args.batch_latency,
+    }
+    for cost in (lookup_then_write, deterministic, bulk):
+        cost.setdefault("first_seconds", cost["first"] * args.call_latency)
+        cost["steady_seconds"] = cost["steady"] * args.call_latency
+    return {"default": lookup_then_write, "--deterministic-ids": deterministic, "--bulk-import": bulk}
+
+def _duration(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f}min"
+    return f"{seconds / 3600:.1f}h"
+
+def print_costs(scopes, args):
+    print(f"Estimated API cost per calendar (change rate {args.change_rate:.0%}, {args.runs_per_day:g} runs/day, "
+          f"{args.call_latency:g}s/call, daily quota {args.daily_quota:,}):")
+    print(f"  {'scope':<16} {'mode':<20} {'events':>10} {'first run':>11} {'share':>7} {'time':>7}"
+          f" {'per run':>10} {'day share':>10} {'time':>7}")
+    for scope, (n_events, n_cancelled) in scopes.items():
+        for mode, cost in estimate_costs(n_events, n_cancelled, args).items():
+            daily = cost["steady"] * args.runs_per_day
+            print(f"  {scope:<16} {mode:<20} {n_events:>10,} {cost['first']:>11,.0f} "
+                  f"{cost['first'] / args.daily_quota:>7.1%} {_duration(cost['first_seconds']):>7}"
+                  f" {cost['steady']:>10,.0f} {daily / args.daily_quota:>10.1%} {_duration(cost['steady_seconds']):>7}")
+    print("  (first run: empty calendar; per run / day share / time: steady state with the calendar in sync)")
+
+def analyze(events, now, args):
+    n = len(events["start"])
+    recurring, cancelled = events["recurring"], events["cancelled"]
+    print(f"Events: {n:,} ({int(recurring.sum()):,} recurring, {int(events['override'].sum()):,} overrides, "
+          f"{int(cancelled.sum()):,} cancelled, {int(events['all_day'].sum()):,} all-day)")
+
+    print("Recurrence mix:")
+    until_set = ~np.isnan(events["until"])
+    count_set = events["count"] > 0
+    for i in np.unique(events["freq"][recurring]):
+        series = recurring & (events["freq"] == i)
+        print(f"  {(FREQS[i] or b'no FREQ').decode():<10} {int(series.sum()):>10,}  "
+              f"(UNTIL {int((series & until_set).sum()):,}, COUNT {int((series & count_set & ~until_set).sum()):,}, "
+              f"open-ended {int((series & ~until_set & ~count_set).sum()):,})")
+    if not recurring.any():
+        print("  no recurring events")
+
+    print_histogram("Start relative to now:", *age_histogram(events["start"], now))
+    last = last_occurrence(events)
+    open_ended = int(np.isinf(last).sum())
+    counts, unknown = age_histogram(np.where(np.isinf(last), np.nan, last), now)
+    print_histogram("Last occurrence relative to now:", counts, unknown - open_ended, [("never ends", open_ended)])
+
+    future = future_mask(events, now)
+    print(f"--future-only keeps {int(future.sum()):,} of {n:,} events ({future.mean() if n else 0:.1%})")
+    scopes = {"whole feed": (n, int(cancelled.sum())),
+              "--future-only": (int(future.sum()), int((future & cancelled).sum()))}
+    for days in args.window:
+        active = window_mask(events, now, days)
+        print(f"  with an occurrence in the next {days:g} days: {int(active.sum()):,}")
+        scopes[f"next {days:g} days"] = (int(active.sum()), int((active & cancelled).sum()))
+    print_costs(scopes, args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse an ICS feed and estimate the Calendar API cost of syncing it.")
+    parser.add_argument("source", nargs="?", default="debug.ics", help="ICS file, directory of .ics files, - for stdin, or http(s) URL")
+    parser.add_argument("--now", default=None, help="Analyse as of this ISO timestamp instead of the current time")
+    parser.add_argument("--window", type=float, nargs="+", default=[7, 30, 90, 365], metavar="DAYS",
+                        help="Count events with an occurrence in the next DAYS days, and cost a sync scoped to them")
+    parser.add_argument("--change-rate", type=float, default=0.02, help="Share of events that change between two runs")
+    parser.add_argument("--runs-per-day", type=float, default=24, help="Sync runs per day, for the daily quota share")
+    parser.add_argument("--daily-quota", type=int, default=1000000, help="Calendar API calls per day available to the project")
+    parser.add_argument("--call-latency", type=float, default=0.2, help="Seconds per sequential API call")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help=f"Seconds per batch of {BATCH_LIMIT} inserts for --bulk-import")
+    parser.add_argument("--bulk-workers", type=int, default=4, help="Concurrent batch requests for --bulk-import")
+    args = parser.parse_args()
+
+    now = datetime.fromisoformat(args.now) if args.now else datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+
+    started = time.perf_counter()
+    data = read_source(args.source)
+    loaded = time.perf_counter()
+    events = scan_feed(data)
+    scanned = time.perf_counter()
+    print(f"[analyze] {len(data) / 1e6:.1f} MB read in {loaded - started:.2f}s, "
+          f"{len(events['start']):,} events scanned in {scanned - loaded:.2f}s")
+    analyze(events, now.timestamp(), args)
+    print(f"[analyze] done in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    main()
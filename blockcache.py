@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Cache of converted events keyed by a hash of their raw VEVENT block (--block-cache).
+
+Most blocks of a large feed are byte-identical from one run to the next. Their converted
+records (payload, status, uid and queueing facts) are kept in data/blockcache-<feed>.json;
+cached blocks are cut out of the feed before parsing, so only new or changed blocks go
+through icalendar and event_to_gcal_payload(). The hash also covers everything outside the
+VEVENTs (VTIMEZONE definitions etc.), so a change there invalidates the whole cache. Entries
+not seen for max_unseen_runs runs are evicted.
+"""
+import hashlib
+
+from feedfilter import FOLD_RE, VEVENT_RE
+from statefile import load_json, state_path, write_json_atomic
+
+# Bump when the record format or the conversion changes, to discard old caches
+CACHE_VERSION = 3
+
+class BlockCache:
+    def __init__(self, data_dir, feed_key, max_unseen_runs=5):
+        self.path = state_path(data_dir, "blockcache", feed_key)
+        saved = load_json(self.path, {}) or {}
+        if saved.get("version") != CACHE_VERSION:
+            saved = {}
+        self.run = saved.get("run", 0) + 1
+        self.entries = saved.get("entries", {})
+        self.max_unseen_runs = max_unseen_runs
+        self.hits = 0
+        self.misses = 0
+
+    def split(self, data):
+        """
+        Return (cached records, ICS bytes holding only the uncached VEVENTs, keys of those
+        VEVENTs in feed order) for a raw feed.
+        """
+        context = hashlib.sha1(VEVENT_RE.sub(b"", data) + str(CACHE_VERSION).encode()).digest()
+        cached, miss_keys = [], []
+
+        def take(match):
+            block = match.group(0)
+            key = hashlib.sha1(context + FOLD_RE.sub(b"", block)).hexdigest()
+            entry = self.entries.get(key)
+            if entry is None:
+                miss_keys.append(key)
+                return block
+            entry["seen"] = self.run
+            cached.append(entry["record"])
+            return b""
+
+        remaining = VEVENT_RE.sub(take, data)
+        self.hits, self.misses = len(cached), len(miss_keys)
+        print(f"[cache] {self.hits} unchanged events reused, {self.misses} to parse")
+        return cached, remaining, miss_keys
+
+    def store(self, keys, records):
+        """Cache records converted from the uncached blocks (same order as the keys from split())."""
+        if len(keys) != len(records):
+            # Parser saw a different number of VEVENTs than the block scan; do not guess the pairing
+            print(f"[cache] {len(records)} events parsed from {len(keys)} blocks, not caching this run")
+            return
+        for key, record in zip(keys, records):
+            if "error" not in record:
+                self.entries[key] = {"seen": self.run, "record": record}
+
+    def save(self):
+        live = {key: entry for key, entry in self.entries.items()
+                if self.run - entry["seen"] < self.max_unseen_runs}
+        evicted = len(self.entries) - len(live)
+        if evicted:
+            print(f"[cache] evicted {evicted} events not seen for {self.max_unseen_runs} runs")
+        self.entries = live
+        write_json_atomic(self.path, {"version": CACHE_VERSION, "run": self.run, "entries": live})
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Crash-safe progress checkpoints for long sync runs.
+
+Progress is appended to data/checkpoint-<calendar>.jsonl: an "intent" record, flushed to
+disk before the write is sent, and a "done" record with the Google id the write returned.
+Done records are buffered and flushed in small batches (and with every intent), so a run
+that is killed partway resumes from the last flush and redoes at most one batch. UIDs
+with an intent but no done record are "uncertain": the resumed run always looks them up in
+Google before writing (with --deterministic-ids, by their derived id, even though the
+listing does not know them), so unconfirmed creates do not turn into duplicates.
+"""
+import json
+import os
+import time
+
+from statefile import locked, state_path
+
+CHECKPOINT_BATCH = 25
+CHECKPOINT_MAX_AGE = 24 * 60 * 60
+
+class SyncCheckpoint:
+    def __init__(self, data_dir, calendar_id, ics_url, batch_size=CHECKPOINT_BATCH, max_age=CHECKPOINT_MAX_AGE):
+        self.path = state_path(data_dir, "checkpoint", calendar_id)[:-len(".json")] + ".jsonl"
+        self.calendar_id = calendar_id
+        self.ics_url = ics_url
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.listing = None       # {icsUid: google_id} captured before any writes
+        self.done = {}            # {icsUid: {"id": google_id, "fp": fingerprint, "deleted": bool}}
+        self.uncertain = set()    # intents without a matching done record
+        self._buffer = []
+
+    def load(self):
+        """Read an existing checkpoint for the same calendar and feed. Returns True when resuming."""
+        header = None
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn final line from a crash mid-append
+                    if header is None:
+                        header = rec
+                        continue
+                    op = rec.get("op")
+                    if op == "listing":
+                        self.listing = rec["synced"]
+                    elif op == "intent":
+                        self.uncertain.add(rec["uid"])
+                    elif op == "done":
+                        self.done[rec["uid"]] = {"id": rec.get("id"), "fp": rec.get("fp"), "deleted": rec.get("deleted", False)}
+                        self.uncertain.discard(rec["uid"])
+        except FileNotFoundError:
+            pass
+
+        stale = (header is None
+                 or header.get("calendar_id") != self.calendar_id
+                 or header.get("ics_url") != self.ics_url
+                 or time.time() - header.get("started", 0) > self.max_age)
+        if stale:
+            self.listing, self.done, self.uncertain = None, {}, set()
+            self._start()
+            return False
+        return bool(self.done or self.listing is not None)
+
+    def _start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        header = {"calendar_id": self.calendar_id, "ics_url": self.ics_url, "started": time.time()}
+        with open(self.path, "w") as f:
+            f.write(json.dumps(header) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, uid, fingerprint):
+        entry = self.done.get(uid)
+        return bool(entry) and entry["fp"] == fingerprint
+
+    def record_listing(self, synced):
+        self.listing = dict(synced)
+        self._buffer.append({"op": "listing", "synced": self.listing})
+        self.flush()
+
+    def intend(self, uid):
+        """Record that a write for uid is about to be sent; on disk before this returns."""
+        self.uncertain.add(uid)
+        self._buffer.append({"op": "intent", "uid": uid})
+        self.flush()
+
+    def is_uncertain(self, uid):
+        """True if a write for uid was sent by the interrupted run but never confirmed."""
+        return uid in self.uncertain
+
+    def complete(self, uid, google_id, fingerprint, deleted=False):
+        """Record a finished write; deleted=True when it removed the event from Google."""
+        self.done[uid] = {"id": google_id, "fp": fingerprint, "deleted": deleted}
+        self.uncertain.discard(uid)
+        self._buffer.append({"op": "done", "uid": uid, "id": google_id, "fp": fingerprint, "deleted": deleted})
+        if len(self._buffer) >= self.batch_size * 2:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(rec) + "\n" for rec in self._buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+
+    def finish(self):
+        """The run completed; the next run starts fresh."""
+        self._buffer = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def calendar_lock(data_dir, calendar_id):
+    """Non-blocking per-calendar lock; raises BlockingIOError if another run holds it."""
+    return locked(state_path(data_dir, "sync", calendar_id), blocking=False)
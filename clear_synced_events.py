@@ -2,38 +2,125 @@
 """
 Clear all events that were synced from ICS (identified by icsUid property).
 This preserves any manually added events in the calendar.
+
+Deletion is pipelined: each listing page is handed to a batched, rate-limited delete
+job as soon as it arrives, while the next page is fetched. Progress is saved to
+data/purge-<calendar>.json so an interrupted purge resumes where it stopped: after the
+last page that was purged with no page before it failing.
 """
 import argparse
 import os
-from sync import get_service, get_all_synced_google_events, gcal_delete_event
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from statefile import DEFAULT_DATA_DIR, load_json, state_path, write_json_atomic
+from sync import (RateLimiter, gcal_batch_execute, get_service, http_status,
+                  iter_synced_google_pages)
+
+def _resumable_pages(service, calendar_id, page_token):
+    """Listing pages starting at a saved page token, restarting from the top if it has expired."""
+    try:
+        for page in iter_synced_google_pages(service, calendar_id, page_token):
+            yield page
+    except Exception as e:
+        if not page_token or http_status(e) not in (400, 410):
+            raise
+        print("Saved page token expired, restarting the listing from the beginning")
+        yield from iter_synced_google_pages(service, calendar_id)
+
+def purge_synced_events(service, calendar_id, data_dir=DEFAULT_DATA_DIR, workers=4, rate=20.0, pipeline_depth=2):
+    """Delete every synced event, page by page. Returns (deleted, failed)."""
+    progress_path = state_path(data_dir, "purge", calendar_id)
+    progress = load_json(progress_path, {}) or {}
+    if progress:
+        print(f"Resuming purge after {progress.get('deleted', 0)} previously deleted events")
+
+    limiter = RateLimiter(rate)
+    deleted = progress.get("deleted", 0)
+    failed = 0
+    clean_so_far = True
+    resume_token = progress.get("page_token")
+
+    def finish_page(page_no, next_token, result):
+        nonlocal deleted, failed, clean_so_far, resume_token
+        page_failed = 0
+        for event_id, (_, exception) in result.items():
+            # 404/410: already gone, which is what we wanted
+            if exception is None or http_status(exception) in (404, 410):
+                deleted += 1
+            else:
+                page_failed += 1
+                print(f"  Failed to delete {event_id}: {exception}")
+        failed += page_failed
+        print(f"  [page {page_no}] deleted {len(result) - page_failed}, failed {page_failed} (total deleted: {deleted})")
+        # Only skip pages on resume while every earlier page was fully purged
+        clean_so_far = clean_so_far and page_failed == 0
+        if clean_so_far and next_token:
+            resume_token = next_token
+        # The count covers every finished page, also those after a failed one
+        write_json_atomic(progress_path, {"page_token": resume_token, "deleted": deleted})
+
+    def settle(page_no, next_token, future):
+        nonlocal clean_so_far
+        try:
+            result = future.result()
+        except BaseException:
+            clean_so_far = False
+            raise
+        finish_page(page_no, next_token, result)
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=pipeline_depth) as pool:
+        try:
+            pages = _resumable_pages(service, calendar_id, progress.get("page_token"))
+            for page_no, (events, next_token) in enumerate(pages, 1):
+                jobs = [(e["id"], lambda event_id=e["id"]: service.events().delete(calendarId=calendar_id, eventId=event_id))
+                        for e in events]
+                future = pool.submit(gcal_batch_execute, service, jobs, "events.delete",
+                                     workers=workers, rate_limiter=limiter)
+                in_flight.append((page_no, next_token, future))
+                # Keep at most pipeline_depth pages deleting while the next one is listed
+                while len(in_flight) > pipeline_depth or (in_flight and in_flight[0][2].done()):
+                    settle(*in_flight.popleft())
+            while in_flight:
+                settle(*in_flight.popleft())
+        finally:
+            # After a failure, pages already deleting still finish: count them
+            while in_flight:
+                page, token, done = in_flight.popleft()
+                if done.exception() is None:
+                    finish_page(page, token, done.result())
+                else:
+                    clean_so_far = False
 
-def clear_ics_synced_events(service, calendar_id, dry_run=False):
+    if failed == 0 and os.path.exists(progress_path):
+        os.unlink(progress_path)
+    return deleted, failed
+
+def clear_ics_synced_events(service, calendar_id, dry_run=False, data_dir=DEFAULT_DATA_DIR, workers=4, rate=20.0):
     """Delete all events that have the icsUid extended property."""
     print(f"Fetching all ICS-synced events from calendar: {calendar_id}")
-    
-    synced_events = get_all_synced_google_events(service, calendar_id)
-    
-    print(f"Found {len(synced_events)} ICS-synced events")
-    
+
     if dry_run:
         print("\nDRY RUN - Would delete the following events:")
-        for event in synced_events:
-            summary = event.get('summary', 'No title')
-            event_id = event.get('id')
-            print(f"  - {summary} (ID: {event_id})")
+        total = 0
+        for events, _ in iter_synced_google_pages(service, calendar_id):
+            for event in events:
+                summary = event.get('summary', 'No title')
+                event_id = event.get('id')
+                print(f"  - {summary} (ID: {event_id})")
+            total += len(events)
+        print(f"\nWould delete {total} events")
+        return
+
+    print("\nDeleting ICS-synced events...")
+    deleted, failed = purge_synced_events(service, calendar_id, data_dir=data_dir, workers=workers, rate=rate)
+
+    print(f"\nDeleted {deleted} events")
+    if failed:
+        print(f"{failed} events could not be deleted; run again to retry them")
     else:
-        print("\nDeleting ICS-synced events...")
-        for i, event in enumerate(synced_events, 1):
-            summary = event.get('summary', 'No title')
-            event_id = event.get('id')
-            try:
-                gcal_delete_event(service, calendar_id, event_id)
-                print(f"  [{i}/{len(synced_events)}] Deleted: {summary}")
-            except Exception as e:
-                print(f"  [{i}/{len(synced_events)}] Failed to delete {summary}: {e}")
-    
-    print(f"\n{'Would delete' if dry_run else 'Deleted'} {len(synced_events)} events")
-    print("You can now run a fresh sync to repopulate the calendar.")
+        print("You can now run a fresh sync to repopulate the calendar.")
 
 def main():
     parser = argparse.ArgumentParser(description="Clear all ICS-synced events from Google Calendar")
@@ -41,15 +128,19 @@ def main():
     parser.add_argument("--credentials", default="credentials.json", help="OAuth credentials file")
     parser.add_argument("--token", default="token.json", help="OAuth token file")
     parser.add_argument("--dry-run", action="store_true", help="Preview what would be deleted")
-    
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory for purge progress (resume state)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent delete batches")
+    parser.add_argument("--rate", type=float, default=20.0, help="Maximum delete requests per second")
+
     args = parser.parse_args()
-    
+
     # Override with environment variables if present
     creds_path = os.environ.get("CREDENTIALS_PATH", args.credentials)
     token_path = os.environ.get("TOKEN_PATH", args.token)
-    
+
     service = get_service(token_path=token_path, creds_path=creds_path)
-    clear_ics_synced_events(service, args.calendar_id, args.dry_run)
+    clear_ics_synced_events(service, args.calendar_id, args.dry_run,
+                            data_dir=args.data_dir, workers=args.workers, rate=args.rate)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
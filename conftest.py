@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Shared test fixtures: an in-memory Google Calendar behind a real discovery client.
+
+FakeCalendarHttp stands in for the HTTP transport, so requests, batches and errors go
+through googleapiclient exactly as they would against Google. It serves the Calendar v3
+calls the sync makes: events list (including privateExtendedProperty and syncToken), get,
+insert, update, delete and move, and multipart batch requests. Deleted events are kept as
+"cancelled" tombstones whose ids stay reserved, as in Google.
+"""
+import email.parser
+import itertools
+import json
+import threading
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httplib2
+import pytest
+from googleapiclient.discovery import build
+
+REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 410: "Gone",
+           500: "Internal Server Error"}
+
+def vevent(uid, summary=None, start="20300101T100000Z", end="20300101T110000Z", status=None, extra=()):
+    """One VEVENT block as ICS text."""
+    lines = ["BEGIN:VEVENT", f"UID:{uid}", f"DTSTART:{start}", f"DTEND:{end}", f"SUMMARY:{summary or uid}"]
+    if status:
+        lines.append(f"STATUS:{status}")
+    lines.extend(extra)
+    lines.append("END:VEVENT")
+    return "\r\n".join(lines) + "\r\n"
+
+def ics_feed(*events):
+    """A VCALENDAR holding the given VEVENT blocks, as bytes."""
+    return ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//test//EN\r\n" + "".join(events) + "END:VCALENDAR\r\n").encode()
+
+class FakeCalendarHttp:
+    def __init__(self):
+        self.calendars = {}      # {calendar_id: {event_id: event}}
+        self.calls = []          # (method name, calendar_id) per executed request, batch parts included
+        self.unreadable = set()  # event ids whose get answers 404 although the id is taken
+        self.broken = set()      # event ids whose update and delete answer 500
+        self.changes = []        # (sequence, calendar_id, event_id) per mutation, for sync tokens
+        self.max_page = 2500     # largest events list page served, whatever maxResults asks for
+        self._seq = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    # --- helpers for tests ---
+
+    def events(self, calendar_id, deleted=False):
+        return [e for e in self.calendars.get(calendar_id, {}).values() if deleted or e.get("status") != "cancelled"]
+
+    def count(self, method):
+        return sum(1 for m, _ in self.calls if m == method)
+
+    def edit(self, calendar_id, event_id, **changes):
+        """Change an event as a user would in Google (delete it with status="cancelled")."""
+        with self._lock:
+            event = self.calendars[calendar_id][event_id]
+            if changes.get("status") == "cancelled":
+                event = {"id": event_id, "status": "cancelled"}
+            self.calendars[calendar_id][event_id] = dict(event, **changes)
+            self._record(calendar_id, event_id)
+
+    # --- httplib2.Http interface ---
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        parsed = urlparse(uri)
+        if parsed.path.startswith("/batch/"):
+            return self._batch(body, headers or {})
+        status, payload = self._handle(method, parsed.path, parse_qs(parsed.query), body)
+        return self._response(status, payload)
+
+    def _response(self, status, payload):
+        resp = httplib2.Response({"status": str(status), "content-type": "application/json"})
+        resp.reason = REASONS.get(status, "")
+        return resp, (json.dumps(payload) if payload is not None else "").encode()
+
+    def _error(self, status, reason, message):
+        return status, {"error": {"code": status, "message": message,
+                                  "errors": [{"domain": "global", "reason": reason, "message": message}]}}
+
+    def _record(self, calendar_id, event_id):
+        self.changes.append((next(self._seq), calendar_id, event_id))
+
+    def _handle(self, method, path, query, body):
+        parts = [unquote(p) for p in path.split("/")]
+        # /calendar/v3/calendars/{calendarId}/events[/{eventId}[/move]]
+        calendar_id = parts[4]
+        event_id = parts[6] if len(parts) > 6 else None
+        data = json.loads(body) if body else None
+        with self._lock:
+            cal = self.calendars.setdefault(calendar_id, {})
+            if event_id is None and method == "GET":
+                self.calls.append(("events.list", calendar_id))
+                return self._list(calendar_id, cal, query)
+            if event_id is None and method == "POST":
+                self.calls.append(("events.insert", calendar_id))
+                new_id = data.get("id") or f"g{next(self._ids)}"
+                if new_id in cal:
+                    return self._error(409, "duplicate", "The requested identifier already exists.")
+                cal[new_id] = dict(data, id=new_id, status=data.get("status", "confirmed"))
+                self._record(calendar_id, new_id)
+                return 200, cal[new_id]
+            if len(parts) > 7 and parts[7] == "move":
+                self.calls.append(("events.move", calendar_id))
+                if event_id not in cal:
+                    return self._error(404, "notFound", "Not Found")
+                destination = query["destination"][0]
+                event = cal.pop(event_id)
+                self.calendars.setdefault(destination, {})[event_id] = event
+                self._record(calendar_id, event_id)
+                self._record(destination, event_id)
+                return 200, event
+            if method == "GET":
+                self.calls.append(("events.get", calendar_id))
+                if event_id not in cal or event_id in self.unreadable:
+                    return self._error(404, "notFound", "Not Found")
+                return 200, cal[event_id]
+            if method in ("PUT", "DELETE") and event_id in self.broken:
+                self.calls.append(("events.update" if method == "PUT" else "events.delete", calendar_id))
+                return self._error(500, "backendError", "Backend Error")
+            if method == "PUT":
+                self.calls.append(("events.update", calendar_id))
+                if event_id not in cal:
+                    return self._error(404, "notFound", "Not Found")
+                cal[event_id] = dict(data, id=event_id, status=data.get("status", "confirmed"))
+                self._record(calendar_id, event_id)
+                return 200, cal[event_id]
+            if method == "DELETE":
+                self.calls.append(("events.delete", calendar_id))
+                if event_id not in cal:
+                    return self._error(404, "notFound", "Not Found")
+                if cal[event_id].get("status") == "cancelled":
+                    return self._error(410, "deleted", "Resource has been deleted")
+                cal[event_id] = {"id": event_id, "status": "cancelled"}
+                self._record(calendar_id, event_id)
+                return 204, None
+        return self._error(400, "badRequest", f"unsupported {method} {path}")
+
+    def _list(self, calendar_id, cal, query):
+        sync_token = query.get("syncToken", [None])[0]
+        if sync_token is not None:
+            changed = {eid for seq, cid, eid in self.changes if cid == calendar_id and seq > int(sync_token)}
+            items = [cal[eid] for eid in cal if eid in changed]
+        else:
+            show_deleted = query.get("showDeleted", ["false"])[0] == "true"
+            items = [e for e in cal.values() if show_deleted or e.get("status") != "cancelled"]
+        for constraint in query.get("privateExtendedProperty", []):
+            key, _, value = constraint.partition("=")
+            items = [e for e in items if e.get("extendedProperties", {}).get("private", {}).get(key) == value]
+        # Page tokens are cursors (the position of the last event served), so deleting
+        # events on earlier pages does not shift later ones, as with Google
+        position = {eid: i for i, eid in enumerate(cal)}
+        after = int(query.get("pageToken", ["-1"])[0])
+        items = [e for e in items if position[e["id"]] > after]
+        size = min(int(query.get("maxResults", ["250"])[0]), self.max_page)
+        response = {"items": items[:size]}
+        if len(items) > size:
+            response["nextPageToken"] = str(position[items[size - 1]["id"]])
+        else:
+            response["nextSyncToken"] = str(self.changes[-1][0] if self.changes else 0)
+        return 200, response
+
+    def _batch(self, body, headers):
+        content_type = headers.get("content-type") or headers.get("Content-Type")
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + (body if isinstance(body, bytes) else body.encode()))
+        boundary = "batch_response"
+        out = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            head, _, part_body = request.replace("\r\n", "\n").partition("\n\n")
+            method, target, _ = head.split("\n", 1)[0].split(" ", 2)
+            parsed = urlparse(target)
+            status, payload = self._handle(method, parsed.path, parse_qs(parsed.query), part_body or None)
+            content_id = part["Content-ID"].strip("<>")
+            out.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                       f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n\r\n"
+                       f"{json.dumps(payload) if payload is not None else ''}\r\n")
+        out.append(f"--{boundary}--\r\n")
+        resp = httplib2.Response({"status": "200", "content-type": f"multipart/mixed; boundary={boundary}"})
+        resp.reason = "OK"
+        return resp, "".join(out).encode()
+
+@pytest.fixture
+def calendar():
+    """The in-memory calendar store."""
+    return FakeCalendarHttp()
+
+@pytest.fixture
+def service(calendar):
+    """A real Calendar v3 client talking to the in-memory calendar."""
+    return build("calendar", "v3", http=calendar, cache_discovery=False)
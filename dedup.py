@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cross-feed ownership of events when several feeds sync into one calendar (--dedup).
+
+Feeds that share events (an organizer's feed and an attendee's feed, say) would otherwise
+overwrite each other's copy of the same icsUid on every run, and prune each other's events.
+Each calendar keeps an index in data/dedup-<calendar>.json of which feeds currently carry
+each event, keyed by UID plus RECURRENCE-ID, and which one of them owns it. A run claims
+the events of its own feed, writes only those it owns, and never prunes events another feed
+still carries. Claims of a feed that has not run for ttl seconds lapse, so a retired feed
+hands its events over. Runs on one calendar are serialized by its sync lock, so the index
+is only ever updated by one run at a time.
+
+Precedence rules (use the same one for every feed of a calendar):
+- "priority": the feed with the highest --feed-priority wins;
+- "first": the feed that claimed the event first keeps it while it still carries it;
+- "sequence": the copy with the highest SEQUENCE, then the latest LAST-MODIFIED, wins.
+Ties keep the current owner, so ownership does not flap between equal feeds.
+"""
+import time
+
+from statefile import load_json, state_path, write_json_atomic
+
+PRECEDENCE = ("priority", "first", "sequence")
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+def dedup_key(record):
+    """Identity of an event across feeds: its UID, plus RECURRENCE-ID for a modified instance."""
+    return record["uid"]  # event_to_gcal_payload already keys modified instances by both
+
+class DedupIndex:
+    def __init__(self, data_dir, calendar_id, precedence="priority", ttl=DEFAULT_TTL):
+        if precedence not in PRECEDENCE:
+            raise ValueError(f"unknown dedup precedence {precedence!r}, expected one of {', '.join(PRECEDENCE)}")
+        self.path = state_path(data_dir, "dedup", calendar_id)
+        self.precedence = precedence
+        self.ttl = ttl
+        state = load_json(self.path, {}) or {}
+        self.feeds = state.get("feeds", {})    # {feed: {"priority": p, "seen": ts}}
+        self.claims = state.get("claims", {})  # {key: {feed: {"since": ts, "sequence": n, "modified": iso}}}
+        self.owners = state.get("owners", {})  # {key: feed}
+
+    def _rank(self, key, feed):
+        claim = self.claims[key][feed]
+        if self.precedence == "priority":
+            return (self.feeds[feed]["priority"],)
+        if self.precedence == "first":
+            return (-claim["since"],)
+        return (claim["sequence"], claim["modified"])
+
+    def _expire(self, now):
+        stale = {feed for feed, info in self.feeds.items() if now - info["seen"] > self.ttl}
+        for feed in stale:
+            print(f"[dedup] {feed} has not run for {self.ttl / 86400:g} days, releasing its events")
+            del self.feeds[feed]
+        if stale:
+            for key in list(self.claims):
+                for feed in stale & self.claims[key].keys():
+                    del self.claims[key][feed]
+
+    def claim(self, feed, records, priority=0, now=None):
+        """
+        Replace feed's claims with the events in records and settle ownership.
+        Returns (keys owned by other feeds, keys carried by other feeds).
+        """
+        now = now or time.time()
+        self._expire(now)
+        self.feeds[feed] = {"priority": priority, "seen": now}
+        mine = {}
+        for record in records:
+            if "error" in record or not record["uid"]:
+                continue
+            facts = record.get("facts", {})
+            mine[dedup_key(record)] = {"sequence": facts.get("sequence", 0), "modified": facts.get("modified") or ""}
+
+        for key in list(self.claims):
+            if key not in mine:
+                self.claims[key].pop(feed, None)
+        for key, claim in mine.items():
+            claimants = self.claims.setdefault(key, {})
+            claim["since"] = claimants.get(feed, {}).get("since", now)
+            claimants[feed] = claim
+
+        foreign_keys, foreign_uids = set(), set()
+        for key in list(self.claims):
+            claimants = self.claims[key]
+            if not claimants:
+                del self.claims[key]
+                self.owners.pop(key, None)
+                continue
+            owner = self.owners.get(key)
+            best = max(claimants, key=lambda f: self._rank(key, f))
+            if owner not in claimants or self._rank(key, best) > self._rank(key, owner):
+                owner = self.owners[key] = best
+            if owner != feed and key in mine:
+                foreign_keys.add(key)
+            if claimants.keys() - {feed}:
+                foreign_uids.add(key)
+        return foreign_keys, foreign_uids
+
+    def owner(self, key):
+        return self.owners.get(key)
+
+    def save(self):
+        write_json_atomic(self.path, {"feeds": self.feeds, "claims": self.claims, "owners": self.owners})
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker for mass deletions by --prune-missing and by events cancelled in the feed.
+
+If a feed briefly comes back empty or truncated, --prune-missing would delete every synced
+event and the next good run would create them all again. That is two calendar-sized write
+storms, a spent daily quota and two notifications to every attendee. Before a run deletes
+anything, the guard compares the parsed feed size with the median of the feed's recent runs
+(kept in data/deleteguard-<calendar>.json), and the planned deletes with the number of
+synced events. When more than DELETE_FLOOR events would be deleted, the breaker trips if:
+- the feed has fewer than min_feed_ratio of its usual number of events, or
+- more than max_delete_fraction of the synced events would go.
+The run's deletes are then held back and the hold is recorded. Creates and updates still run.
+The hold ends when:
+- the feed recovers, so the deletes are no longer planned;
+- a shrunken feed keeps the same size for CONFIRM_RUNS fetches over at least CONFIRM_SECONDS,
+  which confirms the shrink is real (an empty feed is never taken as confirmation); or
+- a run is started with --force. A hold tripped by max_delete_fraction alone (a feed of the
+  usual size that cancels or drops much of the calendar) only ends this way or by recovering:
+  fetching the same feed again confirms nothing.
+"""
+import time
+
+from statefile import load_json, state_path, write_json_atomic
+
+KEEP_HISTORY = 20
+DELETE_FLOOR = 10  # this many deletes never trip the breaker, whatever the calendar size
+SAME_SIZE = 0.02   # fetches within 2% of each other count as the same feed
+CONFIRM_RUNS = 3   # a shrink must be fetched this many times...
+CONFIRM_SECONDS = 3600  # ...over at least this long before its deletes run
+
+def _when(t):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(t))
+
+class DeletionGuard:
+    def __init__(self, data_dir, calendar_id, feed, max_delete_fraction=0.2, min_feed_ratio=0.5, force=False,
+                 confirm_runs=CONFIRM_RUNS, confirm_seconds=CONFIRM_SECONDS):
+        self.path = state_path(data_dir, "deleteguard", calendar_id)
+        self.feed = feed
+        self.max_delete_fraction = max_delete_fraction
+        self.min_feed_ratio = min_feed_ratio
+        self.force = force
+        self.confirm_runs = confirm_runs
+        self.confirm_seconds = confirm_seconds
+        state = load_json(self.path, {}) or {}
+        self.feeds = state.get("feeds", {})  # {feed: {"history": [{"t", "size"}], "hold": {...} or None}}
+        self.state = self.feeds.setdefault(feed, {"history": [], "hold": None})
+
+    @property
+    def hold(self):
+        return self.state.get("hold")
+
+    def baseline(self):
+        """Median feed size of recent accepted runs, or None without history."""
+        sizes = sorted(h["size"] for h in self.state["history"])
+        return sizes[len(sizes) // 2] if sizes else None
+
+    def _shrunk(self, feed_size):
+        usual = self.baseline()
+        return bool(usual) and feed_size < self.min_feed_ratio * usual
+
+    def _trip_reason(self, feed_size, deletes, synced):
+        if deletes <= DELETE_FLOOR:
+            return None
+        if self._shrunk(feed_size):
+            return f"feed has {feed_size} events, usually {self.baseline()}"
+        if deletes > self.max_delete_fraction * synced:
+            return f"{deletes} of {synced} synced events would be deleted"
+        return None
+
+    def _accept(self, feed_size, now, rebase=False):
+        self.state["hold"] = None
+        if rebase:
+            self.state["history"] = []  # a confirmed shrink is the feed's new usual size
+        self.state["history"].append({"t": round(now), "size": feed_size})
+        del self.state["history"][:-KEEP_HISTORY]
+
+    def check(self, feed_size, deletes, synced, now=None):
+        """
+        May a run whose feed has feed_size events delete `deletes` of the `synced` events in
+        the calendar? Returns (allowed, reason), reason being None if the breaker did not trip.
+        """
+        now = now or time.time()
+        reason = self._trip_reason(feed_size, deletes, synced)
+        if reason is None:
+            self._accept(feed_size, now)
+            return True, None
+        if self.force:
+            self._accept(feed_size, now, rebase=True)
+            return True, f"{reason}; deleting anyway (--force)"
+        hold = self.hold
+        shrink = self._shrunk(feed_size)
+        if (shrink and hold and hold.get("shrink") and feed_size
+                and abs(feed_size - hold["size"]) <= SAME_SIZE * hold["size"]):
+            seen, size_since = hold.get("seen", 1) + 1, hold.get("size_since", hold["t"])
+        else:
+            seen, size_since = 1, round(now)
+        if shrink and feed_size and seen >= self.confirm_runs and now - size_since >= self.confirm_seconds:
+            self._accept(feed_size, now, rebase=True)
+            return True, f"{reason}; confirmed by {seen} fetches of the same size since {_when(size_since)}"
+        self.state["hold"] = {"since": hold["since"] if hold else round(now), "t": round(now),
+                              "size": feed_size, "size_since": size_since, "seen": seen, "shrink": shrink,
+                              "deletes": deletes, "reason": reason}
+        return False, reason
+
+    def allows(self, feed_size, deletes, synced):
+        """
+        check() for deletes outside the sync runs (watch.py): nothing is recorded, a hold is
+        never confirmed, and while one is in place nothing may be deleted. Returns (allowed, reason).
+        """
+        reason = self._trip_reason(feed_size, deletes, synced)
+        if reason is None and self.hold:
+            reason = f"deletes held since {_when(self.hold['since'])}: {self.hold['reason']}"
+        if reason and self.force:
+            return True, f"{reason}; deleting anyway (--force)"
+        return reason is None, reason
+
+    def save(self):
+        write_json_atomic(self.path, {"feeds": self.feeds})
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Pre-parse feed filter: drop unwanted VEVENTs from the raw ICS bytes before icalendar sees them.
+
+Each VEVENT block is scanned for a handful of properties (SUMMARY, CATEGORIES, STATUS, CLASS,
+TRANSP, ORGANIZER, UID, RECURRENCE-ID) with plain regular expressions; blocks matching an
+exclusion rule are cut out of the feed, so they are never parsed, converted or looked up in
+Google. The UIDs of dropped events (plus RECURRENCE-ID for modified instances) are returned
+so pruning can leave their Google copies alone.
+"""
+import re
+from collections import Counter
+
+VEVENT_RE = re.compile(rb"BEGIN:VEVENT\r?\n.*?END:VEVENT\r?\n?", re.DOTALL)
+FOLD_RE = re.compile(rb"\r?\n[ \t]")
+# NAME;PARAM=value;PARAM="quoted:value":VALUE (the value starts at the first colon outside quotes)
+LINE_RE = re.compile(r'^([A-Za-z0-9-]+)((?:;[^:;"]*=(?:"[^"]*"|[^:;",]*)(?:,(?:"[^"]*"|[^:;",]*))*)*):(.*)$')
+SCANNED = {"UID", "RECURRENCE-ID", "SUMMARY", "CATEGORIES", "STATUS", "CLASS", "TRANSP", "ORGANIZER"}
+
+def _unescape(text):
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+def scan_properties(block):
+    """{NAME: [value, ...]} for the scanned properties of one raw VEVENT block."""
+    props = {}
+    for line in FOLD_RE.sub(b"", block).decode("utf-8", "replace").splitlines():
+        m = LINE_RE.match(line)
+        if not m:
+            continue
+        name = m.group(1).upper()
+        if name in SCANNED:
+            # ORGANIZER keeps its parameters (CN=...) so a rule can match the display name too;
+            # CATEGORIES stays escaped until it is split on its unescaped commas
+            if name == "ORGANIZER":
+                value = m.group(2) + ":" + m.group(3)
+            elif name == "CATEGORIES":
+                value = m.group(3)
+            else:
+                value = _unescape(m.group(3))
+            props.setdefault(name, []).append(value)
+    return props
+
+class FeedFilter:
+    """
+    Exclusion rules; an event is dropped if any rule matches. Regexes are searched
+    case-insensitively; status, classes and transp are sets of property values.
+    """
+    def __init__(self, summary=None, category=None, status=(), classes=(), transp=(), organizer=None):
+        self.summary = re.compile(summary, re.I) if summary else None
+        self.category = re.compile(category, re.I) if category else None
+        self.status = {s.upper() for s in status}
+        self.classes = {c.upper() for c in classes}
+        self.transp = {t.upper() for t in transp}
+        self.organizer = re.compile(organizer, re.I) if organizer else None
+
+    def __bool__(self):
+        return bool(self.summary or self.category or self.status or self.classes or self.transp or self.organizer)
+
+    def reason(self, props):
+        """Name of the first rule that drops an event with these properties, or None to keep it."""
+        def first(name):
+            return props.get(name, [""])[0].strip()
+        if self.status and first("STATUS").upper() in self.status:
+            return "status"
+        if self.classes and first("CLASS").upper() in self.classes:
+            return "class"
+        if self.transp and first("TRANSP").upper() in self.transp:
+            return "transp"
+        if self.summary and self.summary.search(first("SUMMARY")):
+            return "summary"
+        if self.category and any(self.category.search(_unescape(c).strip())
+                                 for value in props.get("CATEGORIES", []) for c in re.split(r"(?<!\\),", value)):
+            return "category"
+        if self.organizer and any(self.organizer.search(o) for o in props.get("ORGANIZER", [])):
+            return "organizer"
+        return None
+
+    def apply(self, data):
+        """Return (filtered_bytes, dropped_uids, reasons) where reasons counts drops per rule."""
+        dropped_uids = set()
+        reasons = Counter()
+
+        def keep_or_drop(match):
+            block = match.group(0)
+            props = scan_properties(block)
+            why = self.reason(props)
+            if why is None:
+                return block
+            reasons[why] += 1
+            uid = props.get("UID", [""])[0].strip()
+            rid = props.get("RECURRENCE-ID", [""])[0].strip()
+            if uid:
+                # Same key as event_to_gcal_payload gives the event
+                dropped_uids.add(f"{uid}|{rid}" if rid else uid)
+            return b""
+
+        filtered = VEVENT_RE.sub(keep_or_drop, data)
+        if reasons:
+            detail = ", ".join(f"{why}={n}" for why, n in sorted(reasons.items()))
+            print(f"[filter] dropped {sum(reasons.values())} events before parsing ({detail})")
+        return filtered, dropped_uids, reasons
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Hedged feed downloads across mirror URLs (--ics-mirror).
+
+Mirrors are tried fastest-healthy-first, ranked by latency and error statistics kept in
+data/source_stats.json. If the current request has not finished by the source's learned
+latency percentile (p90 by default), a second request goes to the next mirror and whichever
+valid response arrives first wins. A failed request immediately moves on to the next mirror.
+"""
+import queue
+import threading
+import time
+
+import requests
+
+from statefile import load_json, state_path, write_json_atomic
+
+KEEP_SAMPLES = 50
+KEEP_OUTCOMES = 20
+MIN_SAMPLES = 5  # below this, hedge after DEFAULT_HEDGE_SECONDS
+DEFAULT_HEDGE_SECONDS = 5.0
+
+class SourceStats:
+    """
+    Recent latencies and success/failure outcomes per feed URL, persisted in data_dir.
+    Requests cut off because another mirror won are kept apart as censored latencies: all
+    that is known is that they took longer than their elapsed time, and that they did not fail.
+    """
+    def __init__(self, data_dir):
+        self.path = state_path(data_dir, "source_stats")
+        self.sources = load_json(self.path, {}) or {}
+        self._lock = threading.Lock()
+
+    def record(self, url, seconds, ok):
+        with self._lock:
+            source = self.sources.setdefault(url, {"latencies": [], "outcomes": []})
+            if ok:
+                source["latencies"] = (source["latencies"] + [round(seconds, 3)])[-KEEP_SAMPLES:]
+            source["outcomes"] = (source["outcomes"] + [1 if ok else 0])[-KEEP_OUTCOMES:]
+
+    def record_unfinished(self, url, seconds):
+        """A request abandoned after `seconds`: a lower bound on its latency, no outcome."""
+        with self._lock:
+            source = self.sources.setdefault(url, {"latencies": [], "outcomes": []})
+            source["censored"] = (source.get("censored", []) + [round(seconds, 3)])[-KEEP_SAMPLES:]
+
+    def percentile(self, url, pct, min_samples=MIN_SAMPLES):
+        """
+        Latency percentile of a source, or None without enough history. Censored samples
+        count as slower than every finished one; if the percentile falls among them, the
+        largest known lower bound is returned.
+        """
+        with self._lock:
+            source = self.sources.get(url, {})
+            samples = sorted(source.get("latencies", []))
+            censored = list(source.get("censored", []))
+        total = len(samples) + len(censored)
+        if not samples or total < min_samples:
+            return None
+        index = min(total - 1, int(total * pct / 100))
+        if index < len(samples):
+            return samples[index]
+        return max(samples[-1], *censored)
+
+    def error_rate(self, url):
+        with self._lock:
+            outcomes = self.sources.get(url, {}).get("outcomes", [])
+        return 1 - sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def order(self, urls):
+        """Healthy sources first, fastest (median latency) first; unknown sources keep their given order."""
+        def rank(item):
+            position, url = item
+            median = self.percentile(url, 50, min_samples=1)
+            return (self.error_rate(url) >= 0.5, median if median is not None else DEFAULT_HEDGE_SECONDS, position)
+        return [url for _, url in sorted(enumerate(urls), key=rank)]
+
+    def save(self):
+        with self._lock:
+            snapshot = {url: dict(source) for url, source in self.sources.items()}
+        write_json_atomic(self.path, snapshot)
+
+class HedgedFetcher:
+    def __init__(self, urls, session=None, stats=None, hedge_percentile=90.0, timeout=30):
+        self.urls = list(dict.fromkeys(urls))
+        self.session = session
+        self.stats = stats
+        self.hedge_percentile = hedge_percentile
+        self.timeout = timeout
+
+    def _hedge_delay(self, url):
+        learned = self.stats.percentile(url, self.hedge_percentile) if self.stats else None
+        return learned if learned is not None else DEFAULT_HEDGE_SECONDS
+
+    def _get(self, url, results, started, finished):
+        try:
+            r = (self.session or requests).get(url, timeout=self.timeout)
+            r.raise_for_status()
+            data = r.content
+            if b"BEGIN:VCALENDAR" not in data[:4096]:
+                raise ValueError("response is not an ICS calendar")
+            error = None
+        except Exception as ex:
+            data, error = None, ex
+        with finished["lock"]:
+            if finished["done"]:
+                return  # the fetch already returned; its stats were recorded then
+            elapsed = time.monotonic() - started[url]
+            del started[url]
+        if self.stats:
+            self.stats.record(url, elapsed, error is None)
+        results.put((url, data, error, elapsed))
+
+    def fetch(self):
+        """Body of the first mirror to answer with a valid calendar."""
+        pending = self.stats.order(self.urls) if self.stats else list(self.urls)
+        results = queue.Queue()
+        started = {}
+        finished = {"done": False, "lock": threading.Lock()}
+        errors = []
+
+        def launch():
+            url = pending.pop(0)
+            with finished["lock"]:
+                started[url] = time.monotonic()
+            threading.Thread(target=self._get, args=(url, results, started, finished), daemon=True).start()
+            return url
+
+        last = launch()
+        in_flight = 1
+        while True:
+            if not in_flight and not pending:
+                raise RuntimeError("all feed sources failed: " + "; ".join(f"{url}: {ex}" for url, ex in errors))
+            try:
+                url, data, error, elapsed = results.get(timeout=self._hedge_delay(last) if pending else None)
+            except queue.Empty:
+                nxt = launch()
+                in_flight += 1
+                print(f"[fetch] {last} slower than its p{self.hedge_percentile:g}, hedging with {nxt}")
+                last = nxt
+                continue
+            in_flight -= 1
+            if error is None:
+                self._finish(finished, started)
+                print(f"[fetch] {url} answered in {elapsed:.2f}s")
+                return data
+            print(f"[fetch] {url} failed after {elapsed:.2f}s: {error}")
+            errors.append((url, error))
+            if pending:
+                last = launch()
+                in_flight += 1
+
+    def _finish(self, finished, started):
+        """Stop accepting responses; requests still in flight are recorded as unfinished after their elapsed time."""
+        with finished["lock"]:
+            finished["done"] = True
+            now = time.monotonic()
+            losers = {url: now - t for url, t in started.items()}
+        if self.stats:
+            for url, elapsed in losers.items():
+                self.stats.record_unfinished(url, elapsed)
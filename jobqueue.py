@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Shared feed-job queue with leases, backed by SQLite on a volume every worker node mounts.
+
+A worker claims a due job by taking a lease on it and keeps the lease alive with heartbeats
+while the sync runs. If a node dies, its lease expires and another node picks the job up on
+its next poll. A job is never leased to two nodes at once, so two nodes never sync the same
+feed concurrently.
+"""
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_QUEUE_PATH = os.path.join("data", "jobs.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    ics_url TEXT NOT NULL,
+    calendar_ids TEXT NOT NULL,
+    flags TEXT NOT NULL DEFAULT '',
+    interval_seconds INTEGER NOT NULL,
+    next_run REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_status TEXT,
+    last_run REAL,
+    runs INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+class JobQueue:
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        with self._connect() as db:
+            db.execute(SCHEMA)
+
+    def _connect(self):
+        # Rollback journal (not WAL): WAL needs shared memory, which network volumes do not provide
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def add(self, job_id, ics_url, calendar_ids, flags="", interval_seconds=6 * 3600):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, ics_url, calendar_ids, flags, interval_seconds, next_run) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET ics_url=excluded.ics_url, calendar_ids=excluded.calendar_ids, "
+                "flags=excluded.flags, interval_seconds=excluded.interval_seconds",
+                (job_id, ics_url, json.dumps(list(calendar_ids)), flags, int(interval_seconds), time.time()))
+
+    def remove(self, job_id):
+        with self._connect() as db:
+            return db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def jobs(self):
+        with self._connect() as db:
+            return [dict(row) for row in db.execute("SELECT * FROM jobs ORDER BY next_run")]
+
+    def claim(self, owner, lease_seconds):
+        """Lease the most overdue job that is free (or whose lease expired). Returns the job or None."""
+        now = time.time()
+        db = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two nodes cannot pick the same row
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM jobs WHERE next_run <= ? AND (lease_owner IS NULL OR lease_expires < ?) "
+                "ORDER BY next_run LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            if row["lease_owner"]:
+                print(f"[queue] lease of {row['job_id']} held by {row['lease_owner']} expired, taking over")
+            db.execute("UPDATE jobs SET lease_owner = ?, lease_expires = ? WHERE job_id = ?",
+                       (owner, now + lease_seconds, row["job_id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:  # not if BEGIN IMMEDIATE itself failed (e.g. database locked)
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        job = dict(row)
+        job["calendar_ids"] = json.loads(job["calendar_ids"])
+        return job
+
+    def heartbeat(self, job_id, owner, lease_seconds):
+        """Extend our lease. False means it was lost (expired and taken by another node)."""
+        with self._connect() as db:
+            return db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, job_id, owner)).rowcount > 0
+
+    def release(self, job_id, owner, status, next_run):
+        """Record the outcome, schedule the next run and drop the lease."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET lease_owner = NULL, lease_expires = NULL, last_status = ?, last_run = ?, "
+                "next_run = ?, runs = runs + 1 WHERE job_id = ? AND lease_owner = ?",
+                (status, time.time(), next_run, job_id, owner))
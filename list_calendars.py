@@ -6,25 +6,14 @@ import os
 import sys
 sys.path.append(os.path.dirname(__file__))
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+from tokenbroker import credential_broker
+
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
 def get_service(token_path="token.json", creds_path="credentials.json"):
-    creds = None
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            # Will refresh on use
-            pass
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open(token_path, "w") as f:
-            f.write(creds.to_json())
+    creds = credential_broker(token_path, creds_path, SCOPES).credentials()
     return build("calendar", "v3", credentials=creds, cache_discovery=False)
 
 def list_calendars():
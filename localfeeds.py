@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Local feed sources for --ics-url: file:// URLs or plain paths, directories of .ics files
+merged into one feed, and "-" for stdin.
+
+Files are memory-mapped instead of read. The feed digest, the --exclude-* filters and the
+block cache all run on the mapping, straight from the page cache. Only the bytes that still
+have to be parsed are copied out, which with --block-cache is just the changed events.
+A mapping keeps showing the file it was opened on if the file is replaced by a rename.
+Rewriting the file in place while a sync reads it is not safe, so exports should be written
+under a temporary name and renamed into place.
+"""
+import mmap
+import os
+import sys
+from urllib.parse import unquote, urlparse
+
+def is_local_source(source):
+    """True for "-", file:// URLs and paths that exist; False for anything else (URLs, mistyped paths)."""
+    return isinstance(source, str) and (source == "-" or source.startswith("file://") or os.path.exists(source))
+
+def local_path(source):
+    return unquote(urlparse(source).path) if source.startswith("file://") else source
+
+def map_file(f):
+    """A read-only mapping of an open file, or its bytes if it cannot be mapped (pipes, empty files)."""
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return f.read()
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return map_file(f)  # the mapping stays valid after the file is closed
+
+def merge_calendars(calendars):
+    """
+    One VCALENDAR holding the components of every (name, data) calendar. Calendar-level
+    properties (VERSION, PRODID, ...) are taken from the first one.
+    """
+    parts = []
+    for name, data in calendars:
+        start, end = data.find(b"BEGIN:VCALENDAR"), data.rfind(b"END:VCALENDAR")
+        if start < 0 or end < start:
+            raise ValueError(f"{name} is not an ICS calendar")
+        if parts:
+            first_component = data.find(b"\nBEGIN:", start + len(b"BEGIN:VCALENDAR"), end)
+            if first_component < 0:
+                continue  # no events
+            start = first_component + 1
+        parts.append(data[start:end])
+    return b"".join(parts) + b"END:VCALENDAR\r\n"
+
+def read_local_feed(source):
+    """Bytes or a read-only mmap of a local feed; see is_local_source() for the accepted forms."""
+    if source == "-":
+        return map_file(sys.stdin.buffer)
+    path = local_path(source)
+    if not os.path.isdir(path):
+        return read_file(path)
+    files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".ics"))
+    if not files:
+        raise FileNotFoundError(f"no .ics files in {path}")
+    if len(files) == 1:
+        return read_file(files[0])
+    print(f"[fetch] merging {len(files)} calendars from {path}")
+    return merge_calendars((name, read_file(name)) for name in files)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling interval per feed (--adaptive).
+
+Each run records whether the feed changed (its bytes, and how many events had to be
+written) in data/schedule-<feed>.json. The interval tightens right after a change and backs
+off while the feed stays quiet, faster once the quiet stretch is long, always between the
+configured bounds. A frequent timer (or the worker queue) then only syncs feeds that are due.
+"""
+import time
+
+from statefile import load_json, state_path, write_json_atomic
+
+KEEP_HISTORY = 50
+QUIET_STREAK = 3  # unchanged runs after which back-off speeds up
+
+class FeedSchedule:
+    def __init__(self, data_dir, feed_key, min_interval=900, max_interval=86400):
+        self.path = state_path(data_dir, "schedule", feed_key)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.state = load_json(self.path, {}) or {}
+
+    @property
+    def interval(self):
+        return self.state.get("interval", self.min_interval)
+
+    @property
+    def next_due(self):
+        return self.state.get("next_due", 0)
+
+    def due(self, now=None):
+        return (now or time.time()) >= self.next_due
+
+    def record(self, digest, changed, ok=True, pending=0, now=None):
+        """
+        Record one run: the feed's content digest, how many events it changed and how many
+        writes it deferred (pending). Returns the next interval in seconds.
+        """
+        now = now or time.time()
+        state = self.state
+        if not ok:
+            # Failed fetch or sync: try again soon, keep the learned interval
+            state["next_due"] = now + min(self.interval, self.min_interval)
+            self.save()
+            return state["next_due"] - now
+        if pending:
+            # Deferred writes (deadline, quota) are not a quiet feed: keep the
+            # learned interval and the old digest, and come back soon to finish them
+            state["next_due"] = now + min(self.interval, self.min_interval)
+            self.save()
+            return state["next_due"] - now
+        if digest == state.get("digest"):
+            changed = 0
+        history = state.setdefault("history", [])
+        history.append({"t": round(now), "changed": changed})
+        del history[:-KEEP_HISTORY]
+
+        if changed:
+            # Busy feed: poll again soon
+            interval = self.interval / 4
+            state["last_change"] = now
+            state["quiet_runs"] = 0
+        else:
+            state["quiet_runs"] = state.get("quiet_runs", 0) + 1
+            interval = self.interval * (2 if state["quiet_runs"] >= QUIET_STREAK else 1.5)
+        interval = max(self.min_interval, min(self.max_interval, interval))
+        state.update(digest=digest, interval=interval, next_due=now + interval)
+        self.save()
+        return interval
+
+    def describe(self, now=None):
+        now = now or time.time()
+        last_change = self.state.get("last_change")
+        since = f"{(now - last_change) / 3600:.1f}h ago" if last_change else "never seen"
+        return (f"interval {self.interval / 60:.0f}min, next due in {max(0, self.next_due - now) / 60:.0f}min, "
+                f"{self.state.get('quiet_runs', 0)} quiet runs, last change {since}")
+
+    def save(self):
+        write_json_atomic(self.path, self.state)
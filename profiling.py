@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Per-phase profiling for sync runs (--profile DIR).
+
+Each phase is wrapped in cProfile and tracemalloc. For every phase the output directory gets
+<phase>.pstats (load with `python -m pstats`), <phase>-alloc.txt (top allocation sites
+grown during the phase), and summary.txt gets one row per phase.
+"""
+import cProfile
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class PhaseProfiler:
+    def __init__(self, out_dir, top_n=25):
+        self.out_dir = out_dir
+        self.top_n = top_n
+        self.rows = []
+        self._depth = 0
+        os.makedirs(out_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    def _path(self, name, suffix):
+        return os.path.join(self.out_dir, re.sub(r"[^A-Za-z0-9._-]", "_", name) + suffix)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    @contextmanager
+    def phase(self, name):
+        # Snapshots are taken outside the profiled/timed window so they do not show up in it
+        before = self._snapshot()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        profiling = False
+        if self._depth == 0:
+            try:
+                profile.enable()
+                profiling = True
+            except ValueError:
+                # Another profiler is active (only one can run at a time); keep timing and memory only
+                pass
+        self._depth += 1
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            if profiling:
+                profile.disable()
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._depth -= 1
+            _, peak = tracemalloc.get_traced_memory()
+            growth = self._snapshot().compare_to(before, "lineno")
+            self._write_allocations(name, growth)
+            hottest = ""
+            if profiling:
+                profile.dump_stats(self._path(name, ".pstats"))
+                hottest = self._hottest(profile)
+            self.rows.append({
+                "phase": name,
+                "wall": wall,
+                "cpu": cpu,
+                "alloc": sum(stat.size_diff for stat in growth),
+                "peak": peak,
+                "hottest": hottest,
+            })
+
+    def _write_allocations(self, name, growth):
+        with open(self._path(name, "-alloc.txt"), "w") as f:
+            f.write(f"Top {self.top_n} allocation sites during phase '{name}' (size change, count change)\n")
+            for stat in growth[:self.top_n]:
+                f.write(f"{stat}\n")
+
+    def _hottest(self, profile):
+        """Function with the most own (exclusive) time in the phase."""
+        stats = pstats.Stats(profile).stats
+        if not stats:
+            return ""
+        (filename, line, func), (_, _, tottime, _, _) = max(stats.items(), key=lambda item: item[1][2])
+        return f"{func} ({os.path.basename(filename)}:{line}) {tottime:.3f}s"
+
+    def write_summary(self):
+        """Write summary.txt and return it as text."""
+        lines = [f"{'phase':<32} {'wall s':>9} {'cpu s':>9} {'alloc MB':>9} {'peak MB':>9}  hottest function"]
+        for row in self.rows:
+            lines.append(f"{row['phase'][:32]:<32} {row['wall']:>9.3f} {row['cpu']:>9.3f} "
+                         f"{row['alloc'] / 1e6:>9.2f} {row['peak'] / 1e6:>9.2f}  {row['hottest']}")
+        text = "\n".join(lines) + "\n"
+        with open(os.path.join(self.out_dir, "summary.txt"), "w") as f:
+            f.write(text)
+        return text
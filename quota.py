@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Persistent Calendar API quota ledger shared by every run and feed.
+
+Calls are counted per method in one-minute buckets in data/quota_ledger.json, so
+usage over any rolling window (last minute, last 24h) can be read back across runs.
+Each run gets a budget; once it is spent, callers defer the remaining work.
+With a daily limit, can_spend() merges this run's calls into the file and re-reads it
+(under its lock) every SYNC_SECONDS, and on every check once the limit is near, so
+concurrent runs see each other's spend instead of each spending the whole limit.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from statefile import load_json, locked, state_path, write_json_atomic
+
+DAY_SECONDS = 24 * 60 * 60
+BUCKET_SECONDS = 60
+SYNC_SECONDS = 1.0  # merge with the ledger file at most this often while far from the daily limit
+SYNC_MARGIN = 100   # ...and on every check once fewer calls than this are left
+
+class QuotaLedger:
+    def __init__(self, data_dir, run_budget=None, daily_limit=None):
+        self.path = state_path(data_dir, "quota_ledger")
+        self.run_budget = run_budget
+        self.daily_limit = daily_limit
+        self.run_calls = 0
+        self.exhausted_by_api = False
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._buckets = (load_json(self.path, {}) or {}).get("buckets", {})
+        self._synced = time.monotonic()
+
+    def record(self, method, n=1):
+        """Count n calls of an API method (e.g. "events.insert") in the current minute bucket."""
+        bucket = str(int(time.time()) // BUCKET_SECONDS * BUCKET_SECONDS)
+        with self._lock:
+            self._pending[bucket][method] += n
+            self.run_calls += n
+
+    def mark_exhausted(self):
+        """Google reported a quota/rate-limit error; stop spending for this run."""
+        self.exhausted_by_api = True
+
+    def usage(self, window_seconds=DAY_SECONDS):
+        """Calls per method over the last window_seconds, including this run's unsaved calls."""
+        cutoff = time.time() - window_seconds
+        totals = defaultdict(int)
+        with self._lock:
+            sources = [self._buckets, self._pending]
+            for buckets in sources:
+                for bucket, methods in buckets.items():
+                    if int(bucket) >= cutoff:
+                        for method, n in methods.items():
+                            totals[method] += n
+        return dict(totals)
+
+    def remaining(self):
+        """Calls this run may still make, or None if unlimited."""
+        limits = []
+        if self.run_budget is not None:
+            limits.append(self.run_budget - self.run_calls)
+        if self.daily_limit is not None:
+            limits.append(self.daily_limit - sum(self.usage(DAY_SECONDS).values()))
+        return max(0, min(limits)) if limits else None
+
+    def can_spend(self, cost=1):
+        if self.exhausted_by_api:
+            return False
+        left = self.remaining()
+        if self.daily_limit is not None and (left < SYNC_MARGIN or time.monotonic() - self._synced >= SYNC_SECONDS):
+            self.save()  # publish our calls and pick up those of concurrent runs
+            left = self.remaining()
+        return left is None or left >= cost
+
+    def save(self):
+        """
+        Merge this run's calls into the ledger on disk, dropping buckets older than a day,
+        and take over what other runs have recorded meanwhile.
+        """
+        with self._sync_lock, locked(self.path):
+            cutoff = time.time() - DAY_SECONDS
+            buckets = {b: m for b, m in ((load_json(self.path, {}) or {}).get("buckets", {})).items()
+                       if int(b) >= cutoff}
+            with self._lock:
+                # Swapped in one step, so usage() never misses or double-counts calls
+                pending = self._pending
+                for bucket, methods in pending.items():
+                    merged = buckets.setdefault(bucket, {})
+                    for method, n in methods.items():
+                        merged[method] = merged.get(method, 0) + n
+                self._pending = defaultdict(lambda: defaultdict(int))
+                self._buckets = buckets
+            if pending:
+                write_json_atomic(self.path, {"buckets": buckets})
+            self._synced = time.monotonic()
+
+    def summary(self):
+        day = self.usage(DAY_SECONDS)
+        minute = self.usage(BUCKET_SECONDS)
+        return (f"run={self.run_calls}, last_minute={sum(minute.values())}, "
+                f"last_24h={sum(day.values())}, remaining={self.remaining()}")
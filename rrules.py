@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Local RRULE checks against the subset Google Calendar accepts.
+
+Rules are classified before they are sent: "ok" (sent as is), "repair" (UNTIL rewritten in
+the form Google expects), "expand" (replaced by explicit RDATEs generated with dateutil over
+a bounded window) or "drop" (not even dateutil can read it; only the first instance is kept).
+Verdicts are cached per rule text and persisted in data/rrule_verdicts.json, together with
+rules Google rejected at runtime, so a bad rule costs no failed API calls on later runs.
+"""
+import re
+import threading
+from datetime import date, datetime
+
+import pytz
+from dateutil import tz
+from dateutil.rrule import rrulestr
+
+from statefile import load_json, state_path, write_json_atomic
+
+SUPPORTED_FREQ = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
+SUPPORTED_PARTS = {"FREQ", "UNTIL", "COUNT", "INTERVAL", "BYDAY", "BYMONTHDAY", "BYYEARDAY",
+                   "BYWEEKNO", "BYMONTH", "BYSETPOS", "WKST"}
+MAX_INSTANCES = 1000
+
+def _parts(rule_text):
+    body = rule_text.split(":", 1)[1] if rule_text.upper().startswith("RRULE:") else rule_text
+    parts = {}
+    for item in body.split(";"):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            parts[key.strip().upper()] = value.strip()
+    return parts
+
+def classify(rule_text, all_day):
+    """Return (verdict, reason) for one RRULE line."""
+    parts = _parts(rule_text)
+    freq = parts.get("FREQ", "").upper()
+    unsupported = sorted(set(parts) - SUPPORTED_PARTS)
+    if not freq:
+        verdict, reason = "expand", "missing FREQ"
+    elif freq not in SUPPORTED_FREQ:
+        verdict, reason = "expand", f"FREQ={freq} not supported"
+    elif unsupported:
+        verdict, reason = "expand", f"unsupported parts {','.join(unsupported)}"
+    elif "COUNT" in parts and "UNTIL" in parts:
+        verdict, reason = "expand", "both COUNT and UNTIL"
+    elif "UNTIL" in parts and not _until_in_google_form(parts["UNTIL"], all_day):
+        verdict, reason = "repair", "UNTIL not in UTC/date form"
+    else:
+        return "ok", ""
+    if verdict == "expand":
+        try:
+            rrulestr(_rule_body(rule_text), dtstart=datetime(2000, 1, 1), ignoretz=True)
+        except Exception as ex:
+            return "drop", f"{reason}; dateutil cannot read it either: {ex}"
+    return verdict, reason
+
+def _until_in_google_form(until, all_day):
+    if all_day:
+        return bool(re.fullmatch(r"\d{8}", until))
+    return bool(re.fullmatch(r"\d{8}T\d{6}Z", until))
+
+def _rule_body(rule_text):
+    return rule_text.split(":", 1)[1] if rule_text.upper().startswith("RRULE:") else rule_text
+
+def _start_from_payload(start):
+    """Google start dict -> (dtstart, all_day); timed starts are localized to their timeZone."""
+    if "date" in start:
+        return datetime.fromisoformat(start["date"]), True
+    dt = datetime.fromisoformat(start["dateTime"])
+    zone = tz.gettz(start.get("timeZone") or "UTC")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=zone or pytz.UTC)
+    elif zone:
+        dt = dt.astimezone(zone)
+    return dt, False
+
+def _parse_until(value, dtstart, all_day):
+    """UNTIL as a value comparable with dtstart (floating values are taken in dtstart's zone)."""
+    if re.fullmatch(r"\d{8}", value):
+        d = datetime.strptime(value, "%Y%m%d")
+        if all_day:
+            return d
+        return d.replace(hour=23, minute=59, second=59, tzinfo=dtstart.tzinfo)
+    d = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if all_day:
+        return d
+    if value.endswith("Z"):
+        return d.replace(tzinfo=pytz.UTC)
+    return d.replace(tzinfo=dtstart.tzinfo)
+
+def repair(rule_text, start):
+    """Rewrite UNTIL as UTC (timed events) or a plain date (all-day events)."""
+    dtstart, all_day = _start_from_payload(start)
+    parts = _parts(rule_text)
+    until = _parse_until(parts["UNTIL"], dtstart, all_day)
+    if all_day:
+        parts["UNTIL"] = until.strftime("%Y%m%d")
+    else:
+        parts["UNTIL"] = until.astimezone(pytz.UTC).strftime("%Y%m%dT%H%M%SZ")
+    return "RRULE:" + ";".join(f"{k}={v}" for k, v in parts.items())
+
+def expansion_window(today=None):
+    """
+    Expansion range: start of last year to end of next year. It only moves on
+    January 1st, so expanded series do not change (and get re-written) every run.
+    """
+    today = today or date.today()
+    return datetime(today.year - 1, 1, 1), datetime(today.year + 1, 12, 31, 23, 59, 59)
+
+def _rdate_value(dt, all_day):
+    return dt.strftime("%Y%m%d") if all_day else dt.astimezone(pytz.UTC).strftime("%Y%m%dT%H%M%SZ")
+
+def expand(rule_text, start, today=None, max_instances=MAX_INSTANCES):
+    """
+    Explicit RDATE lines for the occurrences of rule_text inside expansion_window().
+    Raises ValueError rather than cut the series short at max_instances.
+    """
+    dtstart, all_day = _start_from_payload(start)
+    parts = _parts(rule_text)
+    if "UNTIL" in parts:
+        until = _parse_until(parts.pop("UNTIL"), dtstart, all_day)
+    else:
+        until = None
+    rule = rrulestr(";".join(f"{k}={v}" for k, v in parts.items()), dtstart=dtstart, ignoretz=all_day)
+    lo, hi = expansion_window(today)
+    if not all_day:
+        lo, hi = lo.replace(tzinfo=pytz.UTC), hi.replace(tzinfo=pytz.UTC)
+    if until is not None and until < hi:
+        hi = until
+    first = _rdate_value(dtstart, all_day)
+    values = []
+    seen = set()
+    for occ in rule.xafter(max(lo, dtstart), inc=True):
+        if occ > hi:
+            break
+        value = _rdate_value(occ, all_day)
+        # An all-day event with BYHOUR/BYMINUTE repeats the same date
+        if value == first or value in seen:
+            continue
+        if len(values) >= max_instances:
+            raise ValueError(f"more than {max_instances} occurrences in the expansion window")
+        seen.add(value)
+        values.append(value)
+    if not values:
+        return []
+    return [("RDATE;VALUE=DATE:" if all_day else "RDATE:") + ",".join(values)]
+
+def exdate(recurrence_id, start):
+    """
+    EXDATE line for the occurrence a modified instance (RECURRENCE-ID value) replaces, in the
+    form of expand()'s RDATEs. Floating values are taken in the series' start zone.
+    """
+    dtstart, all_day = _start_from_payload(start)
+    if all_day or re.fullmatch(r"\d{8}", recurrence_id):
+        return "EXDATE;VALUE=DATE:" + recurrence_id[:8]
+    occ = datetime.strptime(recurrence_id.rstrip("Z"), "%Y%m%dT%H%M%S")
+    occ = occ.replace(tzinfo=pytz.UTC if recurrence_id.endswith("Z") else dtstart.tzinfo)
+    return "EXDATE:" + _rdate_value(occ, False)
+
+class RRuleChecker:
+    """
+    Cached classify/repair/expand of RRULE lines, optionally persisted in data_dir.
+    Rules that could not be repaired or expanded are kept in failures until take_failures().
+    """
+    def __init__(self, data_dir=None):
+        self.path = state_path(data_dir, "rrule_verdicts") if data_dir else None
+        self.verdicts = (load_json(self.path, {}) or {}) if self.path else {}
+        self.failures = []  # (rule_text, message)
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _key(self, rule_text, all_day):
+        return f"{'date' if all_day else 'datetime'}|{rule_text}"
+
+    def verdict(self, rule_text, all_day):
+        key = self._key(rule_text, all_day)
+        with self._lock:
+            cached = self.verdicts.get(key)
+        if cached:
+            return cached["verdict"], cached["reason"]
+        verdict, reason = classify(rule_text, all_day)
+        with self._lock:
+            self.verdicts[key] = {"verdict": verdict, "reason": reason}
+            self._dirty = True
+        if verdict != "ok":
+            print(f"[rrule] {rule_text}: {verdict} ({reason})")
+        return verdict, reason
+
+    def record_rejection(self, rule_text, all_day, message=""):
+        """Google refused a rule we thought was fine; expand it locally from now on."""
+        with self._lock:
+            self.verdicts[self._key(rule_text, all_day)] = {"verdict": "expand", "reason": f"rejected by Google: {message}"[:300]}
+            self._dirty = True
+
+    def recurrence_for(self, rule_text, start):
+        """Recurrence lines to send to Google for one RRULE and the payload's start."""
+        all_day = "date" in start
+        verdict, _ = self.verdict(rule_text, all_day)
+        try:
+            if verdict == "ok":
+                return [rule_text]
+            if verdict == "repair":
+                return [repair(rule_text, start)]
+            if verdict == "expand":
+                return expand(rule_text, start)
+        except Exception as ex:
+            print(f"[warning] Failed to {verdict} RRULE {rule_text}, keeping the first instance only: {ex}")
+            with self._lock:
+                self.failures.append((rule_text, f"cannot {verdict}: {ex}"))
+        return []
+
+    def take_failures(self):
+        """Failures recorded since the last call."""
+        with self._lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def save(self):
+        if self.path and self._dirty:
+            with self._lock:
+                snapshot = dict(self.verdicts)
+                self._dirty = False
+            write_json_atomic(self.path, snapshot)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Small helpers for the JSON state files kept in data/ (ledgers, checkpoints, caches).
+Writes are atomic (temp file + rename) and can be serialized across processes with a lock file.
+"""
+import fcntl
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+DEFAULT_DATA_DIR = "data"
+
+def state_path(data_dir, kind, key=None):
+    """Path of a state file in data_dir, optionally namespaced by a key such as a calendar id."""
+    if key:
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", key)
+        return os.path.join(data_dir, f"{kind}-{safe}.json")
+    return os.path.join(data_dir, f"{kind}.json")
+
+def load_json(path, default=None):
+    """Load a JSON state file; a missing or corrupt file yields the default."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+def write_json_atomic(path, data):
+    """Write JSON so readers only ever see the old or the new file, never a partial one."""
+    write_text_atomic(path, json.dumps(data, sort_keys=True))
+
+def write_text_atomic(path, text):
+    """Atomically replace path with text. The file is created owner-only (mode 0600)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+@contextmanager
+def locked(path, blocking=True):
+    """
+    Hold an exclusive lock on path + ".lock" for the duration of the block.
+    With blocking=False, raises BlockingIOError if another process holds it.
+    """
+    lock_path = path + ".lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as f:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        fcntl.flock(f.fileno(), flags)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -1,44 +1,247 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import contextvars
 import hashlib
+import heapq
 import json
-import os
+import random
 import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Optional
 from urllib.parse import urlparse
 
+import httplib2
 import pytz
 import requests
-from dateutil import tz
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+from dateutil.rrule import rrulestr
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from icalendar import Calendar, Event
 
+from blockcache import BlockCache
+from checkpoint import SyncCheckpoint, calendar_lock
+from dedup import DEFAULT_TTL as DEDUP_TTL, PRECEDENCE as DEDUP_PRECEDENCE, DedupIndex, dedup_key
+from deleteguard import DeletionGuard
+from feedfilter import FeedFilter
+from feedsources import HedgedFetcher, SourceStats
+from localfeeds import is_local_source, read_local_feed
+from pollschedule import FeedSchedule
+from profiling import PhaseProfiler
+from quota import QuotaLedger
+from rrules import RRuleChecker, exdate
+from statefile import DEFAULT_DATA_DIR, load_json, state_path, write_json_atomic
+from tokenbroker import credential_broker
+from transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, PooledHttp, pooled_http
+from verify import DriftVerifier
+
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
-def get_service(token_path="token.json", creds_path="credentials.json"):
-    creds = None
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            # Will refresh on use
-            pass
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open(token_path, "w") as f:
-            f.write(creds.to_json())
+# Ledger that every Calendar API call is counted against (None = not tracked) and verdict
+# cache for RRULE lines. Each SyncEngine run installs its own in a copy of the context, so
+# engines sharing a process do not see each other's; the set_* defaults only serve code
+# calling the sync helpers outside an engine run (watch.py, scripts).
+_quota_var = contextvars.ContextVar("quota")
+_rrule_checker_var = contextvars.ContextVar("rrule_checker")
+_default_quota = None
+_default_rrule_checker = RRuleChecker()
+
+def set_quota_ledger(ledger):
+    global _default_quota
+    _default_quota = ledger
+
+def set_rrule_checker(checker):
+    global _default_rrule_checker
+    _default_rrule_checker = checker
+
+def active_quota():
+    return _quota_var.get(_default_quota)
+
+def active_rrule_checker():
+    return _rrule_checker_var.get(_default_rrule_checker)
+
+def _submit(pool, fn, *args):
+    """pool.submit(fn, *args) in a copy of the caller's context, so the run's ledger and cache carry over."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _resolved(value):
+    """A Future already holding value."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+# Attempts after a per-minute rate-limit error, with exponential backoff
+RATE_LIMIT_RETRIES = 5
+
+def _execute(request, method, retries=RATE_LIMIT_RETRIES, backoff=1.0):
+    """Execute an API request, counting each attempt against the active quota ledger."""
+    quota = active_quota()
+    for attempt in range(retries + 1):
+        if quota:
+            quota.record(method)
+        try:
+            return request.execute()
+        except Exception as ex:
+            if attempt == retries or not is_rate_limit_error(ex):
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            print(f"[rate] {method} rate limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def http_status(ex):
+    """HTTP status of a googleapiclient HttpError (None for other exceptions)."""
+    status = getattr(getattr(ex, "resp", None), "status", None)
+    return int(status) if status is not None else None
+
+def is_rate_limit_error(ex):
+    """Per-minute rate limiting: the request was not executed and can be sent again after a pause."""
+    status = http_status(ex)
+    if status == 429:
+        return True
+    return status == 403 and any(reason in str(ex) for reason in ("rateLimitExceeded", "userRateLimitExceeded"))
+
+def is_quota_error(ex):
+    """The daily quota is used up: nothing more can be sent until it resets."""
+    msg = str(ex)
+    return not is_rate_limit_error(ex) and any(reason in msg for reason in ("quotaExceeded", "dailyLimitExceeded"))
+
+def is_transient_error(ex):
+    """Errors worth retrying after a pause: rate limits and server-side failures."""
+    return http_status(ex) in (500, 502, 503, 504) or is_rate_limit_error(ex)
+
+# Calendar API accepts at most 50 requests per batch
+BATCH_LIMIT = 50
+_thread_local = threading.local()
+
+def _thread_http(service):
+    """
+    Per-thread authorized transport for batch requests (httplib2 is not thread-safe).
+    Returns None when the service has no credentials to share, so its default transport is used.
+    A pooled transport is thread-safe and shared as is.
+    """
+    if isinstance(getattr(service, "_http", None), PooledHttp):
+        return service._http
+    creds = getattr(getattr(service, "_http", None), "credentials", None)
+    if creds is None:
+        return None
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=60))
+        _thread_local.http = http
+    return http
+
+class RateLimiter:
+    """Token bucket shared by worker threads: at most `rate` requests per second on average."""
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(rate, BATCH_LIMIT))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n or self.tokens >= self.capacity:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+def gcal_batch_execute(service, jobs, method, workers=4, retries=3, backoff=1.0, rate_limiter=None):
+    """
+    Run many API requests as concurrent batches of up to BATCH_LIMIT.
+    jobs is a list of (key, make_request) where make_request() builds a fresh request
+    (so it can be re-sent). Transient failures are retried with exponential backoff.
+    An optional RateLimiter paces the individual requests across all threads.
+    Returns {key: (response, exception)}, so keys must be distinct.
+    """
+    results = {}
+    pending = list(jobs)
+    quota = active_quota()  # looked up here: the pool threads do not share this context
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            time.sleep(backoff * (2 ** (attempt - 1)))
+        chunks = [pending[i:i + BATCH_LIMIT] for i in range(0, len(pending), BATCH_LIMIT)]
+        lock = threading.Lock()
+
+        def run_chunk(chunk):
+            batch = service.new_batch_http_request()
+            outcome = {}
+
+            def callback(request_id, response, exception):
+                outcome[request_id] = (response, exception)
+
+            # Parts are numbered by position: keys need not be valid (or distinct) Content-IDs
+            for i, (key, make_request) in enumerate(chunk):
+                batch.add(make_request(), callback=callback, request_id=str(i))
+            if rate_limiter:
+                rate_limiter.acquire(len(chunk))
+            if quota:
+                quota.record(method, len(chunk))
+            try:
+                batch.execute(http=_thread_http(service))
+            except Exception as ex:
+                outcome = {str(i): (None, ex) for i in range(len(chunk))}
+            with lock:
+                for i, (key, _) in enumerate(chunk):
+                    results[key] = outcome.get(str(i), (None, RuntimeError("no response in batch")))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_chunk, chunks))
+        pending = [(key, make) for key, make in pending
+                   if results[key][1] is not None and is_transient_error(results[key][1])]
+        if pending and attempt < retries:
+            print(f"[batch] retrying {len(pending)} {method} requests after transient errors")
+    return results
+
+TRANSPORTS = ("httplib2", "pooled")
+
+def get_service(token_path="token.json", creds_path="credentials.json", transport="httplib2",
+                pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+    # Clients for the same token file share one credentials object, refreshed ahead of expiry
+    broker = credential_broker(token_path, creds_path, SCOPES)
+    creds = broker.credentials()
+    broker.refresh_in_background()
+    if transport == "pooled":
+        # ...and with the pooled transport, one set of keep-alive connections too
+        http = pooled_http(creds, pool_size, connect_timeout, read_timeout)
+        return build("calendar", "v3", http=http, cache_discovery=False)
     return build("calendar", "v3", credentials=creds, cache_discovery=False)
 
-def fetch_ics(ics_url: str) -> bytes:
-    r = requests.get(ics_url, timeout=30)
+def service_from_args(args):
+    """get_service() with the --token, --credentials and transport flags of args."""
+    return get_service(token_path=args.token, creds_path=args.credentials, transport=args.transport,
+                       pool_size=args.pool_size, connect_timeout=args.connect_timeout, read_timeout=args.http_timeout)
+
+def fetch_ics(ics_url: str, session=None) -> bytes:
+    """The feed at an http(s) URL, or a local file, directory or stdin ("-") as bytes or a read-only mmap."""
+    if is_local_source(ics_url):
+        return read_local_feed(ics_url)
+    if urlparse(ics_url).scheme.lower() not in ("http", "https"):
+        raise ValueError(f"feed {ics_url!r} is not an http(s) URL, a file:// URL, \"-\" or an existing file or directory")
+    r = (session or requests).get(ics_url, timeout=30)
     r.raise_for_status()
     return r.content
 
 def parse_ics(data: bytes):
+    # icalendar parses text. An mmap'd local feed is decoded straight from the mapping (as
+    # icalendar decodes bytes) rather than first copied out whole with bytes()
+    if not isinstance(data, (bytes, str)):
+        try:
+            data = str(data, "utf-8-sig")
+        except UnicodeDecodeError:
+            data = str(data, "utf-8-sig", "replace")
     cal = Calendar.from_ical(data)
     for component in cal.walk():
         if component.name == "VEVENT":
@@ -73,6 +276,11 @@ def event_to_gcal_payload(e: Event):
     location = str(e.get("location", "")) if e.get("location") else ""
     status = str(e.get("status", "")).upper() if e.get("status") else ""
     uid = str(e.get("uid", "")).strip()
+    # A modified instance shares its series' UID but is a Google event of its own,
+    # so it is keyed by UID plus RECURRENCE-ID
+    rid = e.get("recurrence-id")
+    if uid and rid:
+        uid = f"{uid}|{rid.to_ical().decode('utf-8')}"
 
     # Start/End
     dtstart = e.get("dtstart")
@@ -116,8 +324,9 @@ def event_to_gcal_payload(e: Event):
             if not rrule_string.startswith('RRULE:'):
                 rrule_string = f"RRULE:{rrule_string}"
             
-            recurrence = [rrule_string]
             print(f"[debug] RRULE: {rrule_string}")
+            # Checked locally against what Google accepts; unsupported rules come back repaired or expanded
+            recurrence = active_rrule_checker().recurrence_for(rrule_string, start)
                 
         except Exception as ex:
             print(f"[warning] Failed to convert RRULE, skipping recurrence: {ex}")
@@ -160,25 +369,47 @@ def event_to_gcal_payload(e: Event):
 
 def gcal_find_by_ics_uid(service, calendar_id, ics_uid):
     # Use privateExtendedProperty filter
-    return service.events().list(
+    return _execute(service.events().list(
         calendarId=calendar_id,
         privateExtendedProperty=f"icsUid={ics_uid}",
         maxResults=2,
         singleEvents=False
-    ).execute()
+    ), "events.list")
+
+_B32_TO_B32HEX = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", "0123456789ABCDEFGHIJKLMNOPQRSTUV")
+
+def ics_event_id(calendar_id, ics_uid):
+    """
+    Deterministic Google event id for an ICS UID in a calendar.
+    Google accepts client ids made of base32hex characters (0-9, a-v), 5-1024 long.
+    """
+    digest = hashlib.sha1(f"{calendar_id}\0{ics_uid}".encode("utf-8")).digest()
+    b32 = base64.b32encode(digest).decode("ascii").rstrip("=")
+    return b32.translate(_B32_TO_B32HEX).lower()
+
+def gcal_get_event(service, calendar_id, event_id):
+    """Fetch one event by id; returns None if it does not exist."""
+    try:
+        return _execute(service.events().get(calendarId=calendar_id, eventId=event_id), "events.get")
+    except Exception as ex:
+        if http_status(ex) in (404, 410):
+            return None
+        raise
 
-def gcal_upsert_event(service, calendar_id, payload, existing_event_id=None):
+def gcal_upsert_event(service, calendar_id, payload, existing_event_id=None, event_id=None):
+    """Update existing_event_id, or insert (with the client-chosen event_id, if given)."""
     if existing_event_id:
-        return service.events().update(
+        return _execute(service.events().update(
             calendarId=calendar_id,
             eventId=existing_event_id,
             body=payload
-        ).execute()
+        ), "events.update")
     else:
-        return service.events().insert(
+        body = dict(payload, id=event_id) if event_id else payload
+        return _execute(service.events().insert(
             calendarId=calendar_id,
-            body=payload
-        ).execute()
+            body=body
+        ), "events.insert")
 
 def events_differ(ics_payload, gcal_event):
     """
@@ -198,8 +429,48 @@ def events_differ(ics_payload, gcal_event):
             return True
     return False
 
+def load_id_map(data_dir, calendar_id):
+    """Last known {icsUid: google_event_id} for a calendar, as saved after each run."""
+    return load_json(state_path(data_dir, "idmap", calendar_id), {}) or {}
+
+def save_id_map(data_dir, calendar_id, id_map):
+    write_json_atomic(state_path(data_dir, "idmap", calendar_id), {k: v for k, v in id_map.items() if k})
+
+def payload_fingerprint(payload, status=""):
+    """Stable hash of a converted event, used to tell whether a recorded write is still current."""
+    blob = json.dumps([payload, status], sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+def gcal_move_event(service, calendar_id, event_id, destination):
+    """Move an event to another calendar, keeping its id."""
+    return _execute(service.events().move(calendarId=calendar_id, eventId=event_id, destination=destination), "events.move")
+
+SHARD_KEYS = ("uid", "category", "year")
+
+def shard_keys(records, shard_by):
+    """Stable per-UID shard key: the UID itself, the first CATEGORIES value, or the DTSTART year."""
+    keys = {}
+    for record in records:
+        uid = record["uid"]
+        if not uid or "error" in record:
+            continue
+        keys[uid] = uid if shard_by == "uid" else record["facts"][shard_by]
+    return keys
+
+def shard_for(key, shard_ids):
+    """
+    Pick a shard by rendezvous hashing: stable across runs and feed order, and adding or
+    removing a shard only relocates the events that belong to that shard.
+    """
+    return max(shard_ids, key=lambda shard: hashlib.sha1(f"{shard}\0{key}".encode("utf-8")).digest())
+
 def gcal_delete_event(service, calendar_id, event_id):
-    service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+    """Delete an event; one that is already gone (404, or 410 for a deleted one) counts as deleted."""
+    try:
+        _execute(service.events().delete(calendarId=calendar_id, eventId=event_id), "events.delete")
+    except Exception as ex:
+        if http_status(ex) not in (404, 410):
+            raise
 
 def load_feed_uids(events):
     uids = set()
@@ -209,42 +480,112 @@ def load_feed_uids(events):
             uids.add(uid)
     return uids
 
-def get_all_synced_google_events(service, calendar_id):
-    """Fetch all events that originated from this ICS (identified by extendedProperties.private.icsUid)."""
-    items = []
+def calendar_has_synced_events(service, calendar_id):
+    """
+    True if the calendar holds any event carrying an icsUid.
+    Pages are fetched with a minimal field mask and the scan stops at the first hit,
+    so an empty or freshly cleared calendar costs a single list call.
+    """
     page_token = None
+    while True:
+        resp = _execute(service.events().list(
+            calendarId=calendar_id,
+            pageToken=page_token,
+            maxResults=2500,
+            showDeleted=False,
+            singleEvents=False,
+            fields="items(extendedProperties/private/icsUid),nextPageToken"
+        ), "events.list")
+        for event in resp.get("items", []):
+            if "icsUid" in event.get("extendedProperties", {}).get("private", {}):
+                return True
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return False
+
+def bulk_import(service, calendar_id, items, workers=4, deterministic_ids=False, stop_reason=None):
+    """
+    Insert every (payload, status, uid) straight into an empty calendar with no diffing
+    or lookups. Cancelled events and repeats of a UID are dropped. Inserts go out in rounds
+    of `workers` batches; once the quota budget is spent or stop_reason() returns a reason,
+    the rest waits for the next run. Returns ({uid: google_id}, failed_count, deferred_count).
+    """
+    jobs = {}
+    for payload, status, uid in items:
+        if status == "CANCELLED":
+            continue
+        if uid in jobs:
+            print(f"[skip] duplicate event {uid} in feed, keeping the first")
+            continue
+        body = dict(payload, id=ics_event_id(calendar_id, uid)) if deterministic_ids else payload
+        jobs[uid] = lambda body=body: service.events().insert(calendarId=calendar_id, body=body)
+    jobs = list(jobs.items())
+
+    id_map = {}
+    failed = 0
+    step = BATCH_LIMIT * max(1, workers)
+    for start in range(0, len(jobs), step):
+        round_jobs = jobs[start:start + step]
+        reason = stop_reason() if stop_reason else None
+        if reason:
+            print(f"[deadline] {reason}, deferring {len(jobs) - start} inserts to the next run")
+            return id_map, failed, len(jobs) - start
+        quota = active_quota()
+        if quota and not quota.can_spend(len(round_jobs)):
+            print(f"[quota] budget spent, deferring {len(jobs) - start} inserts to the next run")
+            return id_map, failed, len(jobs) - start
+        for uid, (response, exception) in gcal_batch_execute(service, round_jobs, "events.insert", workers=workers).items():
+            if exception is None:
+                id_map[uid] = response.get("id")
+            elif deterministic_ids and http_status(exception) == 409:
+                id_map[uid] = ics_event_id(calendar_id, uid)
+            else:
+                print(f"[error] bulk insert failed for {uid}: {exception}")
+                failed += 1
+    return id_map, failed, 0
+
+def iter_synced_google_pages(service, calendar_id, page_token=None):
+    """
+    Yield (synced_events, next_page_token) one listing page at a time, so callers can
+    start working on the first page while later ones are still being fetched.
+    """
     while True:
         # Get all events, then filter client-side for those with icsUid
         # The privateExtendedProperty filter requires a key=value format
-        resp = service.events().list(
+        resp = _execute(service.events().list(
             calendarId=calendar_id,
             pageToken=page_token,
             maxResults=2500,
             showDeleted=False,
             singleEvents=False
-        ).execute()
-        
+        ), "events.list")
+
         # Filter events that have the icsUid extended property
-        events = resp.get("items", [])
-        for event in events:
-            ext_props = event.get("extendedProperties", {})
-            private_props = ext_props.get("private", {})
-            if "icsUid" in private_props:
-                items.append(event)
-        
+        synced = [event for event in resp.get("items", [])
+                  if "icsUid" in event.get("extendedProperties", {}).get("private", {})]
         page_token = resp.get("nextPageToken")
+        yield synced, page_token
         if not page_token:
             break
+
+def get_all_synced_google_events(service, calendar_id):
+    """Fetch all events that originated from this ICS (identified by extendedProperties.private.icsUid)."""
+    items = []
+    for synced, _ in iter_synced_google_pages(service, calendar_id):
+        items.extend(synced)
     return items
 
-def is_future_event(event):
-    """Check if an event starts in the future or has future recurring occurrences."""
+NEVER_FUTURE = datetime.min.replace(tzinfo=pytz.UTC)
+
+def future_cutoff(event):
+    """
+    Instant after which an event has no future occurrences: its start, or its UNTIL for
+    recurring events. None means it always counts as future (open-ended or unparseable).
+    """
     try:
         dtstart = event.get("dtstart")
         if not dtstart:
-            return False
-        
-        now = datetime.now(pytz.UTC)
+            return NEVER_FUTURE
         
         # Handle different datetime formats for the start time
         event_start = None
@@ -262,7 +603,7 @@ def is_future_event(event):
                 event_start = datetime.combine(dtstart.dt, datetime.min.time()).replace(tzinfo=pytz.UTC)
         
         if not event_start:
-            return True  # If we can't parse, include it to be safe
+            return None  # If we can't parse, include it to be safe
         
         # Check if the event has a recurrence rule
         rrule = event.get("rrule")
@@ -286,155 +627,1109 @@ def is_future_event(event):
                                     until_date = until_date.replace(tzinfo=pytz.UTC)
                             break
                 
-                # If there's an UNTIL date, check if it's in the future
+                # If there's an UNTIL date, the series ends there
                 if until_date:
-                    return until_date > now
+                    return until_date
                 else:
                     # No UNTIL date means the recurrence continues indefinitely
                     # Always include these recurring events
-                    return True
+                    return None
                     
             except Exception:
                 # If we can't parse the recurrence rule, include the event
-                return True
+                return None
         else:
             # Non-recurring event - just check the start time
-            return event_start > now
+            return event_start
         
     except Exception:
         # If we can't determine the date, include the event to be safe
-        return True
+        return None
 
-def main():
-    parser = argparse.ArgumentParser(description="Sync an ICS public feed into a Google Calendar.")
-    parser.add_argument("--ics-url", required=True, help="Public ICS feed URL")
-    parser.add_argument("--calendar-id", required=True, help="Target Google Calendar ID (e.g., primary or you@domain.com)")
-    parser.add_argument("--credentials", default="credentials.json", help="Google OAuth client secrets file")
-    parser.add_argument("--token", default="token.json", help="Cached OAuth token file")
-    parser.add_argument("--prune-missing", action="store_true", help="Delete Google events (with icsUid) not present in the current feed")
-    parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing to Google")
-    parser.add_argument("--future-only", action="store_true", help="Only sync events that start in the future (skip past events)")
-    args = parser.parse_args()
+def is_future_event(event):
+    """Check if an event starts in the future or has future recurring occurrences."""
+    cutoff = future_cutoff(event)
+    return cutoff is None or cutoff > datetime.now(pytz.UTC)
+
+def _event_start_utc(event):
+    """Return DTSTART as an aware datetime (all-day starts map to midnight UTC)."""
+    dtstart = event.get("dtstart")
+    if not dtstart:
+        return None
+    start = dtstart.dt
+    if not isinstance(start, datetime):
+        return datetime.combine(start, datetime.min.time()).replace(tzinfo=pytz.UTC)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=pytz.UTC)
+    return start
+
+def occurrence_window(start, rrule_text=None, now=None):
+    """
+    Return (next_start, last_start) for an aware DTSTART and RRULE text relative to now.
+    next_start is None when the event has no occurrence at or after now.
+    """
+    now = now or datetime.now(pytz.UTC)
+    if not start:
+        return None, None
+    if not rrule_text:
+        return (start, start) if start >= now else (None, start)
+    try:
+        rule = rrulestr(rrule_text, dtstart=start)
+        upcoming = rule.after(now, inc=True)
+        previous = rule.before(now) if start < now else None
+        return upcoming, previous or start
+    except Exception:
+        # Unparseable rule: treat the series as ongoing so it is not starved
+        return (start if start >= now else now), start
 
-    service = get_service(token_path=args.token, creds_path=args.credentials)
+def _priority(upcoming, last, now):
+    """
+    Sort key for the write queue: upcoming occurrences first (soonest first),
+    then past-only events (most recent first).
+    """
+    if upcoming:
+        return (0, (upcoming - now).total_seconds())
+    if last:
+        return (1, (now - last).total_seconds())
+    return (2, 0.0)
 
-    # Fetch and parse ICS
-    ics_bytes = fetch_ics(args.ics_url)
-    ics_events = list(parse_ics(ics_bytes))
-    feed_uids = load_feed_uids(ics_events)
+def sync_event(service, calendar_id, payload, status, uid, existing=None, dry_run=False, event_id=None, errors=None):
+    """
+    Create, update or delete one event so Google matches the ICS payload.
+    existing is the Google event found for this UID (None if there is none).
+    With event_id, a create is an optimistic insert under that id; a 409 means the
+    event already exists, and it is fetched and diffed instead.
+    Failures are appended to errors as (uid, message) when a list is given.
+    Returns (action, google_event_id) where action is one of "created", "updated",
+    "deleted", "skipped", "failed" or "quota" (not sent, retry next run).
+    """
+    existing_id = existing.get("id") if existing else None
+    if existing and existing.get("status") == "cancelled":
+        # Deleted in Google but the id is still reserved; bring it back with an update
+        payload = dict(payload, status="confirmed")
 
-    # For pruning, prefetch currently synced Google events
-    existing_synced = {e.get("extendedProperties", {}).get("private", {}).get("icsUid"): e
-                       for e in get_all_synced_google_events(service, args.calendar_id)}
+    if status == "CANCELLED":
+        if existing_id:
+            print(f"[delete] {uid} (cancelled in ICS)")
+            if not dry_run:
+                try:
+                    gcal_delete_event(service, calendar_id, existing_id)
+                except Exception as ex:
+                    return _write_failure(uid, "delete", ex, existing_id, errors)
+            return "deleted", existing_id
+        print(f"[skip] {uid} cancelled but not present in Google")
+        return "skipped", None
 
-    created = 0
-    updated = 0
-    deleted = 0
-    skipped = 0
+    # --- Improved moved/exception detection ---
+    should_update = False
+    if existing_id:
+        if existing.get("status") == "cancelled" or events_differ(payload, existing):
+            should_update = True
+    else:
+        should_update = True
 
-    for ev in ics_events:
-        try:
-            payload, status, uid = event_to_gcal_payload(ev)
-        except Exception as ex:
-            print(f"[skip] malformed event: {ex}", file=sys.stderr)
+    # Upsert with robust error handling and retry logic
+    try:
+        if should_update:
+            if existing_id:
+                print(f"[update] {uid} -> {existing_id} (details changed)")
+                if not dry_run:
+                    gcal_upsert_event(service, calendar_id, payload, existing_event_id=existing_id)
+                return "updated", existing_id
+            print(f"[create] {uid}")
+            result = None
+            if not dry_run:
+                try:
+                    result = gcal_upsert_event(service, calendar_id, payload, event_id=event_id)
+                except Exception as ex:
+                    if not event_id or http_status(ex) != 409:
+                        raise
+                    print(f"[exists] {uid} -> {event_id}")
+                    existing = gcal_get_event(service, calendar_id, event_id)
+                    if existing is None:
+                        # Inserting without the id would create the duplicate the id exists to prevent
+                        message = f"event id {event_id} is taken but the event cannot be read"
+                        print(f"[error] Failed to create {uid}: {message}")
+                        if errors is not None:
+                            errors.append((uid, f"create failed: {message}"))
+                        return "failed", None
+                    return sync_event(service, calendar_id, payload, status, uid, existing=existing,
+                                      dry_run=dry_run, event_id=event_id, errors=errors)
+            return "created", (result or {}).get("id", event_id)
+        print(f"[skip] {uid} (no changes)")
+        return "skipped", existing_id
+    except Exception as ex:
+        error_msg = str(ex).lower()
+        operation = 'update' if existing_id else 'create'
+
+        # Google rejected the recurrence: remember the rule so later runs never send it,
+        # and retry with it expanded locally (or without recurrence if that is impossible)
+        if "recurrence" in error_msg or "rrule" in error_msg:
+            print(f"[error] {operation} failed due to recurrence rule: {ex}")
+            rules = [r for r in payload.get("recurrence") or [] if r.upper().startswith("RRULE:")]
+            if rules:
+                active_rrule_checker().record_rejection(rules[0], "date" in payload["start"], str(ex))
+                retry_payload = payload.copy()
+                expanded = active_rrule_checker().recurrence_for(rules[0], payload["start"])
+                if expanded:
+                    print(f"[retry] Retrying {uid} with the recurrence expanded locally")
+                    retry_payload["recurrence"] = expanded
+                else:
+                    print(f"[retry] Retrying {uid} without recurrence")
+                    retry_payload.pop("recurrence", None)
+                try:
+                    result = gcal_upsert_event(service, calendar_id, retry_payload,
+                                               existing_event_id=existing_id, event_id=event_id)
+                    print(f"[success] {operation.capitalize()}d {uid} with fallback recurrence")
+                    return ("updated" if existing_id else "created"), result.get("id")
+                except Exception as ex2:
+                    print(f"[error] Still failed to {operation} {uid}: {ex2}")
+                    if errors is not None:
+                        errors.append((uid, f"{operation} failed: {ex2}"))
+                    return "failed", existing_id
+            print(f"[error] Recurrence error but no recurrence in payload: {ex}")
+            if errors is not None:
+                errors.append((uid, f"{operation} failed: {ex}"))
+            return "failed", existing_id
+
+        return _write_failure(uid, operation, ex, existing_id, errors)
+
+def _write_failure(uid, operation, ex, existing_id, errors):
+    """sync_event's result for a write that raised: "quota" if the daily quota is spent, else "failed"."""
+    print(f"[error] Failed to {operation} {uid}: {ex}")
+    quota = active_quota()
+    if quota and is_quota_error(ex):
+        quota.mark_exhausted()
+        return "quota", existing_id
+    if errors is not None:
+        errors.append((uid, f"{operation} failed: {ex}"))
+    return "failed", existing_id
+
+def event_facts(ev):
+    """Time-independent facts the write queue needs, so a cached event can be queued without re-parsing."""
+    start = _event_start_utc(ev)
+    rrule = ev.get("rrule")
+    cutoff = future_cutoff(ev)
+    cats = ev.get("categories")
+    cats = cats if isinstance(cats, list) else [cats] if cats else []
+    categories = [str(c) for cat in cats for c in getattr(cat, "cats", [cat])]
+    rid = ev.get("recurrence-id")
+    modified = ev.get("last-modified")
+    modified = modified.dt if modified and isinstance(modified.dt, datetime) else None
+    if modified:
+        modified = (modified if modified.tzinfo else modified.replace(tzinfo=pytz.UTC)).astimezone(pytz.UTC)
+    return {
+        "start": start.isoformat() if start else None,
+        "rrule": "RRULE:" + rrule.to_ical().decode("utf-8") if rrule else None,
+        "cutoff": cutoff.isoformat() if cutoff else None,
+        "category": categories[0] if categories else "",
+        "year": str(ev.get("dtstart").dt.year) if ev.get("dtstart") else "",
+        # Identity and version of the event across feeds, for --dedup
+        "recurrence_id": rid.to_ical().decode("utf-8") if rid else None,
+        "sequence": int(ev.get("sequence", 0) or 0),
+        "modified": modified.isoformat() if modified else None,
+    }
+
+def convert_event(ev):
+    """
+    One parsed VEVENT as a JSON-serializable record: uid, payload, status and facts,
+    or uid and error if it cannot be converted.
+    """
+    try:
+        payload, status, uid = event_to_gcal_payload(ev)
+    except Exception as ex:
+        return {"uid": str(ev.get("uid", "")).strip(), "error": str(ex)}
+    return {"uid": uid, "payload": payload, "status": status, "facts": event_facts(ev)}
+
+def exclude_overrides(records):
+    """
+    Records with an EXDATE added to each recurring series for the occurrences its modified
+    instances replace, so Google does not show the original occurrence next to the moved one.
+    """
+    replaced = {}
+    for record in records:
+        rid = record.get("facts", {}).get("recurrence_id")
+        if rid and "|" in record["uid"]:
+            replaced.setdefault(record["uid"].rsplit("|", 1)[0], set()).add(rid)
+    out = []
+    for record in records:
+        rids = replaced.get(record["uid"]) if "payload" in record else None
+        if rids and record["payload"].get("recurrence"):
+            payload = dict(record["payload"])
+            try:
+                lines = sorted({exdate(rid, payload["start"]) for rid in rids})
+            except ValueError as ex:
+                print(f"[warning] Failed to exclude modified instances of {record['uid']}: {ex}")
+                lines = []
+            payload["recurrence"] = payload["recurrence"] + [line for line in lines if line not in payload["recurrence"]]
+            record = dict(record, payload=payload)
+        out.append(record)
+    return out
+
+def prepare_payloads(ics_events, future_only=False, now=None):
+    """
+    Convert parsed VEVENTs once into write-queue entries
+    (priority, seq, payload, status, uid, fingerprint), soonest occurrence first.
+    Returns (entries, skipped).
+    """
+    return queue_entries(exclude_overrides([convert_event(ev) for ev in ics_events]), future_only, now)
+
+def refresh_recurrence(record):
+    """
+    A cached record with its recurrence lines derived again: they depend on RRULE verdicts
+    (Google may have rejected a rule since) and on the expansion window, not just the block.
+    """
+    rule = record.get("facts", {}).get("rrule")
+    if not rule:
+        return record
+    payload = dict(record["payload"])
+    try:
+        recurrence = active_rrule_checker().recurrence_for(rule, payload["start"])
+    except Exception as ex:
+        print(f"[warning] Failed to convert RRULE, skipping recurrence: {ex}")
+        recurrence = []
+    if recurrence:
+        payload["recurrence"] = recurrence
+    else:
+        payload.pop("recurrence", None)
+    return dict(record, payload=payload)
+
+def queue_entries(records, future_only=False, now=None):
+    """Write-queue entries and skipped count for records from convert_event()."""
+    now = now or datetime.now(pytz.UTC)
+    entries = []
+    skipped = 0
+    for seq, record in enumerate(records):
+        if "error" in record:
+            print(f"[skip] malformed event: {record['error']}", file=sys.stderr)
             skipped += 1
             continue
 
+        payload, status, uid, facts = record["payload"], record["status"], record["uid"], record["facts"]
         if not uid:
             print("[skip] event without UID")
             skipped += 1
             continue
 
         # Skip past events if --future-only flag is set
-        if args.future_only and not is_future_event(ev):
-            summary = ev.get("summary", "No Title")
+        cutoff = facts["cutoff"]
+        if future_only and cutoff and datetime.fromisoformat(cutoff) <= now:
+            summary = payload.get("summary", "No Title")
             print(f"[skip] past event: {summary} ({uid})")
             skipped += 1
             continue
 
-        # Look up existing
-        lookup = gcal_find_by_ics_uid(service, args.calendar_id, uid)
-        items = lookup.get("items", [])
-        existing = items[0] if items else None
-        existing_id = existing.get("id") if existing else None
+        start = datetime.fromisoformat(facts["start"]) if facts["start"] else None
+        priority = _priority(*occurrence_window(start, facts["rrule"], now), now)
+        entries.append((priority, seq, payload, status, uid, payload_fingerprint(payload, status)))
+    heapq.heapify(entries)
+    return entries, skipped
 
-        if status == "CANCELLED":
-            if existing_id:
-                print(f"[delete] {uid} (cancelled in ICS)")
-                if not args.dry_run:
-                    gcal_delete_event(service, args.calendar_id, existing_id)
-                deleted += 1
-            else:
-                print(f"[skip] {uid} cancelled but not present in Google")
-            continue
+@dataclass
+class SyncOptions:
+    """Behaviour switches for a sync; mirrors the command-line flags."""
+    prune_missing: bool = False
+    dry_run: bool = False
+    future_only: bool = False
+    max_runtime: Optional[float] = None
+    deterministic_ids: bool = False
+    bulk_import: bool = False
+    bulk_workers: int = 4
+    fanout_workers: int = 8
+    shard_by: Optional[str] = None  # "uid", "category" or "year": calendars are shards, not fan-out targets
+    retired_shards: list = field(default_factory=list)  # shards whose events move to the others; nothing new goes there
+    data_dir: str = DEFAULT_DATA_DIR
+    feed_filter: Optional[FeedFilter] = None  # drops events from the raw feed before parsing
+    block_cache: bool = False  # reuse converted events for unchanged VEVENT blocks
+    block_cache_runs: int = 5  # evict cached blocks not seen for this many runs
+    mirrors: list = field(default_factory=list)  # other URLs serving the same feed, raced with hedged requests
+    hedge_percentile: float = 90.0
+    dedup: Optional[str] = None  # precedence rule when several feeds share a calendar (dedup.PRECEDENCE)
+    feed_priority: int = 0  # this feed's rank under the "priority" rule
+    dedup_ttl: float = DEDUP_TTL  # claims of feeds not seen for this long lapse
+    verify_sample: Optional[int] = None  # check this many events by id instead of listing the calendar
+    drift_threshold: float = 0.02  # sampled drift rate above which a full reconcile runs
+    max_delete_fraction: float = 0.2  # more planned deletes than this share of synced events trips the guard
+    min_feed_ratio: float = 0.5  # so does a feed smaller than this share of its usual size
+    force: bool = False  # delete even if the guard trips
 
-        # --- Improved moved/exception detection ---
-        should_update = False
-        if existing_id:
-            if events_differ(payload, existing):
-                should_update = True
-        else:
-            should_update = True
+@dataclass
+class CalendarResult:
+    calendar_id: str
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    skipped: int = 0
+    deferred: int = 0
+    moved: int = 0
+    filtered: int = 0
+    deduped: int = 0
+    verified: int = 0
+    drifted: int = 0
+    held: int = 0  # deletes held back by the deletion guard
+    locked: bool = False
+    errors: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self):
+        text = (f"created={self.created}, updated={self.updated}, deleted={self.deleted}, "
+                f"skipped={self.skipped}, deferred={self.deferred}")
+        text += f", moved={self.moved}" if self.moved else ""
+        text += f", filtered={self.filtered}" if self.filtered else ""
+        text += f", deduped={self.deduped}" if self.deduped else ""
+        text += f", held={self.held}" if self.held else ""
+        return text + (f", verified={self.verified}, drifted={self.drifted}" if self.verified else "")
+
+@dataclass
+class SyncResult:
+    """Outcome of SyncEngine.run(): per-calendar counters and errors plus phase timings in seconds."""
+    calendars: dict = field(default_factory=dict)
+    timings: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+    feed_digest: str = ""  # sha1 of the downloaded feed, to tell unchanged fetches apart
+
+    @property
+    def ok(self):
+        return not self.errors and not any(c.locked or c.errors for c in self.calendars.values())
+
+    def total(self, counter):
+        return sum(getattr(c, counter) for c in self.calendars.values())
+
+def _clone_service(service):
+    """A new Calendar client sharing service's credentials, for use on another thread."""
+    if isinstance(getattr(service, "_http", None), PooledHttp):
+        return service  # thread-safe already
+    creds = getattr(getattr(service, "_http", None), "credentials", None)
+    if creds is None:
+        return service
+    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+
+class SyncEngine:
+    """
+    Embeddable sync of one ICS feed into one or more Google calendars.
+
+    feed is an ICS URL, raw ICS bytes, or a callable returning bytes. A host process can
+    keep service, session (a requests.Session used for feed downloads) and quota (a
+    QuotaLedger) and rrule_checker (an rrules.RRuleChecker verdict cache) warm and pass them
+    to many engines. Each run counts calls only against its own quota (none if not given)
+    and uses its own rrule_checker, also when engines run concurrently in one process.
+    service_factory builds extra clients
+    for concurrent fan-out; by default they share service's credentials.
+    With a profiling.PhaseProfiler, every phase is profiled; phases then run one after
+    another on the calling thread, since only one cProfile profiler can be active.
+    """
+    def __init__(self, service, feed, calendar_ids, options=None, session=None, quota=None, service_factory=None,
+                 profiler=None, rrule_checker=None):
+        self.service = service
+        self.feed = feed
+        self.calendar_ids = [calendar_ids] if isinstance(calendar_ids, str) else list(calendar_ids)
+        self.options = options or SyncOptions()
+        if self.options.shard_by:
+            # Retired shards are listed and emptied like the others, but get no events
+            self.calendar_ids += [c for c in self.options.retired_shards if c not in self.calendar_ids]
+        self.session = session
+        self.quota = quota
+        self.service_factory = service_factory or (lambda: _clone_service(service))
+        self.feed_key = feed if isinstance(feed, str) else getattr(feed, "name", "inline")
+        self.deadline = None
+        self.stopped = False
+        self.profiler = profiler
+        self.rrule_checker = rrule_checker or RRuleChecker()
+
+    def _profiled(self, phase, fn, *a, **kw):
+        if not self.profiler:
+            return fn(*a, **kw)
+        with self.profiler.phase(phase):
+            return fn(*a, **kw)
 
-        # Upsert with robust error handling and retry logic
+    def _timed(self, result, phase, fn, *a, **kw):
+        start = time.perf_counter()
         try:
-            if should_update:
-                if existing_id:
-                    print(f"[update] {uid} -> {existing_id} (details changed)")
-                    if not args.dry_run:
-                        gcal_upsert_event(service, args.calendar_id, payload, existing_event_id=existing_id)
-                    updated += 1
-                else:
-                    print(f"[create] {uid}")
-                    if not args.dry_run:
-                        gcal_upsert_event(service, args.calendar_id, payload, existing_event_id=None)
-                    created += 1
-            else:
-                print(f"[skip] {uid} (no changes)")
-                skipped += 1
+            return self._profiled(phase, fn, *a, **kw)
+        finally:
+            result.timings[phase] = result.timings.get(phase, 0.0) + time.perf_counter() - start
+
+    def load_feed(self):
+        if callable(self.feed):
+            return self.feed()
+        if isinstance(self.feed, (bytes, bytearray)):
+            return bytes(self.feed)
+        if self.options.mirrors and not is_local_source(self.feed):
+            stats = SourceStats(self.options.data_dir)
+            try:
+                return HedgedFetcher([self.feed, *self.options.mirrors], session=self.session, stats=stats,
+                                     hedge_percentile=self.options.hedge_percentile).fetch()
+            finally:
+                stats.save()
+        return fetch_ics(self.feed, session=self.session)
+
+    def load_records(self, result=None):
+        """
+        Fetch, filter, parse and convert the feed into convert_event() records (reusing cached
+        blocks with --block-cache). Returns (records, UIDs dropped by the filter, number dropped).
+        """
+        opts = self.options
+        result = result if result is not None else SyncResult()
+        ics_bytes = self._timed(result, "fetch", self.load_feed)
+        result.feed_digest = hashlib.sha1(ics_bytes).hexdigest()
+        dropped_uids, filtered = set(), 0
+        if opts.feed_filter:
+            ics_bytes, dropped_uids, reasons = self._timed(result, "filter", opts.feed_filter.apply, ics_bytes)
+            filtered = sum(reasons.values())
+        cache = BlockCache(opts.data_dir, self.feed_key, opts.block_cache_runs) if opts.block_cache else None
+        if cache:
+            cached, ics_bytes, miss_keys = self._timed(result, "cache", cache.split, ics_bytes)
+        ics_events = self._timed(result, "parse", lambda: list(parse_ics(ics_bytes)))
+        records = self._timed(result, "convert", lambda: [convert_event(ev) for ev in ics_events])
+        if cache:
+            cache.store(miss_keys, records)
+            cache.save()
+            records = [refresh_recurrence(r) for r in cached] + records
+        return exclude_overrides(records), dropped_uids, filtered
+
+    def run(self):
+        """Fetch, parse and convert the feed once, then sync it into every target calendar."""
+        return contextvars.copy_context().run(self._run)
+
+    def _run(self):
+        _quota_var.set(self.quota)
+        _rrule_checker_var.set(self.rrule_checker)
+        self.rrule_checker.take_failures()  # report only this run's
+        opts = self.options
+        self.deadline = time.monotonic() + opts.max_runtime if opts.max_runtime else None
+        result = SyncResult()
+        started = time.perf_counter()
+
+        with ExitStack() as locks:
+            targets = self._open_targets(result, locks)
+            # Google-side listing (and the token refresh its first call triggers) runs
+            # while the feed downloads and parses; the two only meet at diff time
+            io = ThreadPoolExecutor(max_workers=max(1, len(targets)))
+            try:
+                for target in targets:
+                    self._start_prefetch(io, target)
+                try:
+                    records, dropped_uids, filtered = self.load_records(result)
+                    # Filtered events are out of scope: pruning must not delete their Google copies
+                    feed_uids = {r["uid"] for r in records if r["uid"]} | dropped_uids
+                    entries, skipped = self._timed(result, "queue", queue_entries, records, future_only=opts.future_only)
+                except Exception as ex:
+                    result.errors.append(("feed", str(ex)))
+                    targets = []
+
+                for target in targets:
+                    target["entries"], target["skipped"], target["filtered"] = entries, skipped, filtered
+                if targets and opts.shard_by:
+                    if len(targets) < len(self.calendar_ids):
+                        result.errors.append(("shards", "some shard calendars are locked by another run"))
+                        targets = []
+                    else:
+                        self._timed(result, "shard", self._assign_shards, targets, records, entries)
+                if targets and opts.dedup:
+                    self._timed(result, "dedup", self._claim_events, targets, records)
+
+                if len(targets) == 1 or (targets and self.profiler):
+                    for target in targets:
+                        self._collect(result, target["calendar_id"], self._sync_target, target, feed_uids)
+                elif targets:
+                    workers = max(1, min(opts.fanout_workers, len(targets)))
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        futures = {t["calendar_id"]: _submit(pool, self._sync_target, t, feed_uids)
+                                   for t in targets}
+                    for calendar_id, future in futures.items():
+                        self._collect(result, calendar_id, future.result)
+            finally:
+                io.shutdown(wait=True)
+
+        # Series that could not be expanded or repaired were synced as their first instance only
+        for rule, message in self.rrule_checker.take_failures():
+            result.errors.append(("rrule", f"{rule}: {message}"))
+        result.timings["list"] = sum(t.get("list_seconds", 0.0) for t in targets)
+        result.timings["sync"] = sum(c.seconds for c in result.calendars.values())
+        result.timings["total"] = time.perf_counter() - started
+        return result
+
+    def stop(self):
+        """Make a running sync stop writing at its next check; the rest is deferred as at --max-runtime."""
+        self.stopped = True
+
+    def _stop_reason(self):
+        if self.stopped:
+            return "run stopped"
+        if self.deadline and time.monotonic() >= self.deadline:
+            return "--max-runtime reached"
+        return None
+
+    def _collect(self, result, calendar_id, fn, *args):
+        """Store fn(*args) as calendar_id's result; a failed sync is reported in result.errors."""
+        try:
+            result.calendars[calendar_id] = fn(*args)
         except Exception as ex:
-            error_msg = str(ex).lower()
-            operation = 'update' if existing_id else 'create'
-            
-            # If it's a recurrence-related error, try without recurrence
-            if "recurrence" in error_msg or "rrule" in error_msg:
-                print(f"[error] {operation} failed due to recurrence rule: {ex}")
-                if "recurrence" in payload and payload["recurrence"]:
-                    print(f"[retry] Retrying {uid} without recurrence")
-                    payload_no_recur = payload.copy()
-                    payload_no_recur.pop("recurrence", None)
+            print(f"[error] sync to {calendar_id} failed: {ex}", file=sys.stderr)
+            result.errors.append((calendar_id, str(ex)))
+            result.calendars[calendar_id] = CalendarResult(calendar_id)
+
+    def _open_targets(self, result, locks):
+        """Lock each target calendar and load its checkpoint. Locked calendars are reported and left out."""
+        targets = []
+        for calendar_id in self.calendar_ids:
+            try:
+                locks.enter_context(calendar_lock(self.options.data_dir, calendar_id))
+            except BlockingIOError:
+                print(f"[lock] another sync is already running for {calendar_id}, skipping it", file=sys.stderr)
+                result.calendars[calendar_id] = CalendarResult(calendar_id, locked=True)
+                continue
+            # Fan-out: each target gets its own client (httplib2 transports are not thread-safe)
+            service = self.service if len(self.calendar_ids) == 1 else self.service_factory()
+            checkpoint = None
+            if not self.options.dry_run:
+                checkpoint = SyncCheckpoint(self.options.data_dir, calendar_id, self.feed_key)
+                if checkpoint.load():
+                    print(f"[resume] {calendar_id}: continuing from checkpoint, {len(checkpoint.done)} events already written")
+            verifier = None
+            if self.options.verify_sample:
+                verifier = DriftVerifier(self.options.data_dir, calendar_id, self.options.verify_sample,
+                                         self.options.drift_threshold)
+            targets.append({"calendar_id": calendar_id, "service": service, "checkpoint": checkpoint,
+                            "listing": None, "has_synced": None, "verifier": verifier})
+        return targets
+
+    def _start_prefetch(self, io, target):
+        checkpoint = target["checkpoint"]
+        if target["verifier"] and target["verifier"].ready:
+            return  # the saved id map and a sample replace the listing
+        if self.options.bulk_import:
+            fn, args = calendar_has_synced_events, (target["service"], target["calendar_id"])
+        elif not (checkpoint and checkpoint.listing is not None):
+            fn, args = self._list_synced, (target,)
+        else:
+            return
+        if self.profiler:
+            # Listed inline on this thread so the phase can be profiled
+            future = Future()
+            try:
+                future.set_result(self._profiled(f"list:{target['calendar_id']}", fn, *args))
+            except Exception as ex:
+                future.set_exception(ex)
+        else:
+            future = _submit(io, fn, *args)
+        target["has_synced" if self.options.bulk_import else "listing"] = future
+
+    def _list_synced(self, target):
+        started = time.perf_counter()
+        try:
+            return {e.get("extendedProperties", {}).get("private", {}).get("icsUid"): e.get("id")
+                    for e in get_all_synced_google_events(target["service"], target["calendar_id"])}
+        finally:
+            target["list_seconds"] = target.get("list_seconds", 0.0) + time.perf_counter() - started
+
+    def _assign_shards(self, targets, records, entries):
+        """
+        Split entries across the shard calendars by a stable key, then relocate synced events
+        that now belong to another shard (or sit in a retired one) with events().move(),
+        keeping their ids.
+        """
+        opts = self.options
+        shard_ids = [t["calendar_id"] for t in targets if t["calendar_id"] not in opts.retired_shards]
+        keys = shard_keys(records, opts.shard_by)
+        by_id = {t["calendar_id"]: t for t in targets}
+        assigned = {cid: [] for cid in shard_ids}
+        home = {uid: shard_for(key, shard_ids) for uid, key in keys.items()}
+        for entry in entries:
+            assigned[home[entry[4]]].append(entry)
+        for i, target in enumerate(targets):
+            target["entries"] = assigned.get(target["calendar_id"], [])
+            heapq.heapify(target["entries"])
+            # Every feed event of the shard, queued or not, for --dedup claims
+            target["records"] = [r for r in records if home.get(r["uid"]) == target["calendar_id"]]
+            # Feed-level skips are reported once, on the first shard
+            if i:
+                target["skipped"] = target["filtered"] = 0
+
+        listings = {t["calendar_id"]: self._shard_listing(t) for t in targets}
+        unmoved = {cid: set() for cid in by_id}
+        deferred = 0
+        for source, listing in listings.items():
+            for uid, event_id in list(listing.items()):
+                destination = home.get(uid)
+                if not destination or destination == source:
+                    continue
+                # A move is a write like any other
+                if self._stop_reason() or (self.quota and not self.quota.can_spend(1)):
+                    unmoved[destination].add(uid)
+                    deferred += 1
+                    continue
+                print(f"[move] {uid} -> {event_id}: {source} => {destination}")
+                if not opts.dry_run:
                     try:
-                        if existing_id:
-                            gcal_upsert_event(service, args.calendar_id, payload_no_recur, existing_event_id=existing_id)
-                            updated += 1
-                        else:
-                            gcal_upsert_event(service, args.calendar_id, payload_no_recur, existing_event_id=None)
-                            created += 1
-                        print(f"[success] {operation.capitalize()}d {uid} without recurrence")
-                        continue
-                    except Exception as ex2:
-                        print(f"[error] Still failed to {operation} {uid}: {ex2}")
-                        skipped += 1
+                        gcal_move_event(by_id[source]["service"], source, event_id, destination)
+                    except Exception as ex:
+                        print(f"[error] Failed to move {uid}: {ex}")
+                        unmoved[destination].add(uid)
                         continue
+                del listing[uid]
+                listings[destination][uid] = event_id
+                by_id[destination]["moved"] = by_id[destination].get("moved", 0) + 1
+                # --bulk-import: a shard that received events is no longer empty
+                by_id[destination]["has_synced"] = _resolved(True)
+        if deferred:
+            why = self._stop_reason() or "quota budget spent"
+            print(f"[move] {why}, {deferred} moves deferred to the next run")
+        for target in targets:
+            # Events still in their old shard are not written to the new one this run (that
+            # would duplicate them); they count as deferred and move on a later run
+            held = unmoved[target["calendar_id"]]
+            if held:
+                entries = [e for e in target["entries"] if e[4] not in held]
+                heapq.heapify(entries)
+                target["deferred"] = len(target["entries"]) - len(entries)
+                target["entries"] = entries
+
+    def _shard_listing(self, target):
+        """A shard's synced events (uid -> event id) before any writes, for relocating events."""
+        checkpoint = target["checkpoint"]
+        if checkpoint and checkpoint.listing is not None:
+            return checkpoint.listing
+        if target["listing"]:
+            return target["listing"].result()
+        if target["has_synced"]:
+            # --bulk-import: a shard with synced events falls back to a normal sync, which
+            # reuses this listing; an empty one has nothing to move out
+            listing = self._list_synced(target) if target["has_synced"].result() else {}
+            target["listing"] = _resolved(listing)
+            return listing
+        # --verify-sample: the saved id map stands in for the listing
+        target["id_map"] = load_id_map(self.options.data_dir, target["calendar_id"])
+        return target["id_map"]
+
+    def _claim_events(self, targets, records):
+        """
+        --dedup: claim this feed's events in each calendar's index and drop the queued ones
+        another feed sharing the calendar owns. Claims cover every event of the feed (of the
+        shard, with --shard-by), also those not queued this run: past ones with --future-only
+        are still carried by this feed.
+        """
+        opts = self.options
+        for target in targets:
+            index = DedupIndex(opts.data_dir, target["calendar_id"], opts.dedup, opts.dedup_ttl)
+            foreign_keys, target["foreign_uids"] = index.claim(
+                self.feed_key, target.get("records", records), priority=opts.feed_priority)
+            if foreign_keys:
+                entries = [e for e in target["entries"] if dedup_key(records[e[1]]) not in foreign_keys]
+                heapq.heapify(entries)
+                target["deduped"] = len(target["entries"]) - len(entries)
+                target["entries"] = entries
+                print(f"[dedup] {target['calendar_id']}: {target['deduped']} events are owned by other feeds")
+            if not opts.dry_run:
+                index.save()
+
+    def _sync_target(self, target, feed_uids):
+        started = time.perf_counter()
+        res = self._profiled(f"sync:{target['calendar_id']}", self._sync_calendar, target, feed_uids)
+        res.seconds = time.perf_counter() - started
+        return res
+
+    def _sync_calendar(self, target, feed_uids):
+        opts = self.options
+        service, calendar_id, checkpoint = target["service"], target["calendar_id"], target["checkpoint"]
+        entries = target["entries"]
+        res = CalendarResult(calendar_id, skipped=target["skipped"], moved=target.get("moved", 0),
+                             filtered=target["filtered"], deduped=target.get("deduped", 0),
+                             deferred=target.get("deferred", 0))
+
+        # Write queue ordered by how soon each event next occurs (shared entries are never mutated)
+        queue = list(entries)
+        if checkpoint and checkpoint.done:
+            queue = [e for e in queue if not checkpoint.is_done(e[4], e[5])]
+            res.skipped += len(entries) - len(queue)
+            heapq.heapify(queue)
+
+        verifier = target["verifier"]
+        incremental = verifier is not None and verifier.ready
+        if opts.bulk_import and not incremental:
+            has_synced = target["has_synced"]
+            if has_synced.result():
+                print(f"[bulk] {calendar_id} already has synced events, falling back to a normal sync")
+            else:
+                return self._bulk_import(service, res, queue, checkpoint)
+
+        # Google-side uid -> event id map: used for pruning, updated as writes land
+        # (reused from the checkpoint on resume)
+        if checkpoint and checkpoint.listing is not None:
+            id_map = dict(checkpoint.listing)
+            for uid, entry in checkpoint.done.items():
+                if entry["fp"] == "pruned" or entry["deleted"] or not entry["id"]:
+                    id_map.pop(uid, None)
                 else:
-                    print(f"[error] Recurrence error but no recurrence in payload: {ex}")
-                    skipped += 1
-                    continue
+                    id_map[uid] = entry["id"]
+        elif incremental:
+            id_map = target["id_map"] if "id_map" in target else load_id_map(opts.data_dir, calendar_id)
+            if self._verify_sample(service, res, verifier, queue, id_map):
+                incremental = False
+                id_map = self._list_synced(target)
+            if checkpoint:
+                checkpoint.record_listing(id_map)
+        else:
+            id_map = target["listing"].result() if target["listing"] else self._list_synced(target)
+            if checkpoint:
+                checkpoint.record_listing(id_map)
+        if incremental:
+            # Only events that changed since they were last written need a lookup
+            changed = [e for e in queue if not verifier.unchanged(e[4], e[5])]
+            res.skipped += len(queue) - len(changed)
+            queue = changed
+            heapq.heapify(queue)
+        queue = self._guard_deletes(res, queue, id_map, feed_uids | target.get("foreign_uids", set()), len(feed_uids))
+
+        try:
+            res.deferred += self._drain_write_queue(service, res, queue, checkpoint, id_map, verifier)
+        except BaseException:
+            if checkpoint:
+                checkpoint.flush()
+            raise
+
+        # Prune events that exist in Google but not in current ICS feed
+        if opts.prune_missing and res.deferred:
+            print(f"[prune] {calendar_id}: skipped, run stopped before all writes were done (deadline or quota)")
+        elif opts.prune_missing and not res.held:
+            # Events another feed still carries are not ours to prune
+            res.deferred += self._prune_missing(service, res, id_map, feed_uids | target.get("foreign_uids", set()),
+                                                checkpoint)
+
+        if not opts.dry_run:
+            save_id_map(opts.data_dir, calendar_id, id_map)
+            if verifier:
+                if not res.held:  # events held back from pruning are still in Google
+                    verifier.retain(feed_uids)
+                verifier.save()
+        if checkpoint:
+            if res.deferred:
+                checkpoint.flush()
             else:
-                print(f"[error] Failed to {operation} {uid}: {ex}")
-                skipped += 1
+                checkpoint.finish()
+
+        self._print_done(res)
+        return res
+
+    def _print_done(self, res):
+        label = f"Done [{res.calendar_id}]." if len(self.calendar_ids) > 1 else "Done."
+        print(f"{label} {res.summary()}")
+
+    def _bulk_import(self, service, res, queue, checkpoint):
+        """Cold start: stream every queued payload into batched inserts and record the id map."""
+        opts = self.options
+        items = [entry[2:5] for entry in sorted(queue)]
+        print(f"[bulk] {res.calendar_id} has no synced events, importing {len(items)} events in batches")
+        if opts.dry_run:
+            res.created += len({uid for _, status, uid in items if status != "CANCELLED"})
+        else:
+            id_map, failed, deferred = bulk_import(service, res.calendar_id, items, workers=opts.bulk_workers,
+                                                   deterministic_ids=opts.deterministic_ids, stop_reason=self._stop_reason)
+            res.created += len(id_map)
+            res.deferred += deferred
+            res.skipped += failed
+            if failed:
+                res.errors.append(("bulk", f"{failed} inserts failed"))
+            save_id_map(opts.data_dir, res.calendar_id, id_map)
+        if checkpoint:
+            checkpoint.finish()
+        self._print_done(res)
+        return res
+
+    def deletion_guard(self, calendar_id):
+        """The deletion circuit breaker for this feed in calendar_id, set up from the options."""
+        opts = self.options
+        return DeletionGuard(opts.data_dir, calendar_id, self.feed_key, opts.max_delete_fraction,
+                             opts.min_feed_ratio, opts.force)
 
-    # Prune events that exist in Google but not in current ICS feed
-    if args.prune_missing:
-        for uid, g_event in existing_synced.items():
+    def _guard_deletes(self, res, queue, id_map, keep_uids, feed_size):
+        """
+        Deletion circuit breaker: if this run's prunes and cancellations look like a broken
+        feed rather than real changes, hold them back. Returns the write queue to drain.
+        """
+        opts = self.options
+        prunes = sum(1 for uid in id_map if uid and uid not in keep_uids) if opts.prune_missing else 0
+        cancels = {e[4] for e in queue if e[3] == "CANCELLED" and e[4] in id_map}
+        guard = self.deletion_guard(res.calendar_id)
+        allowed, reason = guard.check(feed_size, prunes + len(cancels), len(id_map))
+        if not opts.dry_run:
+            guard.save()
+        if allowed:
+            if reason:
+                print(f"[guard] {res.calendar_id}: {reason}")
+            return queue
+        res.held = prunes + len(cancels)
+        until = ("until later fetches confirm the smaller feed (or a run with --force)" if guard.hold["shrink"]
+                 else "until a run with --force")
+        print(f"[guard] {res.calendar_id}: {reason}; holding back {prunes} prunes and {len(cancels)} cancellations "
+              f"{until}", file=sys.stderr)
+        if not cancels:
+            return queue
+        queue = [e for e in queue if e[4] not in cancels]
+        heapq.heapify(queue)
+        return queue
+
+    def _verify_sample(self, service, res, verifier, queue, id_map):
+        """
+        Fetch a random sample of synced, unchanged events by id and compare them with the feed.
+        Drifted ones are left in the write queue to be repaired; returns True if drift is above
+        the threshold and a full reconcile is needed.
+        """
+        opts = self.options
+        calendar_id = res.calendar_id
+        live = {e[4]: e for e in queue if e[3] != "CANCELLED" and e[4] in id_map and verifier.unchanged(e[4], e[5])}
+        sample = verifier.sample(live)
+        if not sample or (self.quota and not self.quota.can_spend(len(sample))):
+            return False
+        jobs = [(uid, lambda event_id=id_map[uid]: service.events().get(calendarId=calendar_id, eventId=event_id))
+                for uid in sample]
+        drifted, checked = [], 0
+        for uid, (event, ex) in gcal_batch_execute(service, jobs, "events.get", workers=opts.bulk_workers).items():
+            if ex is not None and http_status(ex) not in (404, 410):
+                continue  # could not be checked
+            checked += 1
+            if ex is not None or event.get("status") == "cancelled" or events_differ(live[uid][2], event):
+                drifted.append(uid)
+
+        (rate, low, high), escalate = verifier.assess(len(drifted), checked, len(live))
+        res.verified, res.drifted = checked, len(drifted)
+        print(f"[verify] {calendar_id}: {len(drifted)}/{checked} sampled events drifted, {rate:.1%} "
+              f"(95% CI {low:.1%}-{high:.1%}, about {round(low * len(live))}-{round(high * len(live))} "
+              f"of {len(live)} events)")
+        if escalate:
+            print(f"[verify] {calendar_id}: drift above {verifier.threshold:.0%}, running a full reconcile")
+            return True
+        # No longer known to match Google: the drain repairs them like changed events,
+        # under the same quota and deadline checks (and a deferred one stays changed)
+        for uid in drifted:
+            verifier.forget(uid)
+        return False
+
+    def _drain_write_queue(self, service, res, queue, checkpoint, id_map, verifier=None):
+        """Write queued events soonest-first. Returns how many were deferred to the next run."""
+        opts = self.options
+        calendar_id = res.calendar_id
+        while queue:
+            reason = self._stop_reason()
+            if reason:
+                print(f"[deadline] {reason}, deferring {len(queue)} events to the next run")
+                return len(queue)
+            # One lookup plus at most one write per event
+            if self.quota and not self.quota.can_spend(2):
+                print(f"[quota] budget spent, deferring {len(queue)} events to the next run")
+                return len(queue)
+            entry = heapq.heappop(queue)
+            _, _, payload, status, uid, fingerprint = entry
+
+            # Look up existing
+            event_id = None
+            if opts.deterministic_ids:
+                # Known events are fetched by id; unknown ones go straight to an insert under the derived id
+                event_id = ics_event_id(calendar_id, uid)
+                known_id = id_map.get(uid)
+                if not known_id and checkpoint and checkpoint.is_uncertain(uid):
+                    # The interrupted run may have created it under the derived id
+                    known_id = event_id
+                existing = gcal_get_event(service, calendar_id, known_id) if known_id else None
+            else:
+                lookup = gcal_find_by_ics_uid(service, calendar_id, uid)
+                items = lookup.get("items", [])
+                existing = items[0] if items else None
+
+            if checkpoint:
+                checkpoint.intend(uid)
+            action, google_id = sync_event(service, calendar_id, payload, status, uid, existing=existing,
+                                           dry_run=opts.dry_run, event_id=event_id, errors=res.errors)
+            if action == "quota":
+                heapq.heappush(queue, ((-1, 0.0),) + entry[1:])
+                continue
+            if action == "failed":
+                res.skipped += 1
+                continue
+            setattr(res, action, getattr(res, action) + 1)
+            if action == "deleted":
+                id_map.pop(uid, None)
+            elif google_id:
+                id_map[uid] = google_id
+            if verifier:
+                # What Google now holds for this UID (also for "skipped": it already matched)
+                if action == "deleted":
+                    verifier.forget(uid)
+                else:
+                    verifier.record(uid, fingerprint)
+            if checkpoint:
+                checkpoint.complete(uid, google_id, fingerprint, deleted=action == "deleted")
+        return 0
+
+    def _prune_missing(self, service, res, id_map, feed_uids, checkpoint):
+        """Delete synced Google events whose UID left the feed. Returns how many deletes were deferred."""
+        deferred = 0
+        for uid, ev_id in list(id_map.items()):
             if uid and uid not in feed_uids:
-                ev_id = g_event["id"]
+                if checkpoint and checkpoint.is_done(uid, "pruned"):
+                    continue
+                if self._stop_reason() or (self.quota and not self.quota.can_spend(1)):
+                    deferred += 1
+                    continue
                 print(f"[prune-delete] {uid} -> {ev_id} (missing from feed)")
-                if not args.dry_run:
-                    gcal_delete_event(service, args.calendar_id, ev_id)
-                deleted += 1
+                if checkpoint:
+                    checkpoint.intend(uid)
+                if not self.options.dry_run:
+                    try:
+                        gcal_delete_event(service, res.calendar_id, ev_id)
+                    except Exception as ex:
+                        print(f"[error] Failed to prune {uid}: {ex}")
+                        res.errors.append((uid, f"prune failed: {ex}"))
+                        continue
+                res.deleted += 1
+                id_map.pop(uid, None)
+                if checkpoint:
+                    checkpoint.complete(uid, ev_id, "pruned")
+        if deferred:
+            why = self._stop_reason() or "quota budget spent"
+            print(f"[prune] {why}, {deferred} prune deletes deferred to the next run")
+        return deferred
+
+def add_transport_args(parser):
+    """Flags choosing the HTTP transport of the Calendar client (see service_from_args)."""
+    parser.add_argument("--transport", choices=TRANSPORTS, default="httplib2", help="HTTP transport for Calendar API calls; pooled shares keep-alive connections across threads")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Keep-alive connections per host for --transport pooled")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT, help="Seconds to wait for a connection with --transport pooled")
+    parser.add_argument("--http-timeout", type=float, default=DEFAULT_READ_TIMEOUT, help="Seconds to wait for a response with --transport pooled")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Sync an ICS public feed into a Google Calendar.")
+    parser.add_argument("--ics-url", required=True, help="Public ICS feed URL, or a local .ics file (path or file:// URL), a directory of .ics files merged into one feed, or - for stdin")
+    parser.add_argument("--calendar-id", required=True, nargs="+", help="Target Google Calendar ID(s) (e.g., primary or you@domain.com); several ids (space or comma separated) fan the feed out to each")
+    parser.add_argument("--ics-mirror", action="append", default=[], metavar="URL", help="Another URL serving the same feed (repeatable); a slow or failing source is hedged with the next one")
+    parser.add_argument("--hedge-percentile", type=float, default=90.0, help="Send a hedged request to the next mirror once a fetch is slower than this latency percentile of its source")
+    parser.add_argument("--credentials", default="credentials.json", help="Google OAuth client secrets file")
+    parser.add_argument("--token", default="token.json", help="Cached OAuth token file")
+    add_transport_args(parser)
+    parser.add_argument("--prune-missing", action="store_true", help="Delete Google events (with icsUid) not present in the current feed")
+    parser.add_argument("--max-delete-fraction", type=float, default=0.2, help="Hold back a run's prunes and cancellations if they would delete more than this share of the synced events")
+    parser.add_argument("--min-feed-ratio", type=float, default=0.5, help="Hold back a run's prunes and cancellations if the feed has fewer than this share of its usual events")
+    parser.add_argument("--force", action="store_true", help="Delete even if the deletion guard trips")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing to Google")
+    parser.add_argument("--future-only", action="store_true", help="Only sync events that start in the future (skip past events)")
+    parser.add_argument("--max-runtime", type=float, default=None, help="Stop writing after this many seconds; remaining events are left for the next run")
+    parser.add_argument("--deterministic-ids", action="store_true", help="Derive Google event ids from the ICS UID so inserts are idempotent and need no lookup")
+    parser.add_argument("--bulk-import", action="store_true", help="If the calendar has no synced events, insert the whole feed in concurrent batches without diffing")
+    parser.add_argument("--bulk-workers", type=int, default=4, help="Concurrent batch requests for --bulk-import")
+    parser.add_argument("--fanout-workers", type=int, default=8, help="Target calendars written concurrently when several --calendar-id values are given")
+    parser.add_argument("--profile", metavar="DIR", default=None, help="Profile each phase with cProfile and tracemalloc, writing pstats, allocation reports and summary.txt to DIR")
+    parser.add_argument("--shard-by", choices=SHARD_KEYS, default=None, help="Treat the --calendar-id values as shards and spread the feed across them by this key")
+    parser.add_argument("--retire-shard", nargs="+", default=[], metavar="CALENDAR_ID", help="With --shard-by: move this former shard's events to the --calendar-id shards and write nothing new to it")
+    parser.add_argument("--exclude-summary", metavar="REGEX", default=None, help="Drop events whose SUMMARY matches this regex (case-insensitive) before parsing")
+    parser.add_argument("--exclude-category", metavar="REGEX", default=None, help="Drop events with a CATEGORIES value matching this regex")
+    parser.add_argument("--exclude-status", nargs="+", default=[], metavar="STATUS", help="Drop events with these STATUS values (e.g. TENTATIVE CANCELLED)")
+    parser.add_argument("--exclude-class", nargs="+", default=[], metavar="CLASS", help="Drop events with these CLASS values (e.g. PRIVATE CONFIDENTIAL)")
+    parser.add_argument("--exclude-transp", nargs="+", default=[], metavar="TRANSP", help="Drop events with these TRANSP values (e.g. TRANSPARENT)")
+    parser.add_argument("--exclude-organizer", metavar="REGEX", default=None, help="Drop events whose ORGANIZER (address or CN) matches this regex")
+    parser.add_argument("--block-cache", action="store_true", help="Cache converted events by a hash of their raw VEVENT block and skip parsing unchanged ones")
+    parser.add_argument("--block-cache-runs", type=int, default=5, help="Evict cached blocks not seen in the feed for this many runs")
+    parser.add_argument("--dedup", choices=DEDUP_PRECEDENCE, default=None, help="Several feeds share the target calendar(s): write each event from one owning feed only, chosen by this rule")
+    parser.add_argument("--feed-priority", type=int, default=0, help="This feed's rank for --dedup priority (highest wins)")
+    parser.add_argument("--dedup-ttl", type=int, default=DEDUP_TTL, help="Seconds after which a feed that stopped running releases its events under --dedup")
+    parser.add_argument("--verify-sample", type=int, default=None, metavar="N", help="After one full run, skip the calendar listing: write only changed events and check N random synced events by id for drift")
+    parser.add_argument("--drift-threshold", type=float, default=0.02, help="Sampled drift rate above which --verify-sample falls back to a full reconcile")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt this feed's polling interval to how often it changes; runs before the feed is due exit without syncing")
+    parser.add_argument("--min-interval", type=int, default=900, help="Shortest adaptive polling interval in seconds")
+    parser.add_argument("--max-interval", type=int, default=86400, help="Longest adaptive polling interval in seconds")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory for persistent state (quota ledger, checkpoints)")
+    parser.add_argument("--quota-budget", type=int, default=None, help="Maximum Calendar API calls this run may make; remaining work is deferred")
+    parser.add_argument("--daily-quota", type=int, default=None, help="Project-wide API calls allowed per rolling 24h, shared by all runs via the ledger")
+    return parser
+
+def split_calendar_ids(values):
+    """--calendar-id values, which may themselves be comma separated."""
+    return [c.strip() for value in values for c in value.split(",") if c.strip()]
+
+def options_from_args(args):
+    return SyncOptions(
+        prune_missing=args.prune_missing,
+        dry_run=args.dry_run,
+        future_only=args.future_only,
+        max_runtime=args.max_runtime,
+        deterministic_ids=args.deterministic_ids,
+        bulk_import=args.bulk_import,
+        bulk_workers=args.bulk_workers,
+        fanout_workers=args.fanout_workers,
+        shard_by=args.shard_by,
+        retired_shards=split_calendar_ids(args.retire_shard),
+        data_dir=args.data_dir,
+        mirrors=args.ics_mirror,
+        hedge_percentile=args.hedge_percentile,
+        block_cache=args.block_cache,
+        block_cache_runs=args.block_cache_runs,
+        dedup=args.dedup,
+        feed_priority=args.feed_priority,
+        dedup_ttl=args.dedup_ttl,
+        verify_sample=args.verify_sample,
+        drift_threshold=args.drift_threshold,
+        max_delete_fraction=args.max_delete_fraction,
+        min_feed_ratio=args.min_feed_ratio,
+        force=args.force,
+        feed_filter=FeedFilter(summary=args.exclude_summary, category=args.exclude_category,
+                               status=args.exclude_status, classes=args.exclude_class,
+                               transp=args.exclude_transp, organizer=args.exclude_organizer) or None,
+    )
+
+def print_result(result, calendar_ids):
+    """Report engine-level errors and, for several calendars, the totals. Returns True if the run was clean."""
+    for source, message in result.errors:
+        print(f"[error] {source}: {message}", file=sys.stderr)
+    if len(calendar_ids) > 1:
+        print(f"All {len(calendar_ids)} calendars: created={result.total('created')}, updated={result.total('updated')}, "
+              f"deleted={result.total('deleted')}, skipped={result.total('skipped')}, deferred={result.total('deferred')}, "
+              f"moved={result.total('moved')}, filtered={result.total('filtered')}, deduped={result.total('deduped')}, "
+              f"held={result.total('held')}")
+    return not result.errors and not any(c.locked for c in result.calendars.values())
+
+def feed_schedule(args):
+    """The adaptive FeedSchedule for a run's feed, or None without --adaptive."""
+    if not args.adaptive:
+        return None
+    return FeedSchedule(args.data_dir, args.ics_url, args.min_interval, args.max_interval)
+
+def record_schedule(schedule, result):
+    """Feed a finished run into the adaptive schedule. Returns the next interval in seconds."""
+    changed = result.total("created") + result.total("updated") + result.total("deleted")
+    # Only feed-level failures count; a single bad event should not pin the feed to the shortest interval
+    clean = bool(result.feed_digest) and not result.errors and not any(c.locked for c in result.calendars.values())
+    interval = schedule.record(result.feed_digest, changed, ok=clean, pending=result.total("deferred"))
+    print(f"[schedule] {changed} events changed; {schedule.describe()}")
+    return interval
+
+def main():
+    args = build_arg_parser().parse_args()
+    calendar_ids = split_calendar_ids(args.calendar_id)
+    schedule = feed_schedule(args)
+    if schedule and not schedule.due():
+        print(f"[schedule] feed not due yet: {schedule.describe()}")
+        return
+    quota = QuotaLedger(args.data_dir, run_budget=args.quota_budget, daily_limit=args.daily_quota)
+    options = options_from_args(args)
+    service = service_from_args(args)
+    rrule_checker = RRuleChecker(args.data_dir)
+    profiler = PhaseProfiler(args.profile) if args.profile else None
+    engine = SyncEngine(service, args.ics_url, calendar_ids, options, quota=quota,
+                        service_factory=lambda: service_from_args(args),
+                        profiler=profiler, rrule_checker=rrule_checker)
+    try:
+        result = engine.run()
+    finally:
+        quota.save()
+        rrule_checker.save()
+        print(f"[quota] {quota.summary()}")
+    if schedule and not args.dry_run:
+        record_schedule(schedule, result)
 
-    print(f"Done. created={created}, updated={updated}, deleted={deleted}, skipped={skipped}")
+    if profiler:
+        print(f"[profile] per-phase results written to {args.profile}")
+        print(profiler.write_summary(), end="")
+    if not print_result(result, calendar_ids):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
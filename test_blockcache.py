@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test --block-cache: reuse of unchanged blocks, eviction after --block-cache-runs, and VTIMEZONE invalidation
+"""
+from blockcache import BlockCache
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions
+
+def load(data_dir, feed, runs=5):
+    engine = SyncEngine(None, feed, ["cal"], SyncOptions(data_dir=data_dir, block_cache=True, block_cache_runs=runs))
+    records, _, _ = engine.load_records()
+    return {r["uid"]: r for r in records}
+
+def cache(data_dir):
+    return BlockCache(data_dir, SyncEngine(None, b"", ["cal"], SyncOptions(data_dir=data_dir)).feed_key)
+
+def with_timezone(feed, offset):
+    vtimezone = ("BEGIN:VTIMEZONE\r\nTZID:Office\r\nBEGIN:STANDARD\r\nDTSTART:19700101T000000\r\n"
+                 f"TZOFFSETFROM:{offset}\r\nTZOFFSETTO:{offset}\r\nEND:STANDARD\r\nEND:VTIMEZONE\r\n")
+    return feed.replace(b"PRODID:-//test//EN\r\n", b"PRODID:-//test//EN\r\n" + vtimezone.encode())
+
+def test_unchanged_blocks_are_reused(tmp_path):
+    data_dir = str(tmp_path)
+    first = load(data_dir, ics_feed(vevent("a"), vevent("b")))
+    feed = ics_feed(vevent("a"), vevent("b", summary="renamed"))
+    c = cache(data_dir)
+    cached, remaining, keys = c.split(feed)
+    assert [r["uid"] for r in cached] == ["a"] and len(keys) == 1 and b"UID:a" not in remaining
+    assert load(data_dir, feed) == dict(first, b=load(str(tmp_path / "fresh"), feed)["b"])
+
+def test_unseen_blocks_are_evicted(tmp_path):
+    data_dir = str(tmp_path)
+    load(data_dir, ics_feed(vevent("a"), vevent("b")), runs=2)
+    load(data_dir, ics_feed(vevent("a")), runs=2)
+    assert len(cache(data_dir).entries) == 2  # b was seen one run ago
+    load(data_dir, ics_feed(vevent("a")), runs=2)
+    assert len(cache(data_dir).entries) == 1  # not seen for 2 runs: gone
+
+    # b coming back is parsed again, not taken from a stale entry
+    c = cache(data_dir)
+    cached, _, keys = c.split(ics_feed(vevent("a"), vevent("b")))
+    assert [r["uid"] for r in cached] == ["a"] and len(keys) == 1
+
+def test_timezone_change_invalidates_the_cache(tmp_path):
+    data_dir = str(tmp_path)
+    start = ("DTSTART;TZID=Office:20300101T100000", "DTEND;TZID=Office:20300101T110000")
+    block = vevent("a").replace("DTSTART:20300101T100000Z\r\nDTEND:20300101T110000Z\r\n", "\r\n".join(start) + "\r\n")
+    plus1 = load(data_dir, with_timezone(ics_feed(block), "+0100"))
+    assert load(data_dir, with_timezone(ics_feed(block), "+0100")) == plus1
+    assert cache(data_dir).split(with_timezone(ics_feed(block), "+0100"))[0]
+
+    # Same VEVENT bytes, but the zone they refer to moved: nothing cached may be reused
+    feed = with_timezone(ics_feed(block), "+0300")
+    c = cache(data_dir)
+    assert c.split(feed)[0] == [] and (c.hits, c.misses) == (0, 1)
+    assert load(data_dir, feed) == load(str(tmp_path / "fresh"), feed)
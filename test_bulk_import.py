@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test --bulk-import: modified instances and repeated UIDs, quota and deadline deferral
+"""
+from conftest import ics_feed, vevent
+from quota import QuotaLedger
+from sync import bulk_import, convert_event, parse_ics, set_quota_ledger
+
+def feed_items(*events):
+    records = [convert_event(ev) for ev in parse_ics(ics_feed(*events))]
+    return [(r["payload"], r["status"], r["uid"]) for r in records]
+
+def synced_keys(calendar):
+    return sorted(e["extendedProperties"]["private"]["icsUid"] for e in calendar.events("cal"))
+
+def test_overrides_and_repeated_uids(service, calendar):
+    items = feed_items(
+        vevent("series", extra=["RRULE:FREQ=DAILY;COUNT=5"]),
+        vevent("series", "Moved", start="20300102T120000Z", end="20300102T130000Z",
+               extra=["RECURRENCE-ID:20300102T100000Z"]),
+        vevent("series", "Moved too", start="20300103T120000Z", end="20300103T130000Z",
+               extra=["RECURRENCE-ID:20300103T100000Z"]),
+        vevent("single"),
+        vevent("single", "Repeated copy"),
+    )
+    for deterministic_ids in (False, True):
+        calendar.calendars.clear()
+        id_map, failed, deferred = bulk_import(service, "cal", items, deterministic_ids=deterministic_ids)
+        assert (failed, deferred) == (0, 0)
+        keys = ["series", "series|20300102T100000Z", "series|20300103T100000Z", "single"]
+        assert sorted(id_map) == synced_keys(calendar) == keys
+        assert len(set(id_map.values())) == 4
+        assert [e["summary"] for e in calendar.events("cal") if e["id"] == id_map["single"]] == ["single"]
+
+def test_deadline_and_quota_defer_the_rest(service, calendar, tmp_path):
+    items = feed_items(*(vevent(f"e{i}") for i in range(120)))
+    id_map, failed, deferred = bulk_import(service, "cal", items, workers=1, stop_reason=lambda: "--max-runtime reached")
+    assert (id_map, deferred) == ({}, 120)
+
+    set_quota_ledger(QuotaLedger(str(tmp_path), run_budget=60))
+    try:
+        id_map, failed, deferred = bulk_import(service, "cal", items, workers=1)
+    finally:
+        set_quota_ledger(None)
+    # One round of 50 fits the budget, the second does not
+    assert (len(id_map), failed, deferred) == (50, 0, 70)
+    assert len(calendar.events("cal")) == 50
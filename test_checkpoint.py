@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test checkpoint resume after a run is killed between a write and its confirmation
+"""
+import glob
+import os
+
+import pytest
+
+import sync
+from checkpoint import SyncCheckpoint
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions
+
+class Killed(BaseException):
+    """Stands in for SIGKILL: nothing after it reaches the disk."""
+
+def test_killed_write_is_looked_up_on_resume(service, calendar, tmp_path, monkeypatch):
+    data_dir = str(tmp_path)
+    feed = ics_feed(*(vevent(f"e{i}") for i in range(3)))
+    options = SyncOptions(data_dir=data_dir, deterministic_ids=True)
+    real_sync_event = sync.sync_event
+    killed = {}
+
+    def sync_event_then_die(service, calendar_id, payload, status, uid, **kwargs):
+        result = real_sync_event(service, calendar_id, payload, status, uid, **kwargs)
+        if calendar.count("events.insert") == 2:
+            # The insert landed in Google; what the checkpoint holds on disk now is all that survives
+            path, = glob.glob(os.path.join(data_dir, "checkpoint-*.jsonl"))
+            with open(path) as f:
+                killed.update(uid=uid, path=path, text=f.read())
+            raise Killed()
+        return result
+
+    monkeypatch.setattr(sync, "sync_event", sync_event_then_die)
+    with pytest.raises(Killed):
+        SyncEngine(service, feed, ["cal"], options).run()
+    monkeypatch.setattr(sync, "sync_event", real_sync_event)
+    with open(killed["path"], "w") as f:
+        f.write(killed["text"])
+
+    checkpoint = SyncCheckpoint(data_dir, "cal", "inline")
+    assert checkpoint.load() and checkpoint.is_uncertain(killed["uid"])
+
+    result = SyncEngine(service, feed, ["cal"], options).run()
+    res = result.calendars["cal"]
+    assert (res.created, res.skipped) == (1, 2)  # e0 from the checkpoint, e1 found in Google
+    # The unconfirmed event was fetched by its derived id, not inserted again
+    assert calendar.count("events.insert") == 3
+    assert sorted(e["summary"] for e in calendar.events("cal")) == ["e0", "e1", "e2"]
+    assert not glob.glob(os.path.join(data_dir, "checkpoint-*.jsonl"))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test the pipelined purge in clear_synced_events.py: interrupt, resume, no page deleted twice
+"""
+import itertools
+import os
+
+import pytest
+
+import clear_synced_events
+from clear_synced_events import purge_synced_events
+from statefile import load_json, state_path
+
+def fill(calendar, synced=30, manual=2):
+    cal = calendar.calendars.setdefault("cal", {})
+    for i in range(synced):
+        cal[f"s{i}"] = {"id": f"s{i}", "status": "confirmed", "summary": f"synced {i}",
+                        "extendedProperties": {"private": {"icsUid": f"e{i}"}}}
+        if i % 15 == 0 and manual:
+            cal[f"m{i}"] = {"id": f"m{i}", "status": "confirmed", "summary": "added by hand"}
+            manual -= 1
+
+def test_interrupted_purge_resumes_after_the_last_clean_page(service, calendar, tmp_path, monkeypatch, capsys):
+    data_dir = str(tmp_path)
+    calendar.max_page = 8  # 32 events: pages of 8, 8, 8, 8
+    fill(calendar)
+    real_batch_execute = clear_synced_events.gcal_batch_execute
+    pages = itertools.count(1)
+
+    def connection_lost_on_third_page(*args, **kwargs):
+        if next(pages) == 3:
+            raise ConnectionError("connection lost")
+        return real_batch_execute(*args, **kwargs)
+
+    monkeypatch.setattr(clear_synced_events, "gcal_batch_execute", connection_lost_on_third_page)
+    with pytest.raises(ConnectionError):
+        purge_synced_events(service, "cal", data_dir=data_dir, rate=1000)
+    # Resume after page 2; page 4 may already have been deleted too, and is counted
+    progress = load_json(state_path(data_dir, "purge", "cal"))
+    assert progress["page_token"] == "15"
+    assert progress["deleted"] == calendar.count("events.delete") == 32 - len(calendar.events("cal"))
+
+    monkeypatch.setattr(clear_synced_events, "gcal_batch_execute", real_batch_execute)
+    deleted, failed = purge_synced_events(service, "cal", data_dir=data_dir, rate=1000)
+    assert f"Resuming purge after {progress['deleted']} previously deleted events" in capsys.readouterr().out
+    assert (deleted, failed) == (30, 0)
+    # Every synced event was deleted exactly once; events added by hand are kept
+    assert calendar.count("events.delete") == 30
+    assert sorted(e["id"] for e in calendar.events("cal")) == ["m0", "m15"]
+    assert not os.path.exists(state_path(data_dir, "purge", "cal"))
+
+def test_purge_pipelines_pages(service, calendar, tmp_path):
+    calendar.max_page = 5
+    fill(calendar, synced=40, manual=0)
+    deleted, failed = purge_synced_events(service, "cal", data_dir=str(tmp_path), rate=1000, pipeline_depth=3)
+    assert (deleted, failed) == (40, 0)
+    assert calendar.count("events.delete") == 40
+    assert calendar.count("events.list") == 8
+    assert calendar.events("cal") == []
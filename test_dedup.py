@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Test --dedup claims between two feeds sharing a calendar
+"""
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions
+
+PAST = {"start": "20200101T100000Z", "end": "20200101T110000Z"}
+MOVED = {"start": "20300102T120000Z", "end": "20300102T130000Z", "extra": ["RECURRENCE-ID:20300102T100000Z"]}
+
+class Feed(bytes):
+    """Inline feed bytes with a name, so the two feeds get separate dedup claims."""
+
+def named_feed(name, *events):
+    feed = Feed(ics_feed(*events))
+    feed.name = name
+    return feed
+
+def test_unqueued_events_stay_claimed(service, calendar, tmp_path):
+    first = named_feed("first", vevent("past", **PAST), vevent("series", extra=["RRULE:FREQ=DAILY;COUNT=3"]),
+                       vevent("series", "Moved", **MOVED))
+    second = named_feed("second", vevent("past", "Second copy", **PAST), vevent("series", "Second moved", **MOVED))
+    # The first feed skips its past event with --future-only but still carries it
+    SyncEngine(service, first, ["cal"], SyncOptions(data_dir=str(tmp_path), dedup="priority", feed_priority=1,
+                                                    future_only=True)).run()
+    result = SyncEngine(service, second, ["cal"], SyncOptions(data_dir=str(tmp_path), dedup="priority",
+                                                              prune_missing=True)).run()
+
+    assert result.calendars["cal"].deduped == 2
+    synced = {e["extendedProperties"]["private"]["icsUid"]: e["summary"] for e in calendar.events("cal")}
+    assert synced == {"series": "series", "series|20300102T100000Z": "Moved"}
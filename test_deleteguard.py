@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test the deletion circuit breaker: trip, confirmation of a shrink, --force, and the watcher
+"""
+import json
+import os
+
+from conftest import ics_feed, vevent
+from deleteguard import CONFIRM_SECONDS, DeletionGuard
+from sync import SyncEngine, SyncOptions, load_id_map
+from watch import CalendarWatcher, initial_sync_token
+
+def guard(tmp_path, force=False):
+    return DeletionGuard(str(tmp_path), "cal", "feed", force=force)
+
+def settle(tmp_path, size=100, runs=3):
+    for _ in range(runs):
+        g = guard(tmp_path)
+        assert g.check(size, 0, size) == (True, None)
+        g.save()
+
+def test_truncated_feed_trips_until_confirmed(tmp_path):
+    settle(tmp_path)
+    g = guard(tmp_path)
+    allowed, reason = g.check(30, 70, 100)
+    assert not allowed and reason == "feed has 30 events, usually 100"
+    g.save()
+
+    # The feed recovers: nothing to delete, the hold ends
+    g = guard(tmp_path)
+    assert g.check(100, 0, 100) == (True, None) and g.hold is None
+    g.save()
+
+    # A real shrink needs three fetches of (about) the same size spread over an hour
+    g, t = guard(tmp_path), 1_000_000
+    assert not g.check(30, 70, 100, now=t)[0]
+    assert not g.check(30, 70, 100, now=t + 60)[0]
+    assert not g.check(30, 70, 100, now=t + 120)[0]  # three fetches, but within minutes
+    assert g.hold["seen"] == 3
+    assert not g.check(20, 80, 100, now=t + CONFIRM_SECONDS)[0]  # still shrinking: starts over
+    assert g.hold["seen"] == 1
+    assert not g.check(20, 80, 100, now=t + CONFIRM_SECONDS + 60)[0]
+    assert not g.check(20, 80, 100, now=t + CONFIRM_SECONDS + 120)[0]
+    assert g.check(20, 80, 100, now=t + 2 * CONFIRM_SECONDS)[0] and g.baseline() == 20
+    assert g.hold is None
+
+def test_empty_feed_never_confirms(tmp_path):
+    settle(tmp_path)
+    g = guard(tmp_path)
+    assert not g.check(0, 100, 100)[0]
+    assert not g.check(0, 100, 100)[0]
+    assert g.hold["since"] and g.baseline() == 100
+
+def test_floor_fraction_and_force(tmp_path):
+    settle(tmp_path)
+    assert guard(tmp_path).check(95, 10, 100)[0]  # at most DELETE_FLOOR deletes never trip
+    # Most of the feed is there, but 30% of the calendar would go: fetching it again confirms nothing
+    g, t = guard(tmp_path), 1_000_000
+    for i in range(5):
+        assert not g.check(95, 30, 100, now=t + i * CONFIRM_SECONDS)[0]
+    assert g.hold["shrink"] is False
+    allowed, reason = guard(tmp_path, force=True).check(95, 30, 100)
+    assert allowed and reason.endswith("(--force)")
+
+def watched(service, data_dir, feed):
+    def engine_factory(targets):
+        return SyncEngine(service, lambda: feed["ics"], targets, SyncOptions(data_dir=data_dir))
+
+    engine_factory(["cal"]).run()
+    watcher = CalendarWatcher(service, engine_factory, ["cal"], "https://sync.example.com/notify", data_dir)
+    watcher.state["cal"]["sync_token"] = initial_sync_token(service, "cal")
+    return watcher
+
+def test_watcher_holds_mass_cancellations(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = {"ics": ics_feed(*(vevent(f"e{i}") for i in range(30)))}
+    watcher = watched(service, data_dir, feed)
+    ids = load_id_map(data_dir, "cal")
+    guard_file = os.path.join(data_dir, "deleteguard-cal.json")
+    with open(guard_file) as f:
+        recorded = json.load(f)
+
+    # A broken export marks everything cancelled; edits in Google make the watcher look at e0..e19
+    feed["ics"] = ics_feed(*(vevent(f"e{i}", status="CANCELLED") for i in range(30)))
+    for i in range(20):
+        calendar.edit("cal", ids[f"e{i}"], summary="edited")
+    watcher._handle_locked("cal")
+    assert calendar.count("events.delete") == 0
+    assert len(calendar.events("cal")) == 30
+    # The watcher only reads the guard's state: the sync runs' history and holds are untouched
+    with open(guard_file) as f:
+        assert json.load(f) == recorded
+
+def test_watcher_counts_only_its_own_deletes(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = {"ics": ics_feed(*(vevent(f"e{i}") for i in range(30)))}
+    watcher = watched(service, data_dir, feed)
+    ids = load_id_map(data_dir, "cal")
+
+    # The feed cancels e0..e14, which a user already deleted in Google, except for e10..e14
+    feed["ics"] = ics_feed(*(vevent(f"e{i}", status="CANCELLED" if i < 15 else None) for i in range(30)))
+    for i in range(10):
+        calendar.edit("cal", ids[f"e{i}"], status="cancelled")
+    for i in range(10, 15):
+        calendar.edit("cal", ids[f"e{i}"], summary="edited")
+    watcher._handle_locked("cal")
+    # 15 cancellations in the feed, but only 5 deletes to make: under the floor, so they run
+    assert calendar.count("events.delete") == 5
+    assert len(calendar.events("cal")) == 15
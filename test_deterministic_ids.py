@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Test --deterministic-ids inserts: a 409 on the derived id recovers instead of duplicating
+"""
+from icalendar import Calendar
+
+from conftest import ics_feed, vevent
+from sync import event_to_gcal_payload, ics_event_id, sync_event
+
+def payload_for(uid, summary=None):
+    event = next(iter(Calendar.from_ical(ics_feed(vevent(uid, summary))).walk("VEVENT")))
+    return event_to_gcal_payload(event)
+
+def test_existing_derived_id_is_updated_not_duplicated(service, calendar):
+    event_id = ics_event_id("cal", "meeting-1")
+    payload, status, uid = payload_for("meeting-1")
+    assert sync_event(service, "cal", payload, status, uid, event_id=event_id) == ("created", event_id)
+
+    # A later run that does not know the event yet (no listing, no id map) inserts again
+    payload, status, uid = payload_for("meeting-1", summary="Moved meeting")
+    errors = []
+    action, google_id = sync_event(service, "cal", payload, status, uid, event_id=event_id, errors=errors)
+    assert (action, google_id, errors) == ("updated", event_id, [])
+    assert [e["summary"] for e in calendar.events("cal")] == ["Moved meeting"]
+
+def test_unreadable_derived_id_is_an_error_not_a_random_insert(service, calendar):
+    event_id = ics_event_id("cal", "meeting-2")
+    payload, status, uid = payload_for("meeting-2")
+    sync_event(service, "cal", payload, status, uid, event_id=event_id)
+    calendar.unreadable.add(event_id)
+
+    errors = []
+    action, _ = sync_event(service, "cal", payload, status, uid, event_id=event_id, errors=errors)
+    assert action == "failed"
+    assert errors and "cannot be read" in errors[0][1]
+    assert len(calendar.events("cal")) == 1
+    assert calendar.count("events.insert") == 2  # the original insert and the one refused with 409
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the pre-parse feed filter: which events each rule drops, and that --prune-missing leaves them alone
+"""
+from conftest import ics_feed, vevent
+from feedfilter import FeedFilter
+from sync import SyncEngine, SyncOptions
+
+FEED = ics_feed(
+    vevent("standup", summary="Daily standup"),
+    vevent("lunch", summary="Lunch", extra=("TRANSP:TRANSPARENT",)),
+    vevent("review", summary="Review", extra=("CLASS:PRIVATE", "CATEGORIES:Work,Internal")),
+    vevent("party", summary="Party", extra=("CATEGORIES:Social\\, fun,Team",)),
+    vevent("board", summary="Board", extra=('ORGANIZER;CN="Chair: Ann":mailto:ann@example.com',)),
+    vevent("talk", summary="Talk", status="TENTATIVE",
+           extra=("RECURRENCE-ID:20300101T100000Z",)),
+)
+
+def dropped(**rules):
+    _, uids, reasons = FeedFilter(**rules).apply(FEED)
+    return uids, dict(reasons)
+
+def test_rules_match_scanned_properties():
+    assert dropped(summary="STANDUP") == ({"standup"}, {"summary": 1})
+    assert dropped(transp=["transparent"]) == ({"lunch"}, {"transp": 1})
+    assert dropped(classes=["PRIVATE"]) == ({"review"}, {"class": 1})
+    # Categories are split on unescaped commas, each value matched on its own
+    assert dropped(category="^internal$") == ({"review"}, {"category": 1})
+    assert dropped(category="^social, fun$") == ({"party"}, {"category": 1})
+    # The organizer's display name counts, even with a colon inside its quotes
+    assert dropped(organizer="chair: ann") == ({"board"}, {"organizer": 1})
+    # A modified instance is dropped under the same key the sync gives it
+    assert dropped(status=["tentative"]) == ({"talk|20300101T100000Z"}, {"status": 1})
+    assert dropped(summary="nothing matches") == (set(), {})
+
+def test_filtered_bytes_keep_the_rest():
+    filtered, uids, _ = FeedFilter(summary="standup|lunch").apply(FEED)
+    assert uids == {"standup", "lunch"}
+    assert b"UID:standup" not in filtered and b"UID:lunch" not in filtered
+    assert filtered.count(b"BEGIN:VEVENT") == 4 and filtered.endswith(b"END:VCALENDAR\r\n")
+
+def test_prune_missing_leaves_filtered_events_alone(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = ics_feed(*(vevent(f"e{i}", summary="Private" if i < 3 else None) for i in range(8)))
+    SyncEngine(service, feed, ["cal"], SyncOptions(data_dir=data_dir)).run()
+
+    # The filter now drops e0..e2 and the feed loses e7: only e7 is pruned
+    feed = ics_feed(*(vevent(f"e{i}", summary="Private" if i < 3 else None) for i in range(7)))
+    options = SyncOptions(data_dir=data_dir, prune_missing=True, feed_filter=FeedFilter(summary="^private$"))
+    result = SyncEngine(service, feed, ["cal"], options).run()
+    assert result.total("deleted") == 1
+    assert sorted(e["extendedProperties"]["private"]["icsUid"] for e in calendar.events("cal")) == \
+        [f"e{i}" for i in range(7)]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test hedged feed downloads: the second request starts at the source's learned p90, not before
+"""
+import threading
+import time
+
+from conftest import ics_feed, vevent
+from feedsources import HedgedFetcher, SourceStats
+
+PRIMARY, MIRROR = "https://primary.example.com/feed.ics", "https://mirror.example.com/feed.ics"
+
+class SlowSession:
+    """requests-like session answering each URL after a fixed delay, recording when each request started."""
+    def __init__(self, delays):
+        self.delays = delays
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.started[url] = time.monotonic()
+        time.sleep(self.delays[url])
+        return self.Response(ics_feed(vevent(url)))
+
+    class Response:
+        def __init__(self, content):
+            self.content = content
+
+        def raise_for_status(self):
+            pass
+
+def learned(tmp_path, latency=0.2):
+    stats = SourceStats(str(tmp_path))
+    for _ in range(10):
+        stats.record(PRIMARY, latency, True)
+        stats.record(MIRROR, latency * 2, True)
+    return stats
+
+def test_hedge_starts_after_p90(tmp_path):
+    stats = learned(tmp_path)
+    session = SlowSession({PRIMARY: 2.0, MIRROR: 0.01})
+    began = time.monotonic()
+    data = HedgedFetcher([PRIMARY, MIRROR], session=session, stats=stats).fetch()
+
+    assert vevent(MIRROR).encode() in data
+    assert session.started[PRIMARY] - began < 0.1
+    assert 0.2 <= session.started[MIRROR] - session.started[PRIMARY] < 1.0
+    # The abandoned primary is kept as a lower bound on its latency, not as a failure
+    assert stats.sources[PRIMARY]["censored"] and stats.error_rate(PRIMARY) == 0.0
+
+def test_fast_source_is_not_hedged(tmp_path):
+    session = SlowSession({PRIMARY: 0.01, MIRROR: 0.01})
+    data = HedgedFetcher([PRIMARY, MIRROR], session=session, stats=learned(tmp_path)).fetch()
+    assert vevent(PRIMARY).encode() in data and MIRROR not in session.started
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Test local feed sources: a directory of .ics files merged into one feed, and rejected sources
+"""
+import pytest
+
+from conftest import ics_feed, vevent
+from localfeeds import read_local_feed
+from sync import SyncEngine, SyncOptions, fetch_ics
+
+def test_directory_is_one_feed(service, calendar, tmp_path):
+    feeds = tmp_path / "exports"
+    feeds.mkdir()
+    (feeds / "b-rooms.ics").write_bytes(ics_feed(vevent("room-1"), vevent("room-2")))
+    (feeds / "a-team.ics").write_bytes(ics_feed(vevent("standup")))
+    (feeds / "c-empty.ICS").write_bytes(ics_feed())
+    (feeds / "notes.txt").write_text("not a calendar")
+
+    merged = bytes(read_local_feed(str(feeds)))
+    assert merged.count(b"BEGIN:VCALENDAR") == 1 and merged.count(b"END:VCALENDAR") == 1
+    assert merged.index(b"UID:standup") < merged.index(b"UID:room-1")  # files in name order
+
+    data_dir = str(tmp_path / "data")
+    result = SyncEngine(service, f"file://{feeds}/", ["cal"], SyncOptions(data_dir=data_dir, block_cache=True)).run()
+    assert result.total("created") == 3
+    assert sorted(e["summary"] for e in calendar.events("cal")) == ["room-1", "room-2", "standup"]
+
+    # A later export changes one file; the rest comes from the block cache
+    (feeds / "a-team.ics").write_bytes(ics_feed(vevent("standup", summary="Standup")))
+    result = SyncEngine(service, str(feeds), ["cal"], SyncOptions(data_dir=data_dir, block_cache=True)).run()
+    assert (result.total("created"), result.total("updated")) == (0, 1)
+
+def test_unknown_sources_are_rejected(tmp_path):
+    for source in (str(tmp_path / "missing.ics"), "ftp://example.com/feed.ics", "webcal://example.com/feed.ics"):
+        with pytest.raises(ValueError, match="is not an http"):
+            fetch_ics(source)
+    (tmp_path / "empty").mkdir()
+    with pytest.raises(FileNotFoundError, match="no .ics files"):
+        fetch_ics(str(tmp_path / "empty"))
+    # A directory is only merged from calendars
+    (tmp_path / "mixed").mkdir()
+    (tmp_path / "mixed" / "a.ics").write_bytes(ics_feed(vevent("a")))
+    (tmp_path / "mixed" / "b.ics").write_text("hello")
+    with pytest.raises(ValueError, match="b.ics is not an ICS calendar"):
+        read_local_feed(str(tmp_path / "mixed"))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the shared quota ledger and the handling of rate-limit versus daily-quota errors
+"""
+import httplib2
+from googleapiclient.errors import HttpError
+
+import sync
+from conftest import ics_feed, vevent
+from quota import QuotaLedger
+
+def api_error(status, reason):
+    body = '{"error": {"errors": [{"domain": "usageLimits", "reason": "%s"}], "code": %d, "message": "%s"}}'
+    return HttpError(httplib2.Response({"status": status}), (body % (reason, status, reason)).encode())
+
+def test_concurrent_ledgers_share_the_daily_limit(tmp_path):
+    first = QuotaLedger(str(tmp_path), daily_limit=10)
+    second = QuotaLedger(str(tmp_path), daily_limit=10)
+    spent = 0
+    for _ in range(20):
+        for ledger in (first, second):
+            if ledger.can_spend(1):
+                ledger.record("events.insert")
+                spent += 1
+    # At most the check in flight on the other run can slip past the limit
+    assert spent <= 11
+    first.save()
+    second.save()
+    assert QuotaLedger(str(tmp_path), daily_limit=10).remaining() == 0
+
+def test_rate_limits_are_not_daily_quota():
+    for status, reason in [(403, "rateLimitExceeded"), (403, "userRateLimitExceeded"), (429, "rateLimitExceeded")]:
+        ex = api_error(status, reason)
+        assert sync.is_rate_limit_error(ex) and sync.is_transient_error(ex) and not sync.is_quota_error(ex)
+    for reason in ("dailyLimitExceeded", "quotaExceeded"):
+        ex = api_error(403, reason)
+        assert sync.is_quota_error(ex) and not sync.is_rate_limit_error(ex)
+
+def test_rate_limited_call_is_retried(monkeypatch):
+    monkeypatch.setattr(sync.time, "sleep", lambda seconds: None)
+
+    class FlakyRequest:
+        attempts = 0
+
+        def execute(self):
+            self.attempts += 1
+            if self.attempts < 3:
+                raise api_error(403, "rateLimitExceeded")
+            return {"id": "ok"}
+
+    request = FlakyRequest()
+    assert sync._execute(request, "events.get") == {"id": "ok"}
+    assert request.attempts == 3
+
+def test_engines_count_against_their_own_ledger(tmp_path, service, calendar):
+    outside = QuotaLedger(str(tmp_path))
+    sync.set_quota_ledger(outside)
+    try:
+        ledgers = []
+        for n in (2, 5):
+            ledger = QuotaLedger(str(tmp_path))
+            feed = ics_feed(*(vevent(f"e{n}-{i}") for i in range(n)))
+            sync.SyncEngine(service, feed, [f"cal{n}"], sync.SyncOptions(data_dir=str(tmp_path)), quota=ledger).run()
+            ledgers.append(ledger)
+    finally:
+        sync.set_quota_ledger(None)
+    # One listing, then a lookup and an insert per event
+    assert [ledger.run_calls for ledger in ledgers] == [5, 11]
+    assert outside.run_calls == 0
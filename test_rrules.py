@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the local RRULE checks: classify, repair and expand; EXDATEs for modified instances
+"""
+from collections import Counter
+from datetime import date, datetime
+
+from dateutil.rrule import rrulestr
+
+from conftest import ics_feed, vevent
+from rrules import RRuleChecker, classify, exdate, expand, repair
+from sync import SyncEngine, SyncOptions
+
+TODAY = date(2030, 6, 1)
+TIMED = {"dateTime": "2030-01-01T10:00:00", "timeZone": "Europe/Berlin"}
+ALL_DAY = {"date": "2030-01-01"}
+
+def test_classify():
+    assert classify("RRULE:FREQ=WEEKLY;BYDAY=MO,WE", False) == ("ok", "")
+    assert classify("RRULE:FREQ=DAILY;UNTIL=20300110", True)[0] == "ok"
+    assert classify("RRULE:FREQ=DAILY;UNTIL=20300110T100000", False)[0] == "repair"
+    assert classify("RRULE:FREQ=DAILY;UNTIL=20300110T100000Z", True)[0] == "repair"
+    assert classify("RRULE:FREQ=HOURLY;COUNT=3", False)[0] == "expand"
+    assert classify("RRULE:FREQ=DAILY;BYHOUR=9,17", False)[0] == "expand"
+    assert classify("RRULE:FREQ=DAILY;COUNT=3;UNTIL=20300110T100000Z", False)[0] == "expand"
+    assert classify("RRULE:FREQ=SECONDLY;BYWHATEVER=1", False)[0] == "drop"
+
+def test_repair_until():
+    # Floating UNTIL is taken in the event's zone (CET, UTC+1 in January)
+    assert repair("RRULE:FREQ=DAILY;UNTIL=20300110T100000", TIMED) == "RRULE:FREQ=DAILY;UNTIL=20300110T090000Z"
+    assert repair("RRULE:FREQ=DAILY;UNTIL=20300110T100000Z", ALL_DAY) == "RRULE:FREQ=DAILY;UNTIL=20300110"
+
+def test_expand_timed():
+    lines = expand("RRULE:FREQ=HOURLY;INTERVAL=12;COUNT=3", TIMED, today=TODAY)
+    assert lines == ["RDATE:20300101T210000Z,20300102T090000Z"]
+
+def test_expand_all_day_gives_each_date_once():
+    lines = expand("RRULE:FREQ=DAILY;BYHOUR=9,17;COUNT=6", ALL_DAY, today=TODAY)
+    assert lines == ["RDATE;VALUE=DATE:20300102,20300103"]
+
+def test_truncated_expansion_is_refused_and_reported():
+    checker = RRuleChecker()
+    start = {"dateTime": f"{date.today().year}-01-01T10:00:00", "timeZone": "UTC"}
+    assert checker.recurrence_for("RRULE:FREQ=MINUTELY", start) == []
+    [(rule, message)] = checker.take_failures()
+    assert rule == "RRULE:FREQ=MINUTELY" and "more than 1000 occurrences" in message
+    assert checker.take_failures() == []
+
+def test_exdate():
+    # Floating RECURRENCE-IDs are taken in the series' zone, like RDATEs they end up in UTC
+    assert exdate("20300102T100000", TIMED) == "EXDATE:20300102T090000Z"
+    assert exdate("20300102T100000Z", TIMED) == "EXDATE:20300102T100000Z"
+    assert exdate("20300102", ALL_DAY) == "EXDATE;VALUE=DATE:20300102"
+
+def dates_shown(calendar):
+    """Start date of every occurrence Google would show: single events plus expanded series."""
+    shown = []
+    for event in calendar.events("cal"):
+        start = datetime.fromisoformat(event["start"]["dateTime"])
+        if event.get("recurrence"):
+            shown += [occ.date() for occ in rrulestr("\n".join(event["recurrence"]), dtstart=start, forceset=True)]
+        else:
+            shown.append(start.date())
+    return Counter(shown)
+
+def test_modified_instance_replaces_its_occurrence(service, calendar, tmp_path):
+    feed = ics_feed(
+        vevent("series", extra=["RRULE:FREQ=DAILY;COUNT=5"]),
+        vevent("series", "Moved", start="20300102T120000Z", end="20300102T130000Z",
+               extra=["RECURRENCE-ID:20300102T100000Z"]),
+    )
+    SyncEngine(service, feed, ["cal"], SyncOptions(data_dir=str(tmp_path))).run()
+    shown = dates_shown(calendar)
+    assert shown[date(2030, 1, 2)] == 1
+    assert sum(shown.values()) == 5
+    [moved] = [e for e in calendar.events("cal") if e["summary"] == "Moved"]
+    assert moved["start"]["dateTime"].startswith("2030-01-02T12:00")
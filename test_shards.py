@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test --shard-by relocation: adding a shard, retiring one, --bulk-import and deferred moves
+"""
+from collections import Counter
+
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions
+
+FEED = ics_feed(*(vevent(f"e{i}") for i in range(24)))
+
+def sync(service, data_dir, shards, **options):
+    result = SyncEngine(service, FEED, shards, SyncOptions(data_dir=data_dir, shard_by="uid", **options)).run()
+    assert not result.errors
+    return result
+
+def placement(calendar, calendar_ids):
+    """{icsUid: (calendar id, event id)}, checking that no UID is in Google twice."""
+    where = [(e["extendedProperties"]["private"]["icsUid"], (cid, e["id"]))
+             for cid in calendar_ids for e in calendar.events(cid)]
+    assert not [uid for uid, n in Counter(uid for uid, _ in where).items() if n > 1]
+    return dict(where)
+
+def test_adding_a_shard_moves_only_its_events(service, calendar, tmp_path):
+    sync(service, str(tmp_path), ["a", "b"])
+    before = placement(calendar, ["a", "b"])
+    result = sync(service, str(tmp_path), ["a", "b", "c"])
+    after = placement(calendar, ["a", "b", "c"])
+
+    moved = {uid for uid in after if after[uid][0] == "c"}
+    assert moved and result.total("moved") == len(moved) and result.total("created") == 0
+    # Moved events keep their ids; the rest stay where they were
+    assert {uid: event_id for uid, (_, event_id) in after.items()} == {uid: eid for uid, (_, eid) in before.items()}
+    assert all(after[uid] == before[uid] for uid in after if uid not in moved)
+
+def test_retired_shard_is_emptied(service, calendar, tmp_path):
+    sync(service, str(tmp_path), ["a", "b", "c"])
+    before = placement(calendar, ["a", "b", "c"])
+    result = sync(service, str(tmp_path), ["a", "b"], retired_shards=["c"], prune_missing=True)
+    after = placement(calendar, ["a", "b", "c"])
+
+    assert calendar.events("c") == [] and len(after) == 24
+    assert result.total("moved") == sum(1 for cid, _ in before.values() if cid == "c")
+    assert result.total("created") == result.total("deleted") == 0
+
+def test_bulk_import_still_relocates(service, calendar, tmp_path):
+    sync(service, str(tmp_path), ["a"])
+    # "b" is empty and would be bulk imported; "a" has synced events and falls back to a normal sync
+    result = sync(service, str(tmp_path), ["a", "b"], bulk_import=True)
+    after = placement(calendar, ["a", "b"])
+    assert len(after) == 24 and result.total("created") == 0
+    assert result.total("moved") == len(calendar.events("b")) > 0
+
+def test_deferred_moves_are_not_written_twice(service, calendar, tmp_path):
+    sync(service, str(tmp_path), ["a"])
+    result = sync(service, str(tmp_path), ["a", "b"], max_runtime=0.001)
+    assert calendar.count("events.move") == 0 and calendar.events("b") == []
+    assert result.calendars["b"].deferred > 0
+    placement(calendar, ["a", "b"])
+
+    result = sync(service, str(tmp_path), ["a", "b"])
+    assert result.total("moved") == len(calendar.events("b")) > 0
+    assert len(placement(calendar, ["a", "b"])) == 24
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Test the credential broker: a token rejected with 401 is refreshed even before it expires
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+from google.oauth2.credentials import Credentials
+
+from tokenbroker import CredentialBroker
+
+def write_token(path, token, minutes):
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=minutes)
+    path.write_text(json.dumps({"token": token, "refresh_token": "r", "client_id": "c", "client_secret": "s",
+                                "token_uri": "https://oauth2.googleapis.com/token",
+                                "expiry": expiry.isoformat() + "Z"}))
+
+def test_rejected_fresh_token_is_refreshed_once(tmp_path, monkeypatch):
+    refreshed = []
+
+    def fake_refresh(creds, request):
+        refreshed.append(creds.token)
+        creds.token = f"new-{len(refreshed)}"
+        creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+
+    monkeypatch.setattr(Credentials, "refresh", fake_refresh)
+    token_path = tmp_path / "token.json"
+    write_token(token_path, "old", minutes=50)
+    broker = CredentialBroker(str(token_path), "credentials.json", ["scope"])
+    creds = broker.credentials()
+
+    broker.refresh()  # proactive refresh: the token is still fresh
+    assert refreshed == []
+
+    creds.refresh(None)  # what google-auth does after a 401
+    assert refreshed == ["old"] and creds.token == "new-1"
+    assert json.loads(token_path.read_text())["token"] == "new-1"
+
+    # Another run refreshed the rejected token meanwhile: take its token instead of refreshing again
+    write_token(token_path, "from-other-run", minutes=50)
+    creds.token = "rejected"
+    creds.refresh(None)
+    assert refreshed == ["old"] and creds.token == "from-other-run"
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test --transport pooled: a sync through PooledHttp and its requests session against the in-memory calendar
+"""
+import threading
+
+import pytest
+import requests
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions, _thread_http, http_status
+from transport import PooledHttp
+
+class FakeCalendarAdapter(requests.adapters.BaseAdapter):
+    """A requests transport adapter that answers from FakeCalendarHttp, noting the threads it served."""
+    def __init__(self, calendar):
+        super().__init__()
+        self.calendar = calendar
+        self.threads = set()
+        self.fail_with = None
+
+    def send(self, request, **kwargs):
+        self.threads.add(threading.get_ident())
+        if self.fail_with:
+            raise self.fail_with
+        resp, content = self.calendar.request(request.url, request.method, request.body, dict(request.headers))
+        response = requests.Response()
+        response.status_code = int(resp.status)
+        response.reason = resp.reason
+        response.headers.update({k: v for k, v in resp.items() if k != "status"})
+        response._content = content
+        response.url, response.request = request.url, request
+        return response
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def pooled(calendar):
+    http = PooledHttp(AnonymousCredentials(), pool_size=2)
+    adapter = FakeCalendarAdapter(calendar)
+    http.session.mount("https://", adapter)
+    return build("calendar", "v3", http=http, cache_discovery=False), adapter
+
+def test_sync_over_the_pooled_transport(pooled, calendar, tmp_path):
+    service, adapter = pooled
+    assert _thread_http(service) is service._http  # batches share the pool instead of per-thread clients
+
+    feed = ics_feed(*(vevent(f"e{i}") for i in range(120)))
+    options = SyncOptions(data_dir=str(tmp_path), prune_missing=True)
+    assert SyncEngine(service, feed, ["cal"], options).run().total("created") == 120
+
+    feed = ics_feed(*(vevent(f"e{i}", summary="moved" if i < 5 else None) for i in range(110)))
+    result = SyncEngine(service, feed, ["cal"], options).run()
+    assert (result.total("updated"), result.total("deleted"), result.errors) == (5, 10, [])
+    assert len(calendar.events("cal")) == 110
+    assert len(adapter.threads) > 1  # concurrent batches went through the one session
+
+def test_pooled_errors_look_like_httplib2(pooled):
+    service, adapter = pooled
+    with pytest.raises(HttpError) as raised:
+        service.events().get(calendarId="cal", eventId="missing").execute()
+    assert http_status(raised.value) == 404
+
+    adapter.fail_with = requests.ConnectTimeout("connect timed out")
+    with pytest.raises(TimeoutError):
+        service.events().get(calendarId="cal", eventId="missing").execute()
+    adapter.fail_with = requests.ConnectionError("connection reset")
+    with pytest.raises(ConnectionError):
+        service.events().get(calendarId="cal", eventId="missing").execute()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test --verify-sample: the Wilson interval and the repair of drifted events
+"""
+import pytest
+
+from conftest import ics_feed, vevent
+from quota import QuotaLedger
+from sync import SyncEngine, SyncOptions, load_id_map
+from verify import wilson_interval
+
+def test_wilson_interval():
+    assert wilson_interval(5, 50) == pytest.approx((0.0435, 0.2136), abs=1e-4)
+    assert wilson_interval(0, 50) == pytest.approx((0.0, 0.0714), abs=1e-4)
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    # Sampling half of a small calendar narrows the interval; sampling all of it leaves none
+    low, high = wilson_interval(5, 50, population=100)
+    assert 0.0435 < low < 0.1 < high < 0.2136
+    assert wilson_interval(5, 50, population=50) == (0.1, 0.1)
+
+def test_drifted_events_are_repaired_through_the_write_queue(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = ics_feed(*(vevent(f"e{i}") for i in range(3)))
+
+    def run(budget=None):
+        options = SyncOptions(data_dir=data_dir, verify_sample=10, drift_threshold=1.0)
+        result = SyncEngine(service, feed, ["cal"], options, quota=QuotaLedger(data_dir, run_budget=budget)).run()
+        return result.calendars["cal"]
+
+    run()  # full run: records what Google holds
+    calendar.edit("cal", load_id_map(data_dir, "cal")["e1"], summary="edited")
+
+    # The sample (3 gets) fits the budget, the repair does not: it is deferred, not forced through
+    res = run(budget=4)
+    assert (res.drifted, res.updated, res.deferred) == (1, 0, 1)
+    # The next run writes it even if its sample misses it
+    res = run()
+    assert res.updated == 1
+    assert sorted(e["summary"] for e in calendar.events("cal")) == ["e0", "e1", "e2"]
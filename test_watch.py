@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test the watcher's repair of Google-side edits, without a notification channel
+"""
+import pytest
+
+from conftest import ics_feed, vevent
+from sync import SyncEngine, SyncOptions, load_id_map
+from watch import CalendarWatcher, initial_sync_token
+
+def make_watcher(service, data_dir, feed):
+    def download():
+        if isinstance(feed["ics"], Exception):
+            raise feed["ics"]
+        return feed["ics"]
+
+    def engine_factory(targets):
+        return SyncEngine(service, download, targets, SyncOptions(data_dir=data_dir))
+    engine_factory(["cal"]).run()
+    watcher = CalendarWatcher(service, engine_factory, ["cal"], "https://sync.example.com/notify", data_dir)
+    watcher.state["cal"]["sync_token"] = initial_sync_token(service, "cal")  # as ensure_channels() would
+    return watcher
+
+def test_failed_repairs_do_not_hold_back_the_sync_token(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = {"ics": ics_feed(vevent("a"), vevent("b"), vevent("c"))}
+    watcher = make_watcher(service, data_dir, feed)
+    ids = load_id_map(data_dir, "cal")
+
+    # The feed cancels b while a user deletes it in Google; a and c are edited
+    feed["ics"] = ics_feed(vevent("a"), vevent("b", status="CANCELLED"), vevent("c"))
+    calendar.edit("cal", ids["a"], summary="edited")
+    calendar.edit("cal", ids["b"], status="cancelled")
+    calendar.edit("cal", ids["c"], summary="edited")
+    calendar.broken.add(ids["c"])
+    edits_read = str(calendar.changes[-1][0])
+    assert watcher._handle_locked("cal") is False
+
+    summaries = {e["id"]: e["summary"] for e in calendar.events("cal")}
+    assert summaries == {ids["a"]: "a", ids["c"]: "edited"}  # a repaired, b's delete already done, c failed
+    assert "b" not in load_id_map(data_dir, "cal")
+    assert watcher.state["cal"]["sync_token"] == edits_read
+
+    # The next notification only reads what changed since (the repair of a, a no-op now)
+    calendar.broken.clear()
+    updates = calendar.count("events.update")
+    watcher._handle_locked("cal")
+    assert calendar.count("events.update") == updates
+
+def test_sync_token_stays_when_the_feed_cannot_be_read(service, calendar, tmp_path):
+    data_dir = str(tmp_path)
+    feed = {"ics": ics_feed(vevent("a"), vevent("b"))}
+    watcher = make_watcher(service, data_dir, feed)
+    token = watcher.state["cal"]["sync_token"]
+    ids = load_id_map(data_dir, "cal")
+    calendar.edit("cal", ids["a"], summary="edited")
+
+    feed["ics"] = ConnectionError("feed unreachable")
+    with pytest.raises(ConnectionError):
+        watcher._handle_locked("cal")
+    assert watcher.state["cal"]["sync_token"] == token
+
+    # Once the feed is back, the same change is read again and repaired
+    feed["ics"] = ics_feed(vevent("a"), vevent("b"))
+    watcher._handle_locked("cal")
+    assert sorted(e["summary"] for e in calendar.events("cal")) == ["a", "b"]
+    assert watcher.state["cal"]["sync_token"] != token
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the job queue leases and worker.run_job: expiry, takeover, lost leases and bad job flags
+"""
+import time
+
+import pytest
+
+import sync
+from conftest import ics_feed, vevent
+from jobqueue import JobQueue
+from quota import QuotaLedger
+from rrules import RRuleChecker
+from worker import job_args, run_job
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue.add("team", "https://example.com/team.ics", ["cal"], interval_seconds=3600)
+    assert queue.claim("node-1", 0.2)["job_id"] == "team"
+    assert queue.claim("node-2", 0.2) is None  # leased
+
+    time.sleep(0.3)
+    assert queue.claim("node-2", 300)["job_id"] == "team"
+    assert not queue.heartbeat("team", "node-1", 300)
+    # The old owner's late release does not touch the new lease
+    queue.release("team", "node-1", "ok", time.time() + 3600)
+    [job] = queue.jobs()
+    assert (job["lease_owner"], job["runs"]) == ("node-2", 0)
+
+def run(queue, job, service, tmp_path, lease=300):
+    data_dir = str(tmp_path)
+    run_job(queue, job, "node-1", lease, service, None, QuotaLedger(data_dir), RRuleChecker(),
+            lambda: service, data_dir)
+
+def test_lost_lease_stops_writes(service, calendar, tmp_path, monkeypatch):
+    feed = tmp_path / "feed.ics"
+    feed.write_bytes(ics_feed(*(vevent(f"e{i}") for i in range(30))))
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue.add("team", str(feed), ["cal"], interval_seconds=3600)
+    job = queue.claim("node-1", 0.15)
+    real_heartbeat = queue.heartbeat
+
+    def stalled_heartbeat(job_id, owner, lease_seconds):
+        # This node stalled past its lease, and another node took the job over meanwhile
+        with queue._connect() as db:
+            db.execute("UPDATE jobs SET lease_expires = 0")
+        queue.claim("node-2", 300)
+        return real_heartbeat(job_id, owner, lease_seconds)
+
+    real_sync_event = sync.sync_event
+
+    def slow_sync_event(*args, **kwargs):
+        time.sleep(0.02)
+        return real_sync_event(*args, **kwargs)
+
+    monkeypatch.setattr(queue, "heartbeat", stalled_heartbeat)
+    monkeypatch.setattr(sync, "sync_event", slow_sync_event)
+    run(queue, job, service, tmp_path, lease=0.15)
+
+    assert 0 < len(calendar.events("cal")) < 30
+    [job] = queue.jobs()
+    assert (job["lease_owner"], job["runs"]) == ("node-2", 0)
+
+def test_bad_stored_flags_fail_the_job(service, calendar, tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    queue.add("team", "https://example.com/team.ics", ["cal"], flags="--no-such-flag", interval_seconds=3600)
+    run(queue, queue.claim("node-1", 300), service, tmp_path)
+    [job] = queue.jobs()
+    assert (job["lease_owner"], job["last_status"], job["runs"]) == (None, "error", 1)
+    assert calendar.calls == []
+
+def test_client_flags_are_rejected():
+    job = {"ics_url": "https://example.com/team.ics", "calendar_ids": ["cal"]}
+    assert job_args(dict(job, flags="--prune-missing --data-dir /srv"), "data").data_dir == "/srv"
+    for flags in ("--token other.json", "--credentials=other.json", "--transport pooled", "--pool-size 2"):
+        with pytest.raises(ValueError, match="cannot be set per job"):
+            job_args(dict(job, flags=flags), "data")
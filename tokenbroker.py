@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Shared OAuth credentials with proactive refresh.
+
+Every Calendar client built for a token file in a process shares one Credentials object
+owned by a CredentialBroker, and every refresh goes through the broker:
+- within a process, a lock makes concurrent threads wait for a single refresh;
+- across processes, the refresh runs under a lock on the token file. The token file is
+  re-read first, so a token another run already refreshed is reused instead of refreshed
+  again, and the new token is written atomically.
+Tokens are refreshed ahead of expiry in the background (once at startup for one-shot runs,
+continuously with start() for long-lived workers), so API calls do not wait on OAuth.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+from statefile import locked, write_text_atomic
+
+# Refresh this long before the access token expires
+REFRESH_MARGIN = timedelta(minutes=10)
+
+class BrokeredCredentials(Credentials):
+    """Credentials whose refresh() is coordinated by a CredentialBroker."""
+    broker = None
+
+    def refresh(self, request):
+        if self.broker is None:
+            return super().refresh(request)
+        # google-auth refreshes an expired token, or one the API answered with 401. A token
+        # that still looks fresh was rejected (revoked, or the clock is off): replace it.
+        self.broker.refresh(request, force=self.broker._fresh(self))
+
+class CredentialBroker:
+    def __init__(self, token_path, creds_path, scopes, margin=REFRESH_MARGIN):
+        self.token_path = token_path
+        self.creds_path = creds_path
+        self.scopes = scopes
+        self.margin = margin
+        self.creds = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def _fresh(self, creds):
+        """True if creds hold a token valid for at least the refresh margin."""
+        if creds is None or not creds.token:
+            return False
+        if creds.expiry is None:
+            return True
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now > self.margin
+
+    def _load_file(self):
+        if not os.path.exists(self.token_path):
+            return None
+        try:
+            creds = BrokeredCredentials.from_authorized_user_file(self.token_path, self.scopes)
+        except (ValueError, KeyError, json.JSONDecodeError) as ex:
+            print(f"[auth] ignoring unreadable token file {self.token_path}: {ex}")
+            return None
+        creds.broker = self
+        return creds
+
+    def _write_file(self, creds):
+        write_text_atomic(self.token_path, creds.to_json())
+
+    def credentials(self):
+        """The shared credentials, running the browser consent flow on first use if there is no token."""
+        with self._lock:
+            if self.creds is None:
+                with locked(self.token_path):
+                    creds = self._load_file()
+                    if creds is None or not (creds.valid or creds.refresh_token):
+                        flow = InstalledAppFlow.from_client_secrets_file(self.creds_path, self.scopes)
+                        creds = BrokeredCredentials.from_authorized_user_info(json.loads(flow.run_local_server(port=0).to_json()), self.scopes)
+                        creds.broker = self
+                        self._write_file(creds)
+                self.creds = creds
+            return self.creds
+
+    def refresh(self, request=None, force=False):
+        """
+        Make the shared token fresh: reuse a fresher one from the token file, else refresh it
+        once. With force, the current token was rejected and is replaced even if it has not
+        expired, unless another thread or run has replaced it meanwhile.
+        """
+        current = self.credentials()
+        rejected = current.token if force else None
+        with self._lock:
+            creds = self.creds
+            if self._fresh(creds) and creds.token != rejected:
+                return
+            with locked(self.token_path):
+                on_disk = self._load_file()
+                if self._fresh(on_disk) and on_disk.token != rejected:
+                    creds.token, creds.expiry = on_disk.token, on_disk.expiry
+                    return
+                Credentials.refresh(creds, request or Request())
+                self._write_file(creds)
+                print(f"[auth] access token refreshed, valid until {creds.expiry:%H:%M:%S} UTC")
+
+    def refresh_in_background(self):
+        """Start refreshing now, off the calling thread, if the token is stale. API calls made
+        meanwhile wait for this refresh instead of starting their own."""
+        if self._fresh(self.credentials()):
+            return
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+            return True
+        except Exception as ex:
+            print(f"[auth] background token refresh failed: {ex}")
+            return False
+
+    def start(self):
+        """Keep the token fresh for the life of the process (for daemons and workers)."""
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            ok = self._refresh_quietly()
+            creds = self.creds  # None until the first refresh has loaded the token
+            if not ok or creds is None:
+                wait = 30
+            elif creds.expiry is None:
+                return
+            else:
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                wait = max(30, (creds.expiry - now - self.margin).total_seconds() + 1)
+            self._stop.wait(wait)
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+def credential_broker(token_path, creds_path, scopes):
+    """The process-wide broker for a token file."""
+    key = os.path.abspath(token_path)
+    with _brokers_lock:
+        if key not in _brokers:
+            _brokers[key] = CredentialBroker(token_path, creds_path, scopes)
+        return _brokers[key]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Pooled keep-alive HTTP transport for the Calendar client (--transport pooled).
+
+By default googleapiclient talks to Google over httplib2. httplib2 is not thread-safe, so
+every worker thread needs its own connection, and connections are dropped and set up again
+(with a new TLS handshake) more often than needed. PooledHttp puts the same interface in
+front of one google-auth AuthorizedSession, a requests.Session whose urllib3 pools keep up
+to pool_size connections per host alive. One PooledHttp serves every client and thread of
+a process built on the same credentials. Threads beyond pool_size wait for a free
+connection instead of opening extra ones. Tokens are attached and refreshed on 401 by
+AuthorizedSession, through the shared credentials (and so through their CredentialBroker).
+"""
+import threading
+
+import httplib2
+import requests
+from google.auth.transport.requests import AuthorizedSession
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+class PooledHttp:
+    """An httplib2.Http look-alike for googleapiclient, backed by a pooled AuthorizedSession."""
+    def __init__(self, credentials, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        self.credentials = credentials  # googleapiclient reads this to authorize batch parts
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = AuthorizedSession(credentials)
+        # googleapiclient and the sync's batch helpers do their own retries
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """Same call and result as httplib2.Http.request: (httplib2.Response, content bytes)."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        try:
+            r = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout,
+                                     allow_redirects=redirections > 0)
+        # Raise what googleapiclient's retry loop expects from httplib2
+        except requests.Timeout as ex:
+            raise TimeoutError(str(ex)) from ex
+        except requests.ConnectionError as ex:
+            raise ConnectionError(str(ex)) from ex
+        info = {k.lower(): v for k, v in r.headers.items()}
+        info.pop("content-encoding", None)  # requests has already decoded the body
+        info["status"] = str(r.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = r.reason
+        return resp, r.content
+
+    def close(self):
+        self.session.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def pooled_http(credentials, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                read_timeout=DEFAULT_READ_TIMEOUT):
+    """The process-wide PooledHttp for a credentials object and settings."""
+    key = (id(credentials), pool_size, connect_timeout, read_timeout)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = PooledHttp(credentials, pool_size, connect_timeout, read_timeout)
+        return _pools[key]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Sampling-based drift checks instead of listing the whole calendar every run (--verify-sample).
+
+After one full run, data/verify-<calendar>.json holds the fingerprint of every event as last
+written to (or confirmed in) Google. Later runs skip the listing. They write only events
+whose fingerprint changed, and check a random sample of the other events by id, in batches,
+to catch edits and deletions made in Google. The sampled drift rate is reported with a
+Wilson confidence interval, corrected for sampling without replacement, and extrapolated to
+the calendar. Drifted events in the sample are written with the changed ones. If the sampled
+rate is above the threshold, the run falls back to a full listing and lookup of every event.
+"""
+import math
+import random
+import time
+
+from statefile import load_json, state_path, write_json_atomic
+
+KEEP_HISTORY = 50
+Z_95 = 1.96
+
+def wilson_interval(hits, n, population=None, z=Z_95):
+    """Confidence interval for a proportion from hits out of n draws without replacement from population."""
+    if n == 0:
+        return 0.0, 1.0
+    p = hits / n
+    if population:
+        if n >= population:
+            return p, p  # the whole calendar was checked
+        # Finite population correction as a larger effective sample
+        n = n * (population - 1) / (population - n)
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+class DriftVerifier:
+    def __init__(self, data_dir, calendar_id, sample_size=50, threshold=0.02):
+        self.path = state_path(data_dir, "verify", calendar_id)
+        self.sample_size = sample_size
+        self.threshold = threshold
+        state = load_json(self.path, {}) or {}
+        self.fingerprints = state.get("fingerprints", {})  # {icsUid: fingerprint of the payload in Google}
+        self.history = state.get("history", [])
+
+    @property
+    def ready(self):
+        """True once a full run has recorded what Google holds."""
+        return bool(self.fingerprints)
+
+    def record(self, uid, fingerprint):
+        self.fingerprints[uid] = fingerprint
+
+    def forget(self, uid):
+        self.fingerprints.pop(uid, None)
+
+    def retain(self, uids):
+        """Drop fingerprints of events that left the feed."""
+        self.fingerprints = {uid: fp for uid, fp in self.fingerprints.items() if uid in uids}
+
+    def unchanged(self, uid, fingerprint):
+        return self.fingerprints.get(uid) == fingerprint
+
+    def sample(self, candidates):
+        """A random sample of the candidate UIDs."""
+        candidates = list(candidates)
+        return random.sample(candidates, min(self.sample_size, len(candidates)))
+
+    def assess(self, drifted, checked, population):
+        """
+        Record one run's sample. Returns (rate, low, high) for the calendar's drift rate and
+        whether it is above the threshold (a full reconcile is needed).
+        """
+        low, high = wilson_interval(drifted, checked, population)
+        rate = drifted / checked if checked else 0.0
+        self.history.append({"t": round(time.time()), "checked": checked, "drifted": drifted, "population": population})
+        del self.history[:-KEEP_HISTORY]
+        return (rate, low, high), rate > self.threshold
+
+    def save(self):
+        write_json_atomic(self.path, {"fingerprints": self.fingerprints, "history": self.history})
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Watch the target calendars for Google-side edits and repair them within seconds.
+
+A push-notification channel (events().watch()) is registered per calendar, pointing at
+--webhook-url, which must reach the small HTTP receiver started on --listen (directly or
+through a reverse proxy; Google only delivers to public HTTPS URLs). On a notification the
+affected calendar is read incrementally with its sync token, so only changed events are
+fetched. Synced events that were edited or deleted in Google are put back to match the feed.
+Channels are renewed before they expire. Feed changes are still picked up by the regular
+sync runs; this only reacts to changes made on the Google side.
+
+    python watch.py --ics-url URL --calendar-id CAL --webhook-url https://sync.example.com/notify --listen 0.0.0.0:8080
+"""
+import queue
+import secrets
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from checkpoint import calendar_lock
+from dedup import DedupIndex, dedup_key
+from quota import QuotaLedger
+from rrules import RRuleChecker
+from statefile import load_json, state_path, write_json_atomic
+from sync import (SyncEngine, _execute, build_arg_parser, http_status, ics_event_id, load_id_map,
+                  options_from_args, save_id_map, service_from_args, set_quota_ledger, set_rrule_checker,
+                  split_calendar_ids, sync_event)
+
+RENEW_MARGIN = 3600  # renew channels this many seconds before they expire
+DEBOUNCE_SECONDS = 2.0  # notifications arriving within this window are handled together
+
+def register_channel(service, calendar_id, address, ttl):
+    channel = {"id": str(uuid.uuid4()), "token": secrets.token_urlsafe(24)}
+    response = _execute(service.events().watch(calendarId=calendar_id, body={
+        "id": channel["id"],
+        "type": "web_hook",
+        "address": address,
+        "token": channel["token"],
+        "params": {"ttl": str(int(ttl))},
+    }), "events.watch")
+    channel["resource_id"] = response.get("resourceId")
+    channel["expiration"] = int(response.get("expiration", 0)) / 1000 or time.time() + ttl
+    return channel
+
+def stop_channel(service, channel):
+    try:
+        _execute(service.channels().stop(body={"id": channel["id"], "resourceId": channel["resource_id"]}), "channels.stop")
+    except Exception as ex:
+        if http_status(ex) != 404:
+            print(f"[watch] could not stop channel {channel['id']}: {ex}")
+
+def initial_sync_token(service, calendar_id):
+    """Page through the calendar with a minimal field mask just to obtain a sync token."""
+    page_token = None
+    while True:
+        resp = _execute(service.events().list(calendarId=calendar_id, pageToken=page_token, maxResults=2500,
+                                              fields="nextPageToken,nextSyncToken"), "events.list")
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return resp.get("nextSyncToken")
+
+def changed_events(service, calendar_id, sync_token):
+    """
+    Events changed since sync_token (deleted ones come back with status "cancelled").
+    Returns (events, next_sync_token), or (None, None) if the token expired.
+    """
+    events, page_token = [], None
+    while True:
+        try:
+            resp = _execute(service.events().list(calendarId=calendar_id, syncToken=sync_token,
+                                                  pageToken=page_token, showDeleted=True), "events.list")
+        except Exception as ex:
+            if http_status(ex) == 410:
+                return None, None
+            raise
+        events.extend(resp.get("items", []))
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return events, resp.get("nextSyncToken")
+
+class CalendarWatcher:
+    def __init__(self, service, engine_factory, calendar_ids, address, data_dir, ttl=7 * 86400, dry_run=False,
+                 deterministic_ids=False):
+        self.service = service
+        self.engine_factory = engine_factory
+        self.calendar_ids = list(calendar_ids)
+        self.address = address
+        self.data_dir = data_dir
+        self.ttl = ttl
+        self.dry_run = dry_run
+        self.deterministic_ids = deterministic_ids
+        self.state = {cid: load_json(state_path(data_dir, "watch", cid), {}) or {} for cid in self.calendar_ids}
+        self.pending = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _save(self, calendar_id):
+        with self._lock:
+            snapshot = dict(self.state[calendar_id])
+        write_json_atomic(state_path(self.data_dir, "watch", calendar_id), snapshot)
+
+    def ensure_channels(self):
+        """Register missing channels and replace those close to expiry (new one first, then stop the old)."""
+        for calendar_id in self.calendar_ids:
+            state = self.state[calendar_id]
+            if not state.get("sync_token"):
+                state["sync_token"] = initial_sync_token(self.service, calendar_id)
+            old = state.get("channel")
+            if old and old.get("address") == self.address and old["expiration"] - time.time() > RENEW_MARGIN:
+                continue
+            try:
+                channel = register_channel(self.service, calendar_id, self.address, self.ttl)
+            except Exception as ex:
+                print(f"[watch] failed to register a channel for {calendar_id}: {ex}", file=sys.stderr)
+                continue
+            channel["address"] = self.address
+            with self._lock:
+                state["channel"] = channel
+            print(f"[watch] {calendar_id}: channel {channel['id']} until {time.strftime('%Y-%m-%d %H:%M', time.localtime(channel['expiration']))}")
+            if old:
+                stop_channel(self.service, old)
+            self._save(calendar_id)
+
+    def notify(self, channel_id, token, resource_state):
+        """Called by the HTTP receiver. Returns False for unknown channels or a wrong token."""
+        with self._lock:
+            calendar_id = next((cid for cid, st in self.state.items()
+                                if st.get("channel", {}).get("id") == channel_id), None)
+            expected = self.state[calendar_id]["channel"]["token"] if calendar_id else None
+        if not calendar_id or not secrets.compare_digest(token or "", expected):
+            return False
+        if resource_state != "sync":  # "sync" only confirms a new channel
+            self.pending.put(calendar_id)
+        return True
+
+    def run_forever(self, renew_interval=600):
+        """Handle notified calendars and renew channels, all on one thread (the client is not thread-safe)."""
+        next_renewal = time.monotonic() + renew_interval
+        while True:
+            try:
+                calendars = {self.pending.get(timeout=max(0.0, next_renewal - time.monotonic()))}
+            except queue.Empty:
+                self.ensure_channels()
+                next_renewal = time.monotonic() + renew_interval
+                continue
+            time.sleep(DEBOUNCE_SECONDS)
+            while not self.pending.empty():
+                calendars.add(self.pending.get_nowait())
+            for calendar_id in calendars:
+                try:
+                    self.handle(calendar_id)
+                except Exception as ex:
+                    print(f"[watch] {calendar_id}: {ex}", file=sys.stderr)
+
+    def handle(self, calendar_id):
+        """Read the calendar's changes since the last sync token and repair edited or deleted synced events."""
+        try:
+            with calendar_lock(self.data_dir, calendar_id):
+                needs_full_sync = self._handle_locked(calendar_id)
+        except BlockingIOError:
+            # A sync run is writing this calendar; it will leave it consistent. Look again shortly.
+            threading.Timer(30, self.pending.put, args=(calendar_id,)).start()
+            return
+        if needs_full_sync:
+            # Outside the lock: the engine takes it itself
+            self.engine_factory([calendar_id]).run()
+
+    def _handle_locked(self, calendar_id):
+        """Returns True if the changes could not be read incrementally and a full sync is needed."""
+        state = self.state[calendar_id]
+        events, next_token = changed_events(self.service, calendar_id, state["sync_token"])
+        if events is None:
+            print(f"[watch] {calendar_id}: sync token expired, running a full sync")
+            # Taken before the full sync, so its own writes show up (as no-ops) in the next change set
+            with self._lock:
+                state["sync_token"] = initial_sync_token(self.service, calendar_id)
+            self._save(calendar_id)
+            return True
+        # If the repair fails as a whole (say the feed cannot be downloaded), this raises and
+        # the token stays, so the next notification reads the same changes again. Events
+        # that failed one by one are left to the sync runs: reading them again on every
+        # notification would only fail the same way
+        self._repair(calendar_id, events)
+        with self._lock:
+            state["sync_token"] = next_token
+        self._save(calendar_id)
+        return False
+
+    def _repair(self, calendar_id, events):
+        """Put synced events among the changed ones back to match the feed."""
+        id_map = load_id_map(self.data_dir, calendar_id)
+        uid_by_id = {event_id: uid for uid, event_id in id_map.items()}
+        touched = {}
+        for event in events:
+            # Deleted events come back without extendedProperties; the id map knows their UID
+            uid = event.get("extendedProperties", {}).get("private", {}).get("icsUid") or uid_by_id.get(event.get("id"))
+            if uid:
+                touched[uid] = event
+        if not touched:
+            return
+        engine = self.engine_factory([calendar_id])
+        records, dropped_uids, _ = engine.load_records()
+        feed = {r["uid"]: r for r in records if "error" not in r}
+        feed_size = len({r["uid"] for r in records if r["uid"]} | dropped_uids)
+        if engine.options.dedup:
+            # Events another feed owns are that feed's to repair
+            index = DedupIndex(self.data_dir, calendar_id, engine.options.dedup)
+            feed = {uid: r for uid, r in feed.items() if index.owner(dedup_key(r)) in (None, engine.feed_key)}
+        # Events cancelled in the feed that are still in Google: the deletes this repair would make
+        cancels = {uid for uid, existing in touched.items()
+                   if feed.get(uid, {}).get("status") == "CANCELLED" and existing.get("status") != "cancelled"}
+        if cancels:
+            # Checked against the sync runs' circuit breaker, without adding to its history
+            allowed, reason = engine.deletion_guard(calendar_id).allows(feed_size, len(cancels), len(id_map))
+            if not allowed:
+                print(f"[guard] {calendar_id}: {reason}; leaving {len(cancels)} cancelled events in place",
+                      file=sys.stderr)
+                feed = {uid: r for uid, r in feed.items() if uid not in cancels}
+            elif reason:
+                print(f"[guard] {calendar_id}: {reason}")
+        repaired = 0
+        errors = []
+        forgotten = set()
+        for uid, existing in touched.items():
+            record = feed.get(uid)
+            if record is None:
+                continue  # no longer in the feed: pruning is left to the sync runs
+            if record["status"] == "CANCELLED" and existing.get("status") == "cancelled":
+                # Already deleted in Google, as the feed wants: only the id map needs updating
+                forgotten.add(uid)
+                continue
+            try:
+                action, google_id = sync_event(self.service, calendar_id, record["payload"], record["status"], uid,
+                                               existing=existing, dry_run=self.dry_run, errors=errors,
+                                               event_id=ics_event_id(calendar_id, uid) if self.deterministic_ids else None)
+            except Exception as ex:
+                errors.append((uid, str(ex)))
+                continue
+            if action in ("created", "updated", "deleted"):
+                repaired += 1
+                if action == "deleted":
+                    id_map.pop(uid, None)
+                elif google_id:
+                    id_map[uid] = google_id
+        for uid, message in errors:
+            print(f"[watch] {calendar_id}: could not repair {uid}: {message}", file=sys.stderr)
+        print(f"[watch] {calendar_id}: {len(events)} changes, {len(touched)} synced events, {repaired} repaired, "
+              f"{len(errors)} failed")
+        if (repaired or forgotten) and not self.dry_run:
+            for uid in forgotten:
+                id_map.pop(uid, None)
+            save_id_map(self.data_dir, calendar_id, id_map)
+
+def make_handler(watcher):
+    class NotificationHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            ok = watcher.notify(self.headers.get("X-Goog-Channel-ID"), self.headers.get("X-Goog-Channel-Token"),
+                                self.headers.get("X-Goog-Resource-State"))
+            # Google retries on errors; only unknown channels get one
+            self.send_response(200 if ok else 404)
+            self.end_headers()
+
+        def log_message(self, fmt, *args):
+            pass
+    return NotificationHandler
+
+def main():
+    parser = build_arg_parser()
+    parser.description = "Watch Google calendars for edits to synced events and repair them from the ICS feed."
+    parser.add_argument("--webhook-url", required=True, help="Public HTTPS URL that forwards to the --listen address")
+    parser.add_argument("--listen", default="0.0.0.0:8080", help="host:port for the notification receiver")
+    parser.add_argument("--channel-ttl", type=int, default=7 * 86400, help="Requested channel lifetime in seconds (renewed before expiry)")
+    args = parser.parse_args()
+
+    calendar_ids = split_calendar_ids(args.calendar_id)
+    options = options_from_args(args)
+    service = service_from_args(args)
+    quota = QuotaLedger(args.data_dir, daily_limit=args.daily_quota)
+    rrule_checker = RRuleChecker(args.data_dir)
+    set_quota_ledger(quota)
+    set_rrule_checker(rrule_checker)
+
+    def engine_factory(targets):
+        return SyncEngine(service, args.ics_url, targets, options, quota=quota, rrule_checker=rrule_checker)
+
+    watcher = CalendarWatcher(service, engine_factory, calendar_ids, args.webhook_url, args.data_dir,
+                              ttl=args.channel_ttl, dry_run=args.dry_run, deterministic_ids=args.deterministic_ids)
+    watcher.ensure_channels()
+    host, _, port = args.listen.rpartition(":")
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), make_handler(watcher))
+    threading.Thread(target=watcher.run_forever, daemon=True).start()
+    print(f"[watch] listening on {args.listen} for {', '.join(calendar_ids)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        quota.save()
+        rrule_checker.save()
+
+if __name__ == "__main__":
+    main()
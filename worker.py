@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Run many feed syncs from a shared job queue, on one or more nodes.
+
+Jobs (feed URL, target calendars, extra sync.py flags, interval) live in a SQLite queue
+(see jobqueue.py). Every node runs `worker.py run`: it leases a due job, syncs it with a
+warm SyncEngine, renews the lease while the sync runs, then schedules the next run. If a
+node dies, its job is picked up by another node once the lease expires.
+
+    python worker.py add --job-id team --ics-url URL --calendar-id team@group.calendar.google.com --interval 3600
+    python worker.py list
+    python worker.py run --lease 300
+"""
+import argparse
+import os
+import shlex
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from jobqueue import DEFAULT_QUEUE_PATH, JobQueue
+from quota import QuotaLedger
+from rrules import RRuleChecker
+from statefile import DEFAULT_DATA_DIR
+from sync import (SCOPES, SyncEngine, add_transport_args, build_arg_parser, feed_schedule, options_from_args,
+                  print_result, record_schedule, service_from_args, split_calendar_ids)
+from tokenbroker import credential_broker
+
+# sync.py flags a job cannot use: every job runs on the worker's own client and credentials
+WORKER_FLAGS = ("token", "credentials", "transport", "pool_size", "connect_timeout", "http_timeout")
+
+def job_args(job, data_dir):
+    """
+    A job's sync.py arguments, parsed from its stored flags exactly as sync.py would parse them.
+    Raises ValueError for flags sync.py rejects and for the client flags in WORKER_FLAGS.
+    """
+    argv = ["--ics-url", job["ics_url"], "--calendar-id", *job["calendar_ids"], *shlex.split(job["flags"] or "")]
+    parser = build_arg_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:  # argparse has printed why
+        raise ValueError(f"invalid sync.py flags: {job['flags']}") from None
+    ignored = [name for name in WORKER_FLAGS if getattr(args, name) != parser.get_default(name)]
+    if ignored:
+        flags = ", ".join("--" + name.replace("_", "-") for name in ignored)
+        raise ValueError(f"{flags} cannot be set per job; jobs use the worker's own client (set them on worker.py run)")
+    if not any(a.startswith("--data-dir") for a in argv):
+        args.data_dir = data_dir
+    return args
+
+def run_job(queue, job, node_id, lease_seconds, service, session, quota, rrule_checker, service_factory, data_dir):
+    print(f"[worker] {node_id} running job {job['job_id']} ({job['ics_url']} -> {', '.join(job['calendar_ids'])})")
+    stop = threading.Event()
+    heartbeat = None
+    status = "error"
+    next_run = time.time() + job["interval_seconds"]
+    try:
+        args = job_args(job, data_dir)
+        # The ledger is shared by all jobs on this node; only the per-run counters start over
+        quota.run_budget = args.quota_budget
+        quota.run_calls = 0
+        quota.exhausted_by_api = False
+        engine = SyncEngine(service, job["ics_url"], job["calendar_ids"], options_from_args(args), session=session,
+                            quota=quota, service_factory=service_factory, rrule_checker=rrule_checker)
+
+        def keep_lease():
+            while not stop.wait(lease_seconds / 3):
+                if not queue.heartbeat(job["job_id"], node_id, lease_seconds):
+                    # Another node owns the job now: no more writes, bulk inserts or prunes from this one
+                    print(f"[worker] lease on {job['job_id']} lost, stopping writes")
+                    engine.stop()
+                    return
+
+        heartbeat = threading.Thread(target=keep_lease, daemon=True)
+        heartbeat.start()
+        result = engine.run()
+        status = "ok" if print_result(result, job["calendar_ids"]) else "error"
+        schedule = feed_schedule(args)
+        if schedule and not args.dry_run:
+            # --adaptive in the job's flags: its change history sets the next run instead of the fixed interval
+            next_run = time.time() + record_schedule(schedule, result)
+    except Exception as e:
+        print(f"[worker] job {job['job_id']} failed: {e}", file=sys.stderr)
+    finally:
+        stop.set()
+        if heartbeat:
+            heartbeat.join()
+        quota.save()
+        rrule_checker.save()
+    queue.release(job["job_id"], node_id, status, next_run)
+    print(f"[worker] job {job['job_id']}: {status}, next run {datetime.fromtimestamp(next_run):%Y-%m-%d %H:%M:%S}")
+
+def run_worker(args):
+    queue = JobQueue(args.queue)
+    node_id = args.node_id or f"{socket.gethostname()}-{os.getpid()}"
+    # Kept warm across jobs: one OAuth client, one HTTP session, one ledger and verdict cache
+    service = service_from_args(args)
+    # Keep the shared token fresh between and during jobs, so no job waits on an OAuth refresh
+    credential_broker(args.token, args.credentials, SCOPES).start()
+    service_factory = lambda: service_from_args(args)
+    session = requests.Session()
+    quota = QuotaLedger(args.data_dir, daily_limit=args.daily_quota)
+    rrule_checker = RRuleChecker(args.data_dir)
+    print(f"[worker] {node_id} polling {args.queue}")
+    while True:
+        job = queue.claim(node_id, args.lease)
+        if job is None:
+            if args.once:
+                return
+            time.sleep(args.poll)
+            continue
+        run_job(queue, job, node_id, args.lease, service, session, quota, rrule_checker, service_factory, args.data_dir)
+        print(f"[quota] {quota.summary()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared job queue for syncing many ICS feeds across worker nodes.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="SQLite job queue, on storage every node can reach")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="Add or update a feed job")
+    add.add_argument("--job-id", required=True, help="Unique name for the job")
+    add.add_argument("--ics-url", required=True, help="Public ICS feed URL")
+    add.add_argument("--calendar-id", required=True, nargs="+", help="Target Google Calendar ID(s)")
+    add.add_argument("--interval", type=int, default=6 * 3600, help="Seconds between runs of this job")
+    add.add_argument("--flags", default="", help="Extra sync.py flags for this job, e.g. \"--prune-missing --future-only\"")
+
+    remove = sub.add_parser("remove", help="Remove a feed job")
+    remove.add_argument("--job-id", required=True)
+
+    sub.add_parser("list", help="Show jobs, their schedule and current leases")
+
+    run = sub.add_parser("run", help="Claim and run due jobs until stopped")
+    run.add_argument("--node-id", default=None, help="Name of this node in leases (default: hostname-pid)")
+    run.add_argument("--lease", type=int, default=300, help="Lease length in seconds; renewed every third of it while a job runs")
+    run.add_argument("--poll", type=float, default=30.0, help="Seconds to wait when no job is due")
+    run.add_argument("--once", action="store_true", help="Exit when no job is due instead of polling")
+    run.add_argument("--credentials", default="credentials.json", help="Google OAuth client secrets file")
+    run.add_argument("--token", default="token.json", help="Cached OAuth token file")
+    add_transport_args(run)
+    run.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory for persistent state (quota ledger, checkpoints)")
+    run.add_argument("--daily-quota", type=int, default=None, help="Project-wide API calls allowed per rolling 24h")
+
+    args = parser.parse_args()
+    queue = JobQueue(args.queue)
+
+    if args.command == "add":
+        calendar_ids = split_calendar_ids(args.calendar_id)
+        # Fail now on bad flags rather than on every worker later
+        try:
+            job_args({"ics_url": args.ics_url, "calendar_ids": calendar_ids, "flags": args.flags}, DEFAULT_DATA_DIR)
+        except ValueError as ex:
+            parser.error(str(ex))
+        queue.add(args.job_id, args.ics_url, calendar_ids, args.flags, args.interval)
+        print(f"Added job {args.job_id}")
+    elif args.command == "remove":
+        print(f"Removed job {args.job_id}" if queue.remove(args.job_id) else f"No job {args.job_id}")
+    elif args.command == "list":
+        now = time.time()
+        for job in queue.jobs():
+            lease = f"leased by {job['lease_owner']} ({job['lease_expires'] - now:.0f}s left)" if job["lease_owner"] else "free"
+            due = "due" if job["next_run"] <= now else f"in {job['next_run'] - now:.0f}s"
+            print(f"{job['job_id']}: {job['ics_url']} -> {job['calendar_ids']} every {job['interval_seconds']}s, "
+                  f"{due}, {lease}, last={job['last_status'] or '-'}, runs={job['runs']}")
+    else:
+        run_worker(args)
+
+if __name__ == "__main__":
+    main()